@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Benchmark reduced-resolution evaluation payloads on recorded sessions.
+
+Re-evaluates saved iteration images (sessions run with --save-all) twice,
+once as full-size PNG and once with the reduced payload settings. It reports
+bytes and latency saved and how far the scores drift. With --bytes-only no
+API calls are made and only payload sizes are compared.
+
+Usage:
+    python scripts/benchmark-evaluation-payload.py ./outputs --max-size 768 --format jpeg
+    python scripts/benchmark-evaluation-payload.py ./outputs --bytes-only
+    python scripts/benchmark-evaluation-payload.py ./outputs --limit 20 --json bench.json
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from PIL import Image
+
+from banana_straightener import Config
+from banana_straightener.budget import iter_session_reports
+from banana_straightener.preprocess import PAYLOAD_FORMATS, EvaluationEncoder
+
+
+def recorded_samples(output_dir, limit=0):
+    """(image path, prompt, recorded confidence) for saved, accepted iterations."""
+    samples = []
+    for report in iter_session_reports(output_dir):
+        for entry in report.get("history", []):
+            path = entry.get("image_path")
+            if not path or entry.get("rejected") or not Path(path).exists():
+                continue
+            confidence = (entry.get("evaluation") or {}).get("confidence")
+            samples.append((Path(path), report.get("original_prompt", ""), confidence))
+            if limit and len(samples) >= limit:
+                return samples
+    return samples
+
+
+def timed_evaluation(model, image, prompt):
+    start = time.perf_counter()
+    evaluation = model.evaluate_image(image, prompt)
+    return evaluation, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark reduced evaluation payloads")
+    parser.add_argument("output_dir", help="Directory holding recorded sessions")
+    parser.add_argument("--max-size", type=int, default=768, help="Longest edge of the reduced payload")
+    parser.add_argument("--format", choices=list(PAYLOAD_FORMATS), default="jpeg", help="Reduced payload format")
+    parser.add_argument("--quality", type=int, default=85, help="Quality for jpeg/webp")
+    parser.add_argument("--limit", type=int, default=0, help="Evaluate at most this many images (0 = all)")
+    parser.add_argument("--bytes-only", action="store_true", help="Only compare payload sizes (no API calls)")
+    parser.add_argument("--json", dest="json_path", help="Also write the summary to this file")
+    args = parser.parse_args()
+
+    samples = recorded_samples(args.output_dir, args.limit)
+    if not samples:
+        print(f"No saved iteration images found under {args.output_dir} (run sessions with --save-all)")
+        sys.exit(1)
+
+    full = EvaluationEncoder()
+    reduced = EvaluationEncoder(max_size=args.max_size, fmt=args.format, quality=args.quality)
+    models = None
+    if not args.bytes_only:
+        from banana_straightener.models import GeminiModel
+
+        config = Config.from_env()
+        if not config.api_key:
+            print("GEMINI_API_KEY is required unless --bytes-only is given")
+            sys.exit(1)
+        models = [
+            GeminiModel(config.api_key, config.evaluator_model, evaluation_encoder=encoder,
+                        structured_evaluation=config.structured_evaluation)
+            for encoder in (full, reduced)
+        ]
+
+    rows = []
+    for number, (path, prompt, recorded) in enumerate(samples, 1):
+        with Image.open(path) as img:
+            image = img.convert("RGB")
+        row = {
+            "image": str(path),
+            "recorded_confidence": recorded,
+            "full_bytes": len(full.encode(image)[0]),
+            "reduced_bytes": len(reduced.encode(image)[0]),
+        }
+        if models:
+            (full_eval, full_seconds), (reduced_eval, reduced_seconds) = (
+                timed_evaluation(model, image, prompt) for model in models
+            )
+            row.update({
+                "full_confidence": full_eval["confidence"],
+                "reduced_confidence": reduced_eval["confidence"],
+                "verdict_changed": full_eval["matches_intent"] != reduced_eval["matches_intent"],
+                "full_seconds": round(full_seconds, 3),
+                "reduced_seconds": round(reduced_seconds, 3),
+            })
+        rows.append(row)
+        print(f"[{number}/{len(samples)}] {path.name}: {row['full_bytes']} -> {row['reduced_bytes']} bytes")
+
+    full_bytes = sum(r["full_bytes"] for r in rows)
+    reduced_bytes = sum(r["reduced_bytes"] for r in rows)
+    summary = {
+        "images": len(rows),
+        "settings": {"max_size": args.max_size, "format": args.format, "quality": args.quality},
+        "full_bytes": full_bytes,
+        "reduced_bytes": reduced_bytes,
+        "bytes_saved_ratio": round(1 - reduced_bytes / full_bytes, 4) if full_bytes else None,
+    }
+    if models:
+        drift = [abs(r["full_confidence"] - r["reduced_confidence"]) for r in rows]
+        summary.update({
+            "mean_confidence_drift": round(statistics.mean(drift), 4),
+            "max_confidence_drift": round(max(drift), 4),
+            "verdict_changes": sum(r["verdict_changed"] for r in rows),
+            "mean_full_seconds": round(statistics.mean(r["full_seconds"] for r in rows), 3),
+            "mean_reduced_seconds": round(statistics.mean(r["reduced_seconds"] for r in rows), 3),
+        })
+        recorded = [r for r in rows if r["recorded_confidence"] is not None]
+        if recorded:
+            summary["mean_drift_from_recorded"] = round(statistics.mean(
+                abs(r["reduced_confidence"] - r["recorded_confidence"]) for r in recorded
+            ), 4)
+
+    print(json.dumps(summary, indent=2))
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary, "images": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,27 @@
 """Banana Straightener - Self-correcting image generation using Gemini."""
 
-from .agent import BananaStraightener
-from .config import Config
-from .utils import load_image, save_image
-
 __version__ = "0.2.1"
 __all__ = ["BananaStraightener", "Config", "load_image", "save_image"]
+
+# Public names resolve lazily so `import banana_straightener` (and the CLI's
+# --help/--version) does not pay for the agent, models and their dependencies.
+_LAZY_ATTRS = {
+    "BananaStraightener": ".agent",
+    "Config": ".config",
+    "load_image": ".utils",
+    "save_image": ".utils",
+}
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRS:
+        import importlib
+
+        value = getattr(importlib.import_module(_LAZY_ATTRS[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY_ATTRS))
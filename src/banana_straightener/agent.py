@@ -1,32 +1,60 @@
 """Core agent for iterative image improvement."""
 
-from typing import Optional, Dict, Any, Generator, Callable, List
+from typing import Optional, Dict, Any, Generator, Callable, List, Tuple
 from pathlib import Path
 from datetime import datetime
 import json
 import logging
+import time
+from collections import Counter
 from PIL import Image
 
-from .models import GeminiModel
+from .models import SELF_CRITIQUE_TEMPLATE, BaseModel, GeminiModel
+from .metrics import Metrics
+from .preprocess import EvaluationEncoder, ImagePreprocessor
+from .keypool import KeyPool
+from .hedging import RequestHedger
+from .filerefs import FileRefStore
+from .budget import IterationBudget
+from .beam import BeamSearch
+from .cascade import CascadeEvaluator
+from .routing import GeneratorRouter, model_usage
 from .config import Config
+from .sessionlog import SessionLog, SESSION_LOG_FILENAME, build_report
+from .retention import ImageRetention
 from .utils import (
     save_image, 
     create_iteration_report, 
     enhance_prompt_with_feedback,
+    estimate_tokens,
+    prompt_char_budget,
+    perceptual_hash,
+    hash_distance,
+    precheck_image,
+    summarize_rejections,
+    REJECTION_FEEDBACK,
     create_session_summary,
     sanitize_filename,
     validate_image,
-    resize_image_if_needed
 )
 
 logger = logging.getLogger(__name__)
 
+# Bump when fields are removed or change meaning in events passed to on_event
+EVENT_SCHEMA_VERSION = 1
+
 
 class BananaStraightener:
     """Self-correcting image generation agent."""
     
-    def __init__(self, config: Optional[Config] = None):
-        """Initialize the Banana Straightener agent."""
+    def __init__(self, config: Optional[Config] = None, session_id: Optional[str] = None):
+        """Initialize the Banana Straightener agent.
+
+        Args:
+            config: Configuration (defaults to ``Config.from_env()``)
+            session_id: Optional explicit session id; defaults to a timestamp.
+                Pass one when several agents may start within the same second.
+        """
         self.config = config or Config.from_env()
         
         if not self.config.api_key:
@@ -35,27 +63,65 @@ class BananaStraightener:
                 "or pass it in the configuration."
             )
         
-        self.generator = GeminiModel(
-            api_key=self.config.api_key,
-            model_name=self.config.generator_model
-        )
+        self.metrics = Metrics()
+        self.preprocessor = ImagePreprocessor.for_config(self.config)
+        self.key_pool = KeyPool.for_config(self.config) if len(self.config.api_keys) > 1 else None
+        self.hedger = RequestHedger.for_config(self.config) if self.config.hedge_evaluations else None
+        self.file_store: Optional[FileRefStore] = None
+        if self.config.file_refs:
+            if self.key_pool is None:
+                self.file_store = FileRefStore.for_config(self.config)
+            else:
+                # Uploads only work with the key that made them
+                logger.warning("File references are not used with an API key pool")
+        self.generator = self._create_model(self.config.generator_model)
         
         if self.config.evaluator_model == self.config.generator_model:
             self.evaluator = self.generator
         else:
-            self.evaluator = GeminiModel(
-                api_key=self.config.api_key,
-                model_name=self.config.evaluator_model
+            self.evaluator = self._create_model(self.config.evaluator_model)
+        
+        self.router: Optional[GeneratorRouter] = None
+        self.draft_generator = None
+        if self.config.generator_routing:
+            self.router = GeneratorRouter(
+                switch_confidence=self.config.routing_switch_confidence,
+                max_draft_iterations=self.config.routing_max_draft_iterations,
             )
+            self.draft_generator = self._create_model(self.config.draft_generator_model)
         
-        self.session_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.cascade: Optional[CascadeEvaluator] = None
+        if self.config.evaluator_cascade:
+            self.cascade = CascadeEvaluator(
+                self._create_model(self.config.cascade_fast_model),
+                self.evaluator,
+                threshold=self.config.success_threshold,
+                margin=self.config.cascade_margin,
+                metrics=self.metrics,
+            )
+            self.evaluator = self.cascade
+        
+        self.session_id = session_id or datetime.now().strftime("%Y%m%d_%H%M%S")
         self.session_dir = self.config.output_dir / self.session_id
         self.session_start_time = datetime.now()
         self.session_input_image = None  # Store input image for comparison
+        self._session_log: Optional[SessionLog] = None
         
         if self.config.save_intermediates:
             self.session_dir.mkdir(parents=True, exist_ok=True)
     
+    def _create_model(self, model_name: str) -> GeminiModel:
+        return GeminiModel(
+            api_key=self.config.api_key,
+            model_name=model_name,
+            metrics=self.metrics,
+            structured_evaluation=self.config.structured_evaluation,
+            key_pool=self.key_pool,
+            hedger=self.hedger,
+            evaluation_encoder=EvaluationEncoder.for_config(self.config),
+            file_store=self.file_store,
+        )
+    
     def straighten(
         self,
         prompt: str,
@@ -63,7 +129,8 @@ class BananaStraightener:
         input_images: Optional[List[Image.Image]] = None,
         max_iterations: Optional[int] = None,
         success_threshold: Optional[float] = None,
-        callback: Optional[Callable] = None
+        callback: Optional[Callable] = None,
+        on_event: Optional[Callable[[str, Dict[str, Any]], None]] = None,
     ) -> Dict[str, Any]:
         """
         Iteratively improve image generation until it matches the prompt.
@@ -75,12 +142,24 @@ class BananaStraightener:
             max_iterations: Maximum number of iterations (default from config)
             success_threshold: Confidence threshold for success (default from config)
             callback: Optional callback function called after each iteration
+            on_event: Optional callback receiving ``(event_name, data)`` for each
+                phase: start, generated, saved, evaluated, error and finished
+        
+        With ``Config.beam_width`` above 1 the session runs as a beam search
+        (see ``straighten_beam``); callbacks are not called in that mode.
         
         Returns:
             Dictionary containing results and metadata
         """
-        max_iterations = max_iterations or self.config.default_max_iterations
+        if self.config.beam_width > 1:
+            imgs = list(input_images or []) + ([input_image] if input_image is not None else [])
+            return self.straighten_beam(prompt, imgs, max_iterations, success_threshold)
+        
+        budget = self._budget_suggestion(prompt, bool(input_images or input_image))
+        max_iterations = self._budget_max_iterations(max_iterations, budget)
         success_threshold = success_threshold or self.config.success_threshold
+        emit = self._event_emitter(on_event)
+        run_start = time.perf_counter()
         
         # Store input image for comparison in UI
         # Normalize input images
@@ -96,80 +175,138 @@ class BananaStraightener:
         current_image = imgs[0] if imgs else None
         current_prompt = prompt
 
-        # Validate and resize input image if provided
+        # Orient and resize all valid input images (in parallel)
+        input_images_resized = self.preprocessor.prepare_many([im for im in imgs if validate_image(im)])
         if current_image and not validate_image(current_image):
             logger.warning("Invalid input image provided, starting from scratch")
             current_image = None
         elif current_image:
-            current_image = resize_image_if_needed(current_image)
-        # Resize all provided images
-        input_images_resized: List[Image.Image] = []
-        if imgs:
-            for im in imgs:
-                if validate_image(im):
-                    input_images_resized.append(resize_image_if_needed(im))
+            current_image = input_images_resized[0]
+
+        self._session_log = SessionLog(self.session_dir / SESSION_LOG_FILENAME)
+        self._session_log.append('start', {
+            'session_id': self.session_id,
+            'timestamp': self.session_start_time.isoformat(),
+            'original_prompt': prompt,
+            'config': {
+                'generator_model': self.config.generator_model,
+                'evaluator_model': self.config.evaluator_model,
+                'success_threshold': success_threshold,
+                'max_iterations': max_iterations,
+            },
+            'input_images': len(input_images_resized),
+            'budget': budget,
+        })
 
+        emit('start', {
+            'prompt': prompt,
+            'max_iterations': max_iterations,
+            'success_threshold': success_threshold,
+            'input_images': len(input_images_resized),
+        })
+
+        iterations_run = 0
+        candidates: List[Tuple[float, int, Image.Image]] = []
         for iteration in range(1, max_iterations + 1):
             logger.info("🍌 Iteration %s/%s", iteration, max_iterations)
+            iterations_run = iteration
             
             try:
+                generation_start = time.perf_counter()
+                previous_image = current_image
                 # Generate or improve image
+                routing, generator = self._route_generator(history)
                 if iteration == 1 and not imgs:
                     logger.info("📝 Generating initial image...")
-                    current_image = self.generator.generate_image(prompt)
+                    current_image, check, rejections, self_evaluation = self._generate_checked(
+                        prompt, target_prompt=prompt, generator=generator
+                    )
                 else:
                     if history:
+                        # Checked on its own: an unchanged image may come with no feedback at all
+                        stuck = self._is_stuck(history)
                         feedback = history[-1]['evaluation']['improvements']
-                        if feedback and feedback.lower() not in ['none', 'n/a', 'none needed!']:
+                        if stuck or (feedback and feedback.lower() not in ['none', 'n/a', 'none needed!']):
                             current_prompt = enhance_prompt_with_feedback(
                                 original_prompt=prompt,
                                 feedback=feedback,
                                 iteration=iteration,
-                                previous_history=history
+                                previous_history=history,
+                                max_chars=self._prompt_budget(),
+                                force_alternative=stuck,
                             )
                             logger.info("📝 Enhanced prompt based on feedback")
                     
                     logger.info("🎨 Generating improved image...")
                     if iteration == 1 and input_images_resized:
-                        current_image = self.generator.generate_image(
-                            current_prompt,
-                            base_images=input_images_resized,
-                        )
+                        base_images = input_images_resized
                     else:
-                        current_image = self.generator.generate_image(
-                            current_prompt,
-                            base_images=[current_image] if current_image else None,
-                        )
+                        base_images = [current_image] if current_image else None
+                    current_image, check, rejections, self_evaluation = self._generate_checked(
+                        current_prompt, base_images, target_prompt=prompt, generator=generator
+                    )
+                
+                generation_seconds = time.perf_counter() - generation_start
+                rejected = check is not None and not check['passed']
                 
                 if not validate_image(current_image):
                     logger.error("Failed to generate valid image for iteration %s", iteration)
+                    emit('error', {'iteration': iteration, 'message': 'Generated image is invalid'})
                     continue
+                image_hash = perceptual_hash(current_image)
+                unchanged_streak = self._unchanged_streak(history, image_hash, rejected)
+                emit('generated', {
+                    'iteration': iteration,
+                    'width': current_image.size[0],
+                    'height': current_image.size[1],
+                    'generation_seconds': round(generation_seconds, 3),
+                })
                 
                 # Save intermediate image if configured
                 image_path = None
-                if self.config.save_intermediates:
+                if self.config.save_intermediates and not rejected:
                     image_filename = f"iteration_{iteration:02d}.png"
                     image_path = self.session_dir / image_filename
                     save_image(current_image, image_path)
                     logger.info("💾 Saved to %s", image_path.name)
+                    emit('saved', {'iteration': iteration, 'kind': 'intermediate', 'path': str(image_path)})
                 
-                # Evaluate the generated image
-                logger.info("🔍 Evaluating image...")
-                evaluation = self.evaluator.evaluate_image(
-                    current_image,
-                    prompt,
-                    prompt_template=self.config.evaluation_prompt_template,
+                # Evaluate the generated image (rejected images skip the API call)
+                evaluation_start = time.perf_counter()
+                evaluation, evaluation_source = self._evaluate_generated(
+                    current_image, prompt, check, self_evaluation, success_threshold
                 )
+                evaluation_seconds = time.perf_counter() - evaluation_start
+                timings = {
+                    'generation_seconds': round(generation_seconds, 3),
+                    'evaluation_seconds': round(evaluation_seconds, 3),
+                }
                 
                 # Create iteration record
                 iteration_data = {
                     'iteration': iteration,
                     'prompt_used': current_prompt,
+                    'prompt_size': self._prompt_size(current_prompt),
                     'evaluation': evaluation,
+                    'evaluation_source': evaluation_source,
+                    **routing,
+                    'image_hash': image_hash,
+                    'unchanged_streak': unchanged_streak,
+                    'rejected': rejected,
+                    'rejections': rejections,
                     'image_path': str(image_path) if image_path else None,
+                    'timings': timings,
                     'timestamp': datetime.now().isoformat()
                 }
                 history.append(iteration_data)
+                self._session_log.append('iteration', iteration_data)
+                emit('evaluated', {
+                    'iteration': iteration,
+                    'matches_intent': evaluation['matches_intent'],
+                    'confidence': evaluation['confidence'],
+                    'improvements': evaluation.get('improvements', ''),
+                    'timings': timings,
+                })
                 
                 # Call callback if provided
                 if callback:
@@ -178,6 +315,14 @@ class BananaStraightener:
                     except Exception as e:
                         logger.warning("Callback error: %s", e)
                 
+                if rejected:
+                    # Keep building on the last image that passed the checks
+                    current_image = previous_image
+                    continue
+                
+                if self.config.compare_best_attempts:
+                    self._track_candidate(candidates, iteration, current_image, evaluation['confidence'])
+                
                 # Display evaluation results
                 match_status = "✅ YES" if evaluation['matches_intent'] else "❌ NO"
                 logger.info("🎯 Match: %s", match_status)
@@ -194,6 +339,7 @@ class BananaStraightener:
                     final_filename = f"final_image_{sanitize_filename(prompt[:30])}.png"
                     final_path = self.session_dir / final_filename
                     save_image(current_image, final_path)
+                    emit('saved', {'iteration': iteration, 'kind': 'final', 'path': str(final_path)})
                     
                     result = {
                         'success': True,
@@ -209,11 +355,18 @@ class BananaStraightener:
                     # Save session report
                     self._save_session_report(result, prompt)
                     logger.info(create_session_summary(prompt, result, self.session_start_time))
+                    emit('finished', self._finished_event(result, run_start))
                     
                     return result
+                
+                if self._should_stop_unchanged(unchanged_streak):
+                    break
+                if self._below_budget_floor(budget, iteration, evaluation['confidence']):
+                    break
                     
             except Exception as e:
                 logger.error("Error in iteration %s: %s", iteration, e)
+                emit('error', {'iteration': iteration, 'message': str(e)})
                 continue
         
         # Max iterations reached without success
@@ -226,17 +379,27 @@ class BananaStraightener:
         else:
             best_confidence = 0.0
         
+        selection = None
+        if self.config.compare_best_attempts and candidates:
+            current_image, selection = self._pick_best_attempt(candidates, prompt)
+        
         # Save final image
         final_filename = f"best_attempt_{sanitize_filename(prompt[:30])}.png"
         final_path = self.session_dir / final_filename
         if current_image and validate_image(current_image):
             save_image(current_image, final_path)
+            emit('saved', {
+                'iteration': selection['chosen_iteration'] if selection else len(history),
+                'kind': 'best_attempt',
+                'path': str(final_path),
+            })
         
         result = {
             'success': False,
             'final_image': current_image,
             'final_image_path': str(final_path) if current_image else None,
-            'iterations': max_iterations,
+            'best_attempt_selection': selection,
+            'iterations': iterations_run,
             'history': history,
             'session_dir': str(self.session_dir),
             'best_confidence': best_confidence,
@@ -247,9 +410,281 @@ class BananaStraightener:
         # Save session report
         self._save_session_report(result, prompt)
         logger.info(create_session_summary(prompt, result, self.session_start_time))
+        emit('finished', self._finished_event(result, run_start))
         
         return result
     
+    def straighten_beam(
+        self,
+        prompt: str,
+        input_images: Optional[List[Image.Image]] = None,
+        max_rounds: Optional[int] = None,
+        success_threshold: Optional[float] = None,
+        beam_width: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """
+        Beam search over prompt refinements instead of the greedy loop.
+        
+        Keeps the ``beam_width`` best (image, prompt) states per round and
+        expands each into ``Config.beam_expansion`` refined prompts, generated
+        and evaluated ``Config.beam_concurrency`` at a time. The result has the
+        same keys as ``straighten`` plus ``beam`` (call counts against the
+        greedy baseline) and ``best_path``; ``iterations`` counts rounds.
+        """
+        search = BeamSearch(
+            self,
+            beam_width=beam_width or self.config.beam_width,
+            expansion_factor=self.config.beam_expansion,
+            concurrency=self.config.beam_concurrency,
+        )
+        return search.run(prompt, input_images, max_rounds, success_threshold)
+    
+    def _prompt_budget(self) -> Optional[int]:
+        """Character budget for feedback-enhanced prompts (None = unlimited)."""
+        return prompt_char_budget(self.config.prompt_max_tokens, self.config.prompt_max_chars)
+    
+    @staticmethod
+    def _prompt_size(prompt: str) -> Dict[str, int]:
+        return {'chars': len(prompt), 'tokens': estimate_tokens(prompt)}
+    
+    def _unchanged_streak(self, history: List[Dict[str, Any]], image_hash: str, rejected: bool = False) -> int:
+        """Consecutive evaluated iterations (ending with this one) whose image barely changed.
+        
+        Images rejected by the local checks never reach the evaluator, so they
+        neither extend nor reset the streak: they carry the value of the last
+        evaluated image, and later images are compared with that image.
+        """
+        previous = next((entry for entry in reversed(history) if not entry.get('rejected')), None)
+        if previous is None:
+            return 0
+        if rejected:
+            return previous.get('unchanged_streak', 0)
+        previous_hash = previous.get('image_hash')
+        if not previous_hash or hash_distance(previous_hash, image_hash) > self.config.unchanged_hash_distance:
+            return 0
+        return previous.get('unchanged_streak', 0) + 1
+    
+    def _is_stuck(self, history: List[Dict[str, Any]]) -> bool:
+        """True when the generator keeps returning the same image."""
+        limit = self.config.unchanged_streak_limit
+        stuck = bool(history) and limit > 0 and history[-1].get('unchanged_streak', 0) >= limit
+        if stuck:
+            logger.info("🔁 Image unchanged for %s iteration(s), trying an alternative approach",
+                        history[-1]['unchanged_streak'])
+        return stuck
+    
+    def _generate_checked(
+        self,
+        prompt: str,
+        base_images: Optional[List[Image.Image]] = None,
+        target_prompt: Optional[str] = None,
+        generator: Optional[BaseModel] = None,
+    ) -> Tuple[Image.Image, Optional[Dict[str, Any]], List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """
+        Generate an image and run the local pre-evaluation checks on it.
+        
+        Images that fail are regenerated right away, up to
+        ``precheck_retries`` times, without paying for an evaluation. With
+        ``Config.self_critique`` the generator also critiques its image against
+        ``target_prompt`` in the same request.
+        ``generator`` overrides ``self.generator`` (see ``_route_generator``).
+        Returns the last image, its check result (None when checks are off or
+        the image is invalid), the list of rejections and the self-evaluation
+        (None when not requested or not provided).
+        """
+        generator = generator or self.generator
+        base_image = base_images[0] if base_images else None
+        attempts = 1 + max(0, self.config.precheck_retries) if self.config.precheck_enabled else 1
+        rejections: List[Dict[str, Any]] = []
+        check = None
+        for _ in range(attempts):
+            self_evaluation = None
+            if self.config.self_critique and target_prompt:
+                image, self_evaluation = generator.generate_and_evaluate(
+                    prompt,
+                    target_prompt,
+                    base_images=base_images,
+                    prompt_template=SELF_CRITIQUE_TEMPLATE,
+                )
+            elif base_images:
+                image = generator.generate_image(prompt, base_images=base_images)
+            else:
+                image = generator.generate_image(prompt)
+            if not self.config.precheck_enabled or not validate_image(image):
+                return image, None, rejections, self_evaluation
+            check = precheck_image(
+                image,
+                base_image,
+                min_size=self.config.precheck_min_size,
+                min_stddev=self.config.precheck_min_stddev,
+                min_entropy=self.config.precheck_min_entropy,
+                min_base_diff=self.config.precheck_min_base_diff,
+            )
+            if check['passed']:
+                break
+            rejections.append({'reason': check['reason'], 'stats': check['stats']})
+            logger.warning("🚫 Pre-check rejected image (%s)", check['reason'])
+        return image, check, rejections, self_evaluation
+    
+    def _route_generator(self, history: List[Dict[str, Any]]) -> Tuple[Dict[str, str], BaseModel]:
+        """Generator for the next iteration plus the history fields naming it."""
+        if self.router is not None and self.router.use_draft(history):
+            model_name, tier, generator = self.config.draft_generator_model, 'draft', self.draft_generator
+        else:
+            model_name, tier, generator = self.config.generator_model, 'main', self.generator
+        if self.router is not None and history and history[-1].get('generator_tier') != tier:
+            logger.info("🔀 Switching generator to %s", model_name)
+        return {'generator_model': model_name, 'generator_tier': tier}, generator
+    
+    def _evaluate_generated(
+        self,
+        image: Image.Image,
+        prompt: str,
+        check: Optional[Dict[str, Any]],
+        self_evaluation: Optional[Dict[str, Any]],
+        success_threshold: float,
+    ) -> Tuple[Dict[str, Any], str]:
+        """
+        Pick the cheapest trustworthy evaluation for a generated image.
+        
+        Returns the evaluation and its source: ``precheck`` (synthetic, for
+        rejected images), ``self`` (the generator's own critique, trusted when
+        its confidence is more than ``self_critique_margin`` away from the
+        threshold) or ``evaluator`` (a separate evaluate_image call).
+        """
+        if check is not None and not check['passed']:
+            return self._rejected_evaluation(check['reason']), 'precheck'
+        if self_evaluation is not None:
+            if abs(self_evaluation['confidence'] - success_threshold) > self.config.self_critique_margin:
+                logger.info("🪞 Using self-evaluation (confidence %.2f)", self_evaluation['confidence'])
+                return self_evaluation, 'self'
+            logger.info("🪞 Self-evaluation near threshold, verifying with evaluator")
+        logger.info("🔍 Evaluating image...")
+        kwargs = {}
+        if self.cascade is not None and self.evaluator is self.cascade:
+            kwargs['success_threshold'] = success_threshold
+        evaluation = self.evaluator.evaluate_image(
+            image,
+            prompt,
+            prompt_template=self.config.evaluation_prompt_template,
+            **kwargs,
+        )
+        return evaluation, 'evaluator'
+    
+    @staticmethod
+    def _rejected_evaluation(reason: str) -> Dict[str, Any]:
+        """Synthetic evaluation for an image rejected by the local checks."""
+        improvements = REJECTION_FEEDBACK.get(reason, "The image was unusable; generate it again.")
+        return {
+            'matches_intent': False,
+            'confidence': 0.0,
+            'correct_elements': '',
+            'missing_elements': improvements,
+            'improvements': improvements,
+            'raw_feedback': f"PRECHECK: rejected ({reason})",
+            'rejected': True,
+            'rejection_reason': reason,
+        }
+    
+    def _track_candidate(
+        self,
+        candidates: List[Tuple[float, int, Image.Image]],
+        iteration: int,
+        image: Image.Image,
+        confidence: float,
+    ) -> None:
+        """Keep the ``best_attempt_candidates`` highest-confidence images."""
+        candidates.append((confidence, iteration, image))
+        candidates.sort(key=lambda c: (-c[0], c[1]))
+        del candidates[max(1, self.config.best_attempt_candidates):]
+    
+    def _pick_best_attempt(
+        self,
+        candidates: List[Tuple[float, int, Image.Image]],
+        prompt: str,
+    ) -> Tuple[Image.Image, Dict[str, Any]]:
+        """Choose the best attempt by comparing the candidates in one evaluator call."""
+        iterations = [iteration for _, iteration, _ in candidates]
+        if len(candidates) == 1:
+            return candidates[0][2], {'candidates': iterations, 'ranking': iterations, 'chosen_iteration': iterations[0]}
+        
+        logger.info("⚖️ Comparing %d candidate images to pick the best attempt", len(candidates))
+        comparison = self.evaluator.evaluate_images([image for _, _, image in candidates], prompt)
+        best = comparison['best_index']
+        selection = {
+            'candidates': iterations,
+            'ranking': [iterations[i] for i in comparison['ranking']],
+            'chosen_iteration': iterations[best],
+            'confidence': comparison['evaluations'][best]['confidence'],
+        }
+        return candidates[best][2], selection
+    
+    def _should_stop_unchanged(self, unchanged_streak: int) -> bool:
+        limit = self.config.unchanged_stop_streak
+        if limit > 0 and unchanged_streak >= limit:
+            logger.warning("🛑 Image unchanged for %s iteration(s), stopping early", unchanged_streak)
+            return True
+        return False
+    
+    def _budget_suggestion(self, prompt: str, has_images: bool) -> Optional[Dict[str, Any]]:
+        """Learned iteration budget for this prompt (None when disabled or unknown)."""
+        if self.config.adaptive_budget == 'off':
+            return None
+        try:
+            suggestion = IterationBudget.for_config(self.config).suggest(prompt, has_images)
+        except Exception as e:
+            logger.warning("Failed to read iteration budget: %s", e)
+            return None
+        if suggestion:
+            logger.info(
+                "📈 Suggested budget: %s iteration(s) (%s past sessions, %.0f%% success)",
+                suggestion['max_iterations'], suggestion['sessions'], suggestion['success_rate'] * 100,
+            )
+        return suggestion
+    
+    def _budget_max_iterations(self, max_iterations: Optional[int], budget: Optional[Dict[str, Any]]) -> int:
+        """Explicit limit, else the learned budget in auto mode, else the config default."""
+        if max_iterations:
+            return max_iterations
+        if budget and self.config.adaptive_budget == 'auto':
+            return budget['max_iterations']
+        return self.config.default_max_iterations
+    
+    def _below_budget_floor(self, budget: Optional[Dict[str, Any]], iteration: int, confidence: float) -> bool:
+        """In auto mode, stop when past successes almost never had confidence this low here."""
+        if not budget or self.config.adaptive_budget != 'auto':
+            return False
+        floor = budget['stop_below'].get(iteration)
+        if floor is not None and confidence < floor:
+            logger.warning(
+                "🛑 Confidence %.2f is below the learned floor %.2f for iteration %s, stopping early",
+                confidence, floor, iteration,
+            )
+            return True
+        return False
+    
+    @staticmethod
+    def _event_emitter(on_event: Optional[Callable[[str, Dict[str, Any]], None]]) -> Callable[[str, Dict[str, Any]], None]:
+        """Wrap an on_event callback so listener errors never break a session."""
+        def emit(name: str, data: Dict[str, Any]) -> None:
+            if not on_event:
+                return
+            try:
+                on_event(name, data)
+            except Exception as e:
+                logger.warning("Event callback error: %s", e)
+        return emit
+    
+    def _finished_event(self, result: Dict[str, Any], run_start: float) -> Dict[str, Any]:
+        return {
+            'success': result['success'],
+            'iterations': result['iterations'],
+            'confidence': result.get('confidence', result.get('best_confidence', 0.0)),
+            'final_image_path': result.get('final_image_path'),
+            'session_dir': result['session_dir'],
+            'elapsed_seconds': round(time.perf_counter() - run_start, 3),
+        }
+    
     def straighten_iterative(
         self,
         prompt: str,
@@ -261,9 +696,20 @@ class BananaStraightener:
         """
         Generator version that yields results after each iteration.
         Useful for real-time UI updates.
+        
+        Each yielded dict carries the new ``current_image`` plus an ``image_ref``
+        handle. Only the best and latest images stay in memory; older ones are
+        spilled to ``<session_dir>/history`` (see ``Config.history_retention``),
+        and ``memory`` reports retained and peak image bytes for the session.
         """
-        max_iterations = max_iterations or self.config.default_max_iterations
+        budget = self._budget_suggestion(prompt, bool(input_images or input_image))
+        max_iterations = self._budget_max_iterations(max_iterations, budget)
         success_threshold = success_threshold or self.config.success_threshold
+        retention = ImageRetention(
+            self.session_dir / "history",
+            keep_all=self.config.history_retention == "all",
+            thumbnail_size=self.config.history_thumbnail_size,
+        )
         
         # Normalize input images
         imgs: List[Image.Image] = []
@@ -276,70 +722,90 @@ class BananaStraightener:
         current_image = imgs[0] if imgs else None
         current_prompt = prompt
         
-        # Validate input image
+        # Validate, orient and resize input images (in parallel)
+        input_images_resized = self.preprocessor.prepare_many([im for im in imgs if validate_image(im)])
         if current_image:
-            current_image = resize_image_if_needed(current_image)
-            if not validate_image(current_image):
-                current_image = None
-        input_images_resized: List[Image.Image] = []
-        if imgs:
-            for im in imgs:
-                if validate_image(im):
-                    input_images_resized.append(resize_image_if_needed(im))
+            current_image = input_images_resized[0] if validate_image(current_image) else None
         
         for iteration in range(1, max_iterations + 1):
             try:
+                previous_image = current_image
                 # Generate or improve image
+                routing, generator = self._route_generator(history)
                 if iteration == 1 and not imgs:
-                    current_image = self.generator.generate_image(prompt)
+                    current_image, check, rejections, self_evaluation = self._generate_checked(
+                        prompt, target_prompt=prompt, generator=generator
+                    )
                 else:
                     if history:
+                        # Checked on its own: an unchanged image may come with no feedback at all
+                        stuck = self._is_stuck(history)
                         feedback = history[-1]['evaluation']['improvements']
-                        if feedback and feedback.lower() not in ['none', 'n/a', 'none needed!']:
+                        if stuck or (feedback and feedback.lower() not in ['none', 'n/a', 'none needed!']):
                             current_prompt = enhance_prompt_with_feedback(
                                 original_prompt=prompt,
                                 feedback=feedback,
                                 iteration=iteration,
-                                previous_history=history
+                                previous_history=history,
+                                max_chars=self._prompt_budget(),
+                                force_alternative=stuck,
                             )
                     
                     if iteration == 1 and input_images_resized:
-                        current_image = self.generator.generate_image(
-                            current_prompt,
-                            base_images=input_images_resized,
-                        )
+                        base_images = input_images_resized
                     else:
-                        current_image = self.generator.generate_image(
-                            current_prompt,
-                            base_images=[current_image] if current_image else None,
-                        )
+                        base_images = [current_image] if current_image else None
+                    current_image, check, rejections, self_evaluation = self._generate_checked(
+                        current_prompt, base_images, target_prompt=prompt, generator=generator
+                    )
                 
                 if not validate_image(current_image):
                     continue
+                rejected = check is not None and not check['passed']
+                image_hash = perceptual_hash(current_image)
+                unchanged_streak = self._unchanged_streak(history, image_hash, rejected)
                 
-                # Evaluate the generated image
-                evaluation = self.evaluator.evaluate_image(
-                    current_image,
-                    prompt,
-                    prompt_template=self.config.evaluation_prompt_template,
+                # Evaluate the generated image (rejected images skip the API call)
+                evaluation, evaluation_source = self._evaluate_generated(
+                    current_image, prompt, check, self_evaluation, success_threshold
                 )
+                if rejected:
+                    current_image = previous_image
+                    image_ref = None
+                else:
+                    image_ref = retention.add(iteration, current_image, evaluation['confidence'])
                 
-                # Create iteration record
+                # Create iteration record; history holds only the (spillable) reference
                 iteration_data = {
                     'iteration': iteration,
-                    'current_image': current_image,
+                    'image_ref': image_ref,
                     'prompt_used': current_prompt,
+                    'prompt_size': self._prompt_size(current_prompt),
                     'evaluation': evaluation,
+                    'evaluation_source': evaluation_source,
+                    **routing,
+                    'image_hash': image_hash,
+                    'unchanged_streak': unchanged_streak,
+                    'rejected': rejected,
+                    'rejections': rejections,
                     'success': evaluation['matches_intent'] and evaluation['confidence'] >= success_threshold,
+                    'memory': {
+                        'retained_bytes': retention.retained_bytes,
+                        'peak_bytes': retention.peak_bytes,
+                    },
                     'timestamp': datetime.now().isoformat()
                 }
                 history.append(iteration_data)
                 
                 # Yield current state
-                yield iteration_data
+                yield {**iteration_data, 'current_image': current_image}
                 
                 # Stop if successful
-                if iteration_data['success']:
+                if iteration_data['success'] or self._should_stop_unchanged(unchanged_streak):
+                    break
+                # Rejected images are still yielded (unlike in straighten, which
+                # skips them); their synthetic zero confidence must not hit the floor
+                if not rejected and self._below_budget_floor(budget, iteration, evaluation['confidence']):
                     break
                     
             except Exception as e:
@@ -356,30 +822,90 @@ class BananaStraightener:
                     'success': False,
                     'error': str(e)
                 }
+        
+        logger.info(
+            "🧠 Peak retained image memory: %.1f MB",
+            retention.peak_bytes / (1024 * 1024),
+        )
     
     def _save_session_report(self, result: Dict[str, Any], original_prompt: str) -> Path:
-        """Save a detailed report of the straightening session."""
-        report_data = {
-            'session_id': self.session_id,
-            'timestamp': self.session_start_time.isoformat(),
-            'original_prompt': original_prompt,
+        """Save a detailed report of the straightening session.
+
+        The report is assembled from the append-only session log written during
+        the run, so history is serialized once per iteration rather than
+        re-serialized here. Without a log it falls back to ``result['history']``.
+        """
+        summary = {
             'success': result['success'],
             'total_iterations': result['iterations'],
             'final_confidence': result.get('confidence', result.get('best_confidence', 0)),
-            'config': {
-                'generator_model': self.config.generator_model,
-                'evaluator_model': self.config.evaluator_model,
-                'success_threshold': self.config.success_threshold
-            },
-            'history': result['history']
+            'final_image_path': result.get('final_image_path'),
+            'rejections': summarize_rejections(result['history']),
+            'evaluation_sources': dict(Counter(
+                entry.get('evaluation_source', 'evaluator') for entry in result['history']
+            )),
         }
+        if result.get('best_attempt_selection'):
+            summary['best_attempt_selection'] = result['best_attempt_selection']
+        summary['metrics'] = self.metrics.snapshot()
+        if self.key_pool is not None:
+            # Pool-wide state (shared with other agents in this process)
+            summary['api_keys'] = self.key_pool.usage()
+        if self.hedger is not None:
+            summary['hedging'] = self.hedger.stats()
+        if self.cascade is not None:
+            summary['cascade'] = self.cascade.stats()
+        if self.router is not None:
+            summary['generator_models'] = model_usage(result['history'], result['success'])
+        if result.get('beam'):
+            summary['beam'] = result['beam']
+        
+        report_data = None
+        if self._session_log is not None:
+            try:
+                self._session_log.append('end', summary)
+                self._session_log.close()
+                report_data = build_report(SessionLog.read(self._session_log.path))
+            except Exception as e:
+                logger.warning("Failed to read session log, using in-memory history: %s", e)
+            self._session_log = None
+        
+        if report_data is None:
+            report_data = {
+                'session_id': self.session_id,
+                'timestamp': self.session_start_time.isoformat(),
+                'original_prompt': original_prompt,
+                'config': {
+                    'generator_model': self.config.generator_model,
+                    'evaluator_model': self.config.evaluator_model,
+                    'success_threshold': self.config.success_threshold
+                },
+                **summary,
+                'history': result['history']
+            }
         
         report_path = self.session_dir / "session_report.json"
         try:
+            report_path.parent.mkdir(parents=True, exist_ok=True)
             with open(report_path, 'w', encoding='utf-8') as f:
                 json.dump(report_data, f, indent=2, default=str)
             logger.info("📄 Session report saved: %s", report_path)
         except Exception as e:
             logger.warning("Failed to save session report: %s", e)
+            return report_path
+        
+        if self.config.session_catalog:
+            try:
+                from .catalog import SessionCatalog
+                SessionCatalog.for_output_dir(self.config.output_dir).index_report(report_data, report_path)
+            except Exception as e:
+                logger.warning("Failed to index session in catalog: %s", e)
+        
+        # Beam sessions count rounds, not iterations, so they are not learned from
+        if self.config.adaptive_budget != 'off' and not result.get('beam'):
+            try:
+                IterationBudget.for_config(self.config).update(report_data)
+            except Exception as e:
+                logger.warning("Failed to update iteration budget: %s", e)
         
         return report_path
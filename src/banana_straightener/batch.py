@@ -0,0 +1,481 @@
+"""Concurrent, resumable batch processing of JSONL manifests.
+
+Each manifest line is a JSON object::
+
+    {"id": "optional-key", "prompt": "...", "images": ["a.png"],
+     "max_iterations": 5, "success_threshold": 0.85}
+
+The manifest is streamed, never loaded whole. Results are appended to an
+output JSONL file as each job finishes, so an interrupted batch can be re-run
+and will skip every entry that already has a result.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple, Union
+
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BatchStats:
+    """Running totals for a batch, safe to read from progress callbacks."""
+
+    total: int = 0
+    skipped: int = 0
+    processed: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    errors: int = 0
+    excluded: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    @property
+    def remaining(self) -> int:
+        return max(0, self.total - self.skipped - self.excluded - self.processed)
+
+    @property
+    def throughput(self) -> float:
+        """Jobs finished per minute in this run."""
+        return self.processed * 60.0 / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def eta_seconds(self) -> Optional[float]:
+        if not self.processed:
+            return None
+        return self.remaining * self.elapsed / self.processed
+
+
+def job_key(entry: Dict[str, Any]) -> str:
+    """Stable key for a manifest entry: its ``id`` or a hash of its inputs."""
+    if entry.get("id") is not None:
+        return str(entry["id"])
+    payload = json.dumps(
+        {"prompt": entry.get("prompt", ""), "images": entry.get("images") or []},
+        sort_keys=True,
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def iter_manifest(manifest_path: Union[str, Path]) -> Iterator[Dict[str, Any]]:
+    """Yield manifest entries one at a time, with their ``key`` filled in.
+
+    Relative image paths are resolved against the manifest's directory.
+    """
+    base_dir = Path(manifest_path).resolve().parent
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError as e:
+                logger.warning("Skipping manifest line %s: %s", line_number, e)
+                continue
+            if isinstance(entry, str):
+                entry = {"prompt": entry}
+            if not isinstance(entry, dict):
+                logger.warning("Skipping manifest line %s: expected an object or a string", line_number)
+                continue
+            if not entry.get("prompt"):
+                logger.warning("Skipping manifest line %s: missing prompt", line_number)
+                continue
+            entry["key"] = job_key(entry)
+            entry["images"] = [str(base_dir / p) for p in entry.get("images") or []]
+            yield entry
+
+
+def count_manifest_entries(manifest_path: Union[str, Path]) -> int:
+    """Count non-blank lines without parsing them (used for ETA only)."""
+    with open(manifest_path, "rb") as f:
+        return sum(1 for line in f if line.strip() and not line.lstrip().startswith(b"#"))
+
+
+def load_completed_keys(output_path: Union[str, Path]) -> Set[str]:
+    """Keys already present in an output file. Errored entries are retried."""
+    done: Set[str] = set()
+    output_path = Path(output_path)
+    if not output_path.exists():
+        return done
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A crash can leave a truncated last line; ignore it
+                continue
+            if record.get("key") and not record.get("error"):
+                done.add(record["key"])
+    return done
+
+
+def _default_agent_factory(config: Config, session_id: str):
+    from .agent import BananaStraightener
+
+    return BananaStraightener(config, session_id=session_id)
+
+
+def run_entry(
+    entry: Dict[str, Any],
+    config: Config,
+    agent_factory: Optional[Callable[[Config, str], Any]] = None,
+) -> Dict[str, Any]:
+    """Straighten one manifest entry and return its result record."""
+    from .preprocess import ImagePreprocessor
+    from .utils import sanitize_filename
+
+    agent_factory = agent_factory or _default_agent_factory
+    start = time.monotonic()
+    record: Dict[str, Any] = {"key": entry["key"], "prompt": entry["prompt"]}
+    try:
+        images = ImagePreprocessor.for_config(config).load_many(entry.get("images") or [])
+        session_id = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{sanitize_filename(entry['key'])}"
+        agent = agent_factory(config, session_id)
+        result = agent.straighten(
+            prompt=entry["prompt"],
+            input_images=images or None,
+            max_iterations=entry.get("max_iterations"),
+            success_threshold=entry.get("success_threshold"),
+        )
+        record.update({
+            "success": result["success"],
+            "iterations": result["iterations"],
+            "confidence": result.get("confidence", result.get("best_confidence", 0.0)),
+            "final_image_path": result.get("final_image_path"),
+            "session_dir": result.get("session_dir"),
+            "session_id": result.get("session_id"),
+        })
+    except Exception as e:
+        logger.error("Batch entry %s failed: %s", entry["key"], e)
+        record.update({"success": False, "error": str(e)})
+    record["duration_seconds"] = round(time.monotonic() - start, 3)
+    record["finished_at"] = datetime.now().isoformat()
+    return record
+
+
+class ResultWriter:
+    """Append-only JSONL writer that flushes each record to disk."""
+
+    def __init__(self, output_path: Union[str, Path]):
+        self.path = Path(output_path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+        # Terminate a partial line left by a crash so the next record parses
+        if self.path.stat().st_size:
+            with open(self.path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    self._file.write("\n")
+
+    def write(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def run_batch(
+    manifest_path: Union[str, Path],
+    output_path: Union[str, Path],
+    config: Config,
+    concurrency: int = 4,
+    on_result: Optional[Callable[[Dict[str, Any], BatchStats], None]] = None,
+    agent_factory: Optional[Callable[[Config, str], Any]] = None,
+    entry_filter: Optional[Callable[[Dict[str, Any]], bool]] = None,
+    done_keys: Optional[Set[str]] = None,
+) -> BatchStats:
+    """Process a manifest with bounded concurrency, appending results as they finish.
+
+    Args:
+        manifest_path: JSONL manifest of prompts
+        output_path: JSONL file results are appended to; existing keys are skipped
+        config: Configuration shared by all jobs
+        concurrency: Number of jobs run in parallel
+        on_result: Called with each finished record and the running stats
+        agent_factory: Builds the agent for a job (defaults to BananaStraightener)
+        entry_filter: Optional predicate selecting which entries this run owns
+        done_keys: Extra keys to treat as finished (e.g. from other shards' outputs)
+
+    Returns:
+        Final BatchStats for this run
+    """
+    concurrency = max(1, concurrency)
+    stats = BatchStats(total=count_manifest_entries(manifest_path))
+    done = load_completed_keys(output_path) | set(done_keys or ())
+    seen: Set[str] = set()
+
+    with ResultWriter(output_path) as writer, ThreadPoolExecutor(max_workers=concurrency) as pool:
+        in_flight = set()
+
+        def collect(futures):
+            for future in futures:
+                record = future.result()
+                writer.write(record)
+                stats.processed += 1
+                if record.get("error"):
+                    stats.errors += 1
+                elif record.get("success"):
+                    stats.succeeded += 1
+                else:
+                    stats.failed += 1
+                if on_result:
+                    on_result(record, stats)
+
+        for entry in iter_manifest(manifest_path):
+            key = entry["key"]
+            if key in done or key in seen:
+                stats.skipped += 1
+                continue
+            if entry_filter and not entry_filter(entry):
+                stats.excluded += 1
+                continue
+            seen.add(key)
+
+            # Bound the number of pending futures so the manifest stays streamed
+            if len(in_flight) >= concurrency * 2:
+                finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(finished)
+            in_flight.add(pool.submit(run_entry, entry, config, agent_factory))
+
+        while in_flight:
+            finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            collect(finished)
+
+    logger.info(
+        "📦 Batch finished: %d processed, %d skipped, %d succeeded",
+        stats.processed, stats.skipped, stats.succeeded,
+    )
+    return stats
+
+
+def parse_shard(spec: str) -> Tuple[int, int]:
+    """Parse an ``i/N`` shard spec (0-based index) into ``(i, N)``."""
+    try:
+        index_str, count_str = spec.split("/", 1)
+        index, count = int(index_str), int(count_str)
+    except ValueError:
+        raise ValueError(f"Invalid shard '{spec}', expected i/N (e.g. 0/4)")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard '{spec}', need 0 <= i < N")
+    return index, count
+
+
+def shard_of(key: str, shard_count: int) -> int:
+    """Stable shard assignment for a job key (independent of PYTHONHASHSEED)."""
+    digest = hashlib.sha1(key.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % shard_count
+
+
+def shard_output_path(results_dir: Union[str, Path], index: int, count: int) -> Path:
+    return Path(results_dir) / f"batch_results.shard-{index}-of-{count}.jsonl"
+
+
+class LockDir:
+    """Per-key lock files on a shared filesystem, used for work stealing.
+
+    A lock is claimed with an atomic exclusive create. Locks left behind by a
+    crashed run of the same shard, or older than ``stale_seconds``, are
+    reclaimed by exclusively creating the key's next lock generation
+    (``<hash>.lock``, ``<hash>.1.lock``, ...), so when several nodes find the
+    same stale lock exactly one of them takes it over.
+    """
+
+    def __init__(self, path: Union[str, Path], owner: str, stale_seconds: float = 6 * 3600):
+        self.path = Path(path)
+        self.owner = owner
+        self.stale_seconds = stale_seconds
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def _lock_path(self, key: str, generation: int = 0) -> Path:
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return self.path / (f"{digest}.lock" if generation == 0 else f"{digest}.{generation}.lock")
+
+    def _create(self, lock_path: Path, key: str) -> bool:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(f"{self.owner}\n{key}\n")
+        return True
+
+    def _reclaimable(self, lock_path: Path) -> bool:
+        try:
+            holder = lock_path.read_text(encoding="utf-8").split("\n", 1)[0]
+            age = time.time() - lock_path.stat().st_mtime
+        except OSError:
+            return False
+        # Our own lock from an interrupted run, or an abandoned one
+        return holder == self.owner or age >= self.stale_seconds
+
+    def acquire(self, key: str) -> bool:
+        generation = 0
+        while True:
+            lock_path = self._lock_path(key, generation)
+            if self._create(lock_path, key):
+                return True
+            # Only the newest generation counts; older ones were taken over
+            if not self._lock_path(key, generation + 1).exists() and not self._reclaimable(lock_path):
+                return False
+            generation += 1
+
+
+def run_sharded_batch(
+    manifest_path: Union[str, Path],
+    results_dir: Union[str, Path],
+    config: Config,
+    shard_index: int,
+    shard_count: int,
+    concurrency: int = 4,
+    steal: bool = False,
+    on_result: Optional[Callable[[Dict[str, Any], BatchStats], None]] = None,
+    agent_factory: Optional[Callable[[Config, str], Any]] = None,
+) -> BatchStats:
+    """Process this node's shard of a manifest, optionally stealing leftover work.
+
+    Shards need no coordinator: each node hashes every job key and keeps the
+    ones that land on its index, writing to its own results file in the shared
+    ``results_dir``. With ``steal`` every job is also claimed through a lock
+    file, and once its own shard is finished a node picks up unclaimed jobs
+    belonging to slower shards.
+    """
+    output_path = shard_output_path(results_dir, shard_index, shard_count)
+    locks = LockDir(Path(results_dir) / ".locks", owner=f"{shard_index}/{shard_count}") if steal else None
+
+    def owned(entry):
+        if shard_of(entry["key"], shard_count) != shard_index:
+            return False
+        return locks is None or locks.acquire(entry["key"])
+
+    stats = run_batch(
+        manifest_path, output_path, config,
+        concurrency=concurrency,
+        on_result=on_result,
+        agent_factory=agent_factory,
+        entry_filter=owned,
+    )
+    if not steal:
+        return stats
+
+    def stealable(entry):
+        return shard_of(entry["key"], shard_count) != shard_index and locks.acquire(entry["key"])
+
+    done = set()
+    for path in Path(results_dir).glob("batch_results.shard-*.jsonl"):
+        done |= load_completed_keys(path)
+    logger.info("🤝 Shard %s/%s finished, stealing remaining work", shard_index, shard_count)
+    stolen = run_batch(
+        manifest_path, output_path, config,
+        concurrency=concurrency,
+        on_result=on_result,
+        agent_factory=agent_factory,
+        entry_filter=stealable,
+        done_keys=done,
+    )
+    stats.processed += stolen.processed
+    stats.succeeded += stolen.succeeded
+    stats.failed += stolen.failed
+    stats.errors += stolen.errors
+    return stats
+
+
+def merge_results(
+    results_paths: List[Union[str, Path]],
+    merged_path: Union[str, Path],
+) -> Dict[str, Any]:
+    """Combine per-shard results into one JSONL file and a summary.
+
+    Duplicate keys (e.g. a job retried after an error) keep the best record:
+    a non-error record wins over an error, later records win over earlier ones.
+    Session reports referenced by the records are folded into the summary.
+    """
+    records: Dict[str, Dict[str, Any]] = {}
+    per_file: Dict[str, int] = {}
+    for path in results_paths:
+        count = 0
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                key = record.get("key")
+                if not key:
+                    continue
+                count += 1
+                previous = records.get(key)
+                if previous is None or previous.get("error") or not record.get("error"):
+                    records[key] = record
+        per_file[str(path)] = count
+
+    merged_path = Path(merged_path)
+    merged_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(merged_path, "w", encoding="utf-8") as f:
+        for record in records.values():
+            f.write(json.dumps(record, default=str) + "\n")
+
+    finished = [r for r in records.values() if not r.get("error")]
+    succeeded = [r for r in finished if r.get("success")]
+    reports_found = 0
+    report_iterations = 0
+    for record in finished:
+        report_path = Path(record["session_dir"]) / "session_report.json" if record.get("session_dir") else None
+        if report_path and report_path.exists():
+            try:
+                with open(report_path, "r", encoding="utf-8") as rf:
+                    report = json.load(rf)
+            except (OSError, json.JSONDecodeError):
+                continue
+            reports_found += 1
+            report_iterations += len(report.get("history", []))
+
+    summary = {
+        "total": len(records),
+        "succeeded": len(succeeded),
+        "below_threshold": len(finished) - len(succeeded),
+        "errors": len(records) - len(finished),
+        "success_rate": len(succeeded) / len(finished) if finished else 0.0,
+        "avg_iterations": (
+            sum(r.get("iterations", 0) for r in finished) / len(finished) if finished else 0.0
+        ),
+        "avg_confidence": (
+            sum(r.get("confidence", 0.0) for r in finished) / len(finished) if finished else 0.0
+        ),
+        "total_duration_seconds": sum(r.get("duration_seconds", 0.0) for r in records.values()),
+        "session_reports_found": reports_found,
+        "session_report_iterations": report_iterations,
+        "records_per_file": per_file,
+        "merged_results": str(merged_path),
+        "merged_at": datetime.now().isoformat(),
+    }
+    summary_path = merged_path.with_name(merged_path.stem + "_summary.json")
+    with open(summary_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    summary["summary_path"] = str(summary_path)
+    return summary
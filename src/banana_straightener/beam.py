@@ -0,0 +1,265 @@
+"""Beam search over prompt refinements.
+
+The default loop is greedy: one prompt, one image, one piece of feedback per
+iteration, so a bad early image can lock the session onto a poor branch.
+``BeamSearch`` keeps the ``beam_width`` best (image, prompt) states per
+round instead. Each state is expanded into up to ``expansion_factor``
+refined prompts, and the expansions are generated and evaluated
+concurrently. The refined prompts are the feedback-enhanced prompt, an
+alternative approach, then prompts focused on one unresolved feedback item
+at a time. The best ``beam_width`` children form the next round.
+
+Every generate and evaluate call is counted, and the result reports the
+total against a greedy baseline of two calls per round.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from PIL import Image
+
+from .utils import (
+    create_session_summary,
+    enhance_prompt_with_feedback,
+    sanitize_filename,
+    save_image,
+    select_unresolved_feedback,
+    validate_image,
+)
+
+logger = logging.getLogger(__name__)
+
+_NO_FEEDBACK = ('', 'none', 'n/a', 'none needed!')
+
+
+@dataclass
+class BeamNode:
+    """One generated image, the prompt that produced it and its evaluation."""
+
+    node_id: int
+    round: int
+    prompt: str
+    image: Image.Image
+    evaluation: Dict[str, Any]
+    parent: Optional["BeamNode"] = None
+    history: List[Dict[str, Any]] = field(default_factory=list)  # lineage records, oldest first
+
+    @property
+    def confidence(self) -> float:
+        return self.evaluation['confidence']
+
+
+class BeamSearch:
+    """Runs a beam search using an agent's models, checks and settings.
+
+    Args:
+        agent: BananaStraightener supplying models, config and session paths
+        beam_width: States kept per round
+        expansion_factor: Refined prompts generated per state
+        concurrency: Expansions generated and evaluated in parallel
+    """
+
+    def __init__(self, agent, beam_width: int = 3, expansion_factor: int = 2, concurrency: int = 4):
+        self.agent = agent
+        self.config = agent.config
+        self.beam_width = max(1, beam_width)
+        self.expansion_factor = max(1, expansion_factor)
+        self.concurrency = max(1, concurrency)
+        self.calls = {'generate': 0, 'evaluate': 0}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def variants(self, node: BeamNode, original_prompt: str) -> List[str]:
+        """Distinct refined prompts for a state, best guess first."""
+        feedback = node.evaluation.get('improvements', '')
+        if not feedback or feedback.strip().lower() in _NO_FEEDBACK:
+            return [node.prompt]
+        max_chars = self.agent._prompt_budget()
+        iteration = node.round + 1
+        prompts = [
+            enhance_prompt_with_feedback(original_prompt, feedback, iteration, node.history, max_chars),
+            enhance_prompt_with_feedback(
+                original_prompt, feedback, iteration, node.history, max_chars, force_alternative=True
+            ),
+        ]
+        for item in select_unresolved_feedback(feedback, node.history):
+            prompts.append(enhance_prompt_with_feedback(original_prompt, item, iteration, [], max_chars))
+        return list(dict.fromkeys(prompts))[:self.expansion_factor]
+
+    def _expand(
+        self,
+        prompt: str,
+        target_prompt: str,
+        base_images: Optional[List[Image.Image]],
+        round_number: int,
+        parent: Optional[BeamNode],
+        success_threshold: float,
+    ) -> Optional[BeamNode]:
+        agent = self.agent
+        start = time.perf_counter()
+        routing, generator = agent._route_generator(parent.history if parent else [])
+        image, check, rejections, self_evaluation = agent._generate_checked(
+            prompt, base_images, target_prompt=target_prompt, generator=generator
+        )
+        with self._lock:
+            self.calls['generate'] += 1 + len(rejections)
+        if not validate_image(image):
+            logger.error("Beam expansion produced an invalid image")
+            return None
+        generation_seconds = time.perf_counter() - start
+        evaluation, source = agent._evaluate_generated(
+            image, target_prompt, check, self_evaluation, success_threshold
+        )
+        with self._lock:
+            if source == 'evaluator':
+                self.calls['evaluate'] += 1
+            self._next_id += 1
+            node_id = self._next_id
+        node = BeamNode(node_id, round_number, prompt, image, evaluation, parent)
+        record = {
+            # Unique per node so reports and the catalog keep every evaluation
+            'iteration': node.node_id,
+            'round': round_number,
+            'parent': parent.node_id if parent else None,
+            'prompt_used': prompt,
+            'prompt_size': agent._prompt_size(prompt),
+            'evaluation': evaluation,
+            'evaluation_source': source,
+            **routing,
+            'rejected': check is not None and not check['passed'],
+            'rejections': rejections,
+            'image_path': None,
+            'timings': {
+                'generation_seconds': round(generation_seconds, 3),
+                'evaluation_seconds': round(time.perf_counter() - start - generation_seconds, 3),
+            },
+            'timestamp': datetime.now().isoformat(),
+        }
+        if self.config.save_intermediates and not record['rejected']:
+            path = agent.session_dir / "beam" / f"round_{round_number:02d}_node_{node.node_id:03d}.png"
+            save_image(image, path)
+            record['image_path'] = str(path)
+        node.history = (parent.history if parent else []) + [record]
+        return node
+
+    def run(
+        self,
+        prompt: str,
+        input_images: Optional[List[Image.Image]] = None,
+        max_rounds: Optional[int] = None,
+        success_threshold: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """Search until an image meets the threshold or ``max_rounds`` rounds ran."""
+        agent = self.agent
+        max_rounds = max_rounds or self.config.default_max_iterations
+        success_threshold = success_threshold or self.config.success_threshold
+        inputs = agent.preprocessor.prepare_many([im for im in (input_images or []) if validate_image(im)])
+        agent.session_input_images = inputs or None
+        agent._session_log = None  # the report is built from the in-memory history
+        logger.info(
+            "🔦 Beam search: width %s, expansion %s, concurrency %s",
+            self.beam_width, self.expansion_factor, self.concurrency,
+        )
+
+        history: List[Dict[str, Any]] = []
+        beam: List[BeamNode] = []
+        best: Optional[BeamNode] = None
+        rounds = 0
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            for round_number in range(1, max_rounds + 1):
+                rounds = round_number
+                if not beam:
+                    # First round: independent samples of the original prompt
+                    jobs = [(prompt, inputs or None, None)] * self.beam_width
+                else:
+                    jobs = [
+                        (variant, [parent.image], parent)
+                        for parent in beam
+                        for variant in self.variants(parent, prompt)
+                    ]
+                logger.info("🍌 Beam round %s/%s: %s expansion(s)", round_number, max_rounds, len(jobs))
+                futures = [
+                    pool.submit(self._expand, p, prompt, base, round_number, parent, success_threshold)
+                    for p, base, parent in jobs
+                ]
+                children = []
+                for future in futures:
+                    try:
+                        node = future.result()
+                    except Exception as e:
+                        logger.error("Beam expansion failed: %s", e)
+                        continue
+                    if node is not None:
+                        children.append(node)
+                        history.append(node.history[-1])
+                if not children:
+                    continue
+
+                children.sort(key=lambda n: n.confidence, reverse=True)
+                beam = children[:self.beam_width]
+                if best is None or beam[0].confidence > best.confidence:
+                    best = beam[0]
+                logger.info("📊 Beam round %s best confidence: %.2f", round_number, beam[0].confidence)
+                if best.evaluation['matches_intent'] and best.confidence >= success_threshold:
+                    break
+
+        return self._result(prompt, best, history, rounds, success_threshold)
+
+    def _result(
+        self,
+        prompt: str,
+        best: Optional[BeamNode],
+        history: List[Dict[str, Any]],
+        rounds: int,
+        success_threshold: float,
+    ) -> Dict[str, Any]:
+        agent = self.agent
+        success = bool(
+            best and best.evaluation['matches_intent'] and best.confidence >= success_threshold
+        )
+        final_path = None
+        if best is not None:
+            prefix = "final_image" if success else "best_attempt"
+            final_path = agent.session_dir / f"{prefix}_{sanitize_filename(prompt[:30])}.png"
+            save_image(best.image, final_path)
+
+        total = self.calls['generate'] + self.calls['evaluate']
+        greedy = 2 * rounds
+        result = {
+            'success': success,
+            'final_image': best.image if best else None,
+            'final_image_path': str(final_path) if final_path else None,
+            'iterations': rounds,
+            'history': history,
+            'session_dir': str(agent.session_dir),
+            'session_id': agent.session_id,
+            'best_path': [record['iteration'] for record in best.history] if best else [],
+            'beam': {
+                'beam_width': self.beam_width,
+                'expansion_factor': self.expansion_factor,
+                'concurrency': self.concurrency,
+                'rounds': rounds,
+                'nodes': len(history),
+                'calls': {**self.calls, 'total': total},
+                'greedy_baseline_calls': greedy,
+                'call_ratio': round(total / greedy, 2) if greedy else None,
+            },
+        }
+        confidence = best.confidence if best else 0.0
+        if success:
+            result['confidence'] = confidence
+        else:
+            result['best_confidence'] = confidence
+            result['message'] = f"Best result: {confidence:.2%} confidence"
+
+        agent._save_session_report(result, prompt)
+        logger.info(create_session_summary(prompt, result, agent.session_start_time))
+        logger.info(
+            "🔦 Beam search used %s calls (greedy baseline for %s rounds: %s)", total, rounds, greedy
+        )
+        return result
@@ -0,0 +1,199 @@
+"""Iteration budget predictor learned from finished sessions.
+
+``IterationBudget`` keeps, per prompt profile (prompt length bucket and
+whether input images were given), how many iterations successful sessions
+needed and what confidence they had at each iteration on the way. From that
+it suggests ``max_iterations`` (enough to cover most past successes) and a
+per-iteration stop-early floor: a confidence so low that sessions which went
+on to succeed almost never had it at that point.
+
+The model is a small JSON file next to the outputs, updated incrementally as
+sessions finish and rebuildable from existing session reports. Confidences
+are kept as 10-bin histograms, so the file stays small however many
+sessions it has seen. Concurrent processes updating the same file can lose
+an update to a race; the model is a statistical guide, so that is tolerated.
+"""
+
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+BUDGET_FILENAME = "iteration_budget.json"
+BUDGET_VERSION = 1
+CONFIDENCE_BINS = 10
+# Largest max_iterations ever suggested
+MAX_SUGGESTED_ITERATIONS = 20
+
+_file_lock = threading.Lock()
+
+
+def budget_path(output_dir: Union[str, Path]) -> Path:
+    return Path(output_dir) / BUDGET_FILENAME
+
+
+def prompt_profile(prompt: str, has_images: bool) -> str:
+    """Coarse profile key: prompt length bucket plus input-image presence."""
+    words = len(prompt.split())
+    length = "short" if words <= 8 else "medium" if words <= 25 else "long"
+    return f"{length}|{'images' if has_images else 'text'}"
+
+
+def _fallback_profiles(profile: str) -> List[str]:
+    """The profile, then its input-image half alone, then everything."""
+    return [profile, "*|" + profile.split("|", 1)[1], "*"]
+
+
+def _bin(confidence: float) -> int:
+    return min(CONFIDENCE_BINS - 1, max(0, int(confidence * CONFIDENCE_BINS)))
+
+
+def _empty_stats() -> Dict[str, Any]:
+    return {
+        "sessions": 0,
+        "successes": 0,
+        # iteration (as str, for JSON) -> successful sessions that finished there
+        "success_iterations": {},
+        # iteration -> confidence histogram of sessions that later succeeded
+        "success_confidence": {},
+    }
+
+
+class IterationBudget:
+    """Learned iteration budgets per prompt profile.
+
+    Args:
+        path: JSON file holding the model
+        coverage: Fraction of past successes the suggested budget must cover
+        stop_quantile: Confidence quantile of eventually-successful sessions
+            used as the stop-early floor
+        min_sessions: Sessions a profile needs before its numbers are used
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        coverage: float = 0.9,
+        stop_quantile: float = 0.05,
+        min_sessions: int = 5,
+    ):
+        self.path = Path(path)
+        self.coverage = coverage
+        self.stop_quantile = stop_quantile
+        self.min_sessions = min_sessions
+        self.profiles: Dict[str, Dict[str, Any]] = self._load()
+
+    @classmethod
+    def for_config(cls, config) -> "IterationBudget":
+        return cls(budget_path(config.output_dir), coverage=config.budget_coverage)
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning("Ignoring unreadable iteration budget %s: %s", self.path, e)
+            return {}
+        if data.get("version") != BUDGET_VERSION:
+            return {}
+        return data.get("profiles", {})
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(f".tmp{os.getpid()}")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": BUDGET_VERSION, "profiles": self.profiles}, f, indent=2, sort_keys=True)
+        os.replace(tmp, self.path)
+
+    def _add(self, report: Dict[str, Any]) -> bool:
+        history = report.get("history") or []
+        if not history or report.get("incomplete"):
+            return False
+        profile = prompt_profile(report.get("original_prompt", ""), bool(report.get("input_images")))
+        success = bool(report.get("success"))
+        for key in _fallback_profiles(profile):
+            stats = self.profiles.setdefault(key, _empty_stats())
+            stats["sessions"] += 1
+            if not success:
+                continue
+            stats["successes"] += 1
+            finished = str(report.get("total_iterations") or len(history))
+            stats["success_iterations"][finished] = stats["success_iterations"].get(finished, 0) + 1
+            for entry in history:
+                confidence = (entry.get("evaluation") or {}).get("confidence")
+                if confidence is None or entry.get("rejected"):
+                    continue
+                bins = stats["success_confidence"].setdefault(str(entry["iteration"]), [0] * CONFIDENCE_BINS)
+                bins[_bin(confidence)] += 1
+        return True
+
+    def update(self, report: Dict[str, Any]) -> None:
+        """Fold one finished session report into the stored model."""
+        with _file_lock:
+            self.profiles = self._load()
+            if self._add(report):
+                self.save()
+
+    def rebuild(self, reports: Iterable[Dict[str, Any]]) -> int:
+        """Replace the model with one learned from ``reports``; returns sessions used."""
+        self.profiles = {}
+        used = sum(1 for report in reports if self._add(report))
+        with _file_lock:
+            self.save()
+        return used
+
+    def suggest(self, prompt: str, has_images: bool = False) -> Optional[Dict[str, Any]]:
+        """Suggested budget for a new prompt, or None without enough history.
+
+        Returns ``max_iterations``, ``stop_below`` (iteration -> confidence
+        floor), the profile the numbers came from and its success rate.
+        """
+        for key in _fallback_profiles(prompt_profile(prompt, has_images)):
+            stats = self.profiles.get(key)
+            if stats and stats["sessions"] >= self.min_sessions and stats["successes"]:
+                return self._suggestion(key, stats)
+        return None
+
+    def _suggestion(self, key: str, stats: Dict[str, Any]) -> Dict[str, Any]:
+        finished = sorted((int(i), n) for i, n in stats["success_iterations"].items())
+        needed, covered = 1, 0
+        for iteration, count in finished:
+            covered += count
+            needed = iteration
+            if covered >= self.coverage * stats["successes"]:
+                break
+
+        stop_below = {}
+        for iteration, bins in stats["success_confidence"].items():
+            total = sum(bins)
+            if total < self.min_sessions:
+                continue
+            cumulative = 0
+            for index, count in enumerate(bins):
+                cumulative += count
+                if cumulative > self.stop_quantile * total:
+                    stop_below[int(iteration)] = index / CONFIDENCE_BINS
+                    break
+        return {
+            "max_iterations": max(1, min(MAX_SUGGESTED_ITERATIONS, needed)),
+            "stop_below": {i: floor for i, floor in sorted(stop_below.items()) if floor > 0},
+            "profile": key,
+            "sessions": stats["sessions"],
+            "success_rate": round(stats["successes"] / stats["sessions"], 3),
+        }
+
+
+def iter_session_reports(output_dir: Union[str, Path]) -> Iterable[Dict[str, Any]]:
+    """Yield every readable session_report.json under ``output_dir``."""
+    for path in sorted(Path(output_dir).glob("*/session_report.json")):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                yield json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning("Skipping unreadable report %s: %s", path, e)
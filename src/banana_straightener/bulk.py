@@ -0,0 +1,573 @@
+"""Offline bulk mode: advance a whole manifest in lockstep through batch submissions.
+
+Instead of running every session's generate/evaluate round-trips on its own,
+each iteration round of the whole batch becomes one submission per step:
+all active sessions generate, then all of them are evaluated. Submissions go
+through a ``BatchTransport``; ``GeminiBatchTransport`` uses the Gemini Batch
+API (cheaper, high-latency, suited to nightly jobs) and
+``LocalBatchTransport`` runs the requests through a model in a thread pool,
+which makes it a stand-in service for tests and debugging.
+
+Generated images are written to each session's directory as they arrive and
+sessions only keep paths, so memory stays flat with thousands of sessions.
+Results use the same JSONL record format as ``straighten batch`` and finished
+entries are skipped when the command is re-run.
+"""
+
+import base64
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from PIL import Image
+
+from .batch import BatchStats, ResultWriter, count_manifest_entries, iter_manifest, load_completed_keys
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+# Normalized submission states returned by BatchTransport.poll
+BATCH_RUNNING = "running"
+BATCH_DONE = "done"
+BATCH_FAILED = "failed"
+
+# The Batch API accepts at most 20 MB of inline requests per submission;
+# larger submissions are uploaded as a JSONL file instead
+INLINE_BATCH_LIMIT_BYTES = 20 * 1024 * 1024
+
+
+@dataclass
+class BulkRequest:
+    """One generate or evaluate call inside a batch submission."""
+
+    key: str
+    kind: str  # "generate" or "evaluate"
+    prompt: str  # generation prompt, or the target prompt for evaluation
+    image_paths: List[str] = field(default_factory=list)
+
+
+class BatchTransport(ABC):
+    """Submits batches of requests and collects their responses.
+
+    ``collect`` returns a mapping from request key to a response dict holding
+    ``image`` (generate), ``evaluation`` (evaluate) or ``error``.
+    """
+
+    @abstractmethod
+    def submit(self, kind: str, requests: List[BulkRequest]) -> str:
+        """Submit requests of one kind and return a batch id."""
+
+    @abstractmethod
+    def poll(self, batch_id: str) -> str:
+        """Return BATCH_RUNNING, BATCH_DONE or BATCH_FAILED."""
+
+    @abstractmethod
+    def collect(self, batch_id: str) -> Dict[str, Dict[str, Any]]:
+        """Responses of a finished batch, keyed by request key."""
+
+
+def _load_images(paths: List[str]) -> List[Image.Image]:
+    images = []
+    for path in paths:
+        with Image.open(path) as img:
+            images.append(img.convert("RGB"))
+    return images
+
+
+class LocalBatchTransport(BatchTransport):
+    """Stand-in batch service that runs requests through local model objects.
+
+    Args:
+        generator: Model used for ``generate`` requests
+        evaluator: Model used for ``evaluate`` requests (defaults to generator)
+        workers: Requests executed in parallel
+        evaluation_prompt_template: Passed to ``evaluate_image``
+    """
+
+    def __init__(self, generator, evaluator=None, workers: int = 4, evaluation_prompt_template: Optional[str] = None):
+        self.generator = generator
+        self.evaluator = evaluator or generator
+        self.evaluation_prompt_template = evaluation_prompt_template
+        self.submissions: List[Dict[str, Any]] = []
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers))
+        self._batches: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _run(self, request: BulkRequest) -> Dict[str, Any]:
+        try:
+            images = _load_images(request.image_paths)
+            if request.kind == "generate":
+                if images:
+                    return {"image": self.generator.generate_image(request.prompt, base_images=images)}
+                return {"image": self.generator.generate_image(request.prompt)}
+            return {"evaluation": self.evaluator.evaluate_image(
+                images[0], request.prompt, prompt_template=self.evaluation_prompt_template,
+            )}
+        except Exception as e:
+            return {"error": str(e)}
+
+    def submit(self, kind: str, requests: List[BulkRequest]) -> str:
+        with self._lock:
+            batch_id = f"local-{len(self._batches) + 1}"
+            self.submissions.append({"batch_id": batch_id, "kind": kind, "size": len(requests)})
+            self._batches[batch_id] = {r.key: self._pool.submit(self._run, r) for r in requests}
+        return batch_id
+
+    def poll(self, batch_id: str) -> str:
+        futures = self._batches[batch_id].values()
+        return BATCH_DONE if all(f.done() for f in futures) else BATCH_RUNNING
+
+    def collect(self, batch_id: str) -> Dict[str, Dict[str, Any]]:
+        futures = self._batches.pop(batch_id)
+        return {key: future.result() for key, future in futures.items()}
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=True)
+
+
+class GeminiBatchTransport(BatchTransport):
+    """Gemini Batch API transport.
+
+    Submissions up to ``inline_limit_bytes`` are sent as inline requests;
+    larger ones are written to a JSONL file that is uploaded as the batch
+    source. Evaluation images are encoded with the configured
+    ``EvaluationEncoder``. Each submission targets a single model, which is
+    why generation and evaluation are always submitted separately.
+    """
+
+    _DONE_STATES = ("JOB_STATE_SUCCEEDED", "JOB_STATE_PARTIALLY_SUCCEEDED")
+    _FAILED_STATES = ("JOB_STATE_FAILED", "JOB_STATE_CANCELLED", "JOB_STATE_EXPIRED")
+
+    def __init__(self, config: Config, inline_limit_bytes: int = INLINE_BATCH_LIMIT_BYTES):
+        from .models import GeminiModel
+        from .preprocess import EvaluationEncoder
+
+        self.config = config
+        self.inline_limit_bytes = inline_limit_bytes
+        self.generator = GeminiModel(config.api_key, config.generator_model)
+        self.evaluation_encoder = EvaluationEncoder.for_config(config)
+        self.client = self.generator.client
+        self._requests: Dict[str, List[BulkRequest]] = {}
+        self._jobs: Dict[str, Any] = {}
+
+    def _request_line(self, request: BulkRequest) -> str:
+        """One request in the Batch API's JSONL file format."""
+        from google.genai import types
+
+        images = _load_images(request.image_paths)
+        if request.kind == "generate":
+            contents = self.generator._generation_contents(request.prompt, images or None)
+            modalities = ["IMAGE", "TEXT"]
+        else:
+            parts = [types.Part.from_text(
+                text=self.config.evaluation_prompt_template.format(target_prompt=request.prompt)
+            )]
+            for image in images:
+                data, mime_type = self.evaluation_encoder.encode(image)
+                parts.append(types.Part.from_bytes(data=data, mime_type=mime_type))
+            contents = [types.Content(role="user", parts=parts)]
+            modalities = ["TEXT"]
+        return json.dumps({
+            "key": request.key,
+            "request": {
+                "contents": [content.model_dump(mode="json", exclude_none=True) for content in contents],
+                "generation_config": {"response_modalities": modalities},
+            },
+        })
+
+    @staticmethod
+    def _inline_request(line: str):
+        from google.genai import types
+
+        item = json.loads(line)
+        return types.InlinedRequest(
+            contents=[types.Content.model_validate(content) for content in item["request"]["contents"]],
+            metadata={"key": item["key"]},
+            config=types.GenerateContentConfig(**item["request"]["generation_config"]),
+        )
+
+    def _source(self, requests: List[BulkRequest], display_name: str):
+        """Inline requests, or the name of an uploaded JSONL file when too large.
+
+        Requests are streamed to a temporary file so that only one image is
+        decoded at a time and large submissions are never held in memory.
+        """
+        from google.genai import types
+
+        size = 0
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", suffix=".jsonl", delete=False) as f:
+            path = f.name
+            for request in requests:
+                line = self._request_line(request) + "\n"
+                f.write(line)
+                size += len(line)
+        try:
+            if size > self.inline_limit_bytes:
+                uploaded = self.client.files.upload(
+                    file=path, config=types.UploadFileConfig(display_name=display_name, mime_type="jsonl")
+                )
+                logger.info("📎 Uploaded %s as batch source %s (%d bytes)", display_name, uploaded.name, size)
+                return uploaded.name
+            with open(path, "r", encoding="utf-8") as f:
+                return [self._inline_request(line) for line in f]
+        finally:
+            os.unlink(path)
+
+    def submit(self, kind: str, requests: List[BulkRequest]) -> str:
+        model = self.config.generator_model if kind == "generate" else self.config.evaluator_model
+        display_name = f"banana-{kind}-{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        job = self.client.batches.create(
+            model=model,
+            src=self._source(requests, display_name),
+            config={"display_name": display_name},
+        )
+        self._requests[job.name] = requests
+        logger.info("📤 Submitted %s batch %s (%d requests)", kind, job.name, len(requests))
+        return job.name
+
+    def poll(self, batch_id: str) -> str:
+        job = self.client.batches.get(name=batch_id)
+        self._jobs[batch_id] = job
+        state = getattr(job.state, "name", str(job.state))
+        if state in self._DONE_STATES:
+            return BATCH_DONE
+        if state in self._FAILED_STATES:
+            return BATCH_FAILED
+        return BATCH_RUNNING
+
+    def _results(self, job, requests: List[BulkRequest]):
+        """``(key, error, response)`` for each result of a finished job."""
+        from google.genai import types
+
+        dest = job.dest
+        if dest is not None and dest.file_name:
+            # File-sourced jobs write their responses to a JSONL result file
+            for line in self.client.files.download(file=dest.file_name).decode("utf-8").splitlines():
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                response = item.get("response")
+                yield (
+                    item.get("key"),
+                    item.get("error"),
+                    types.GenerateContentResponse.model_validate(response) if response else None,
+                )
+            return
+        for index, item in enumerate((dest.inlined_responses if dest else None) or []):
+            # Responses keep submission order; metadata is the authoritative key
+            key = (item.metadata or {}).get("key") or (requests[index].key if index < len(requests) else None)
+            yield key, item.error, item.response
+
+    def collect(self, batch_id: str) -> Dict[str, Dict[str, Any]]:
+        from .models import GeminiModel
+
+        job = self._jobs.pop(batch_id, None) or self.client.batches.get(name=batch_id)
+        requests = self._requests.pop(batch_id)
+        by_key = {r.key: r for r in requests}
+        responses: Dict[str, Dict[str, Any]] = {}
+        for key, error, response in self._results(job, requests):
+            if key not in by_key:
+                continue
+            request = by_key[key]
+            if error or response is None:
+                responses[key] = {"error": str(error or "empty response")}
+            elif request.kind == "generate":
+                responses[key] = self._image_response(response)
+            else:
+                text = getattr(response, "text", "") or ""
+                responses[key] = {"evaluation": GeminiModel._parse_evaluation(text, request.prompt)}
+        return responses
+
+    @staticmethod
+    def _image_response(response) -> Dict[str, Any]:
+        for candidate in response.candidates or []:
+            for part in (candidate.content.parts if candidate.content else None) or []:
+                data = getattr(getattr(part, "inline_data", None), "data", None)
+                if data:
+                    if isinstance(data, str):
+                        data = base64.b64decode(data)
+                    return {"image": Image.open(BytesIO(data)).convert("RGB")}
+        return {"error": "No image data in batch response"}
+
+
+def run_batched(
+    transport: BatchTransport,
+    kind: str,
+    requests: List[BulkRequest],
+    batch_size: int = 500,
+    poll_interval: float = 30.0,
+    timeout: Optional[float] = None,
+) -> Dict[str, Dict[str, Any]]:
+    """Submit requests in chunks of ``batch_size`` and poll until all finish.
+
+    Requests of failed or timed-out submissions get an ``error`` response.
+    """
+    pending: Dict[str, List[BulkRequest]] = {}
+    for start in range(0, len(requests), max(1, batch_size)):
+        chunk = requests[start:start + max(1, batch_size)]
+        pending[transport.submit(kind, chunk)] = chunk
+
+    responses: Dict[str, Dict[str, Any]] = {}
+    deadline = time.monotonic() + timeout if timeout else None
+    while pending:
+        for batch_id in list(pending):
+            state = transport.poll(batch_id)
+            if state == BATCH_RUNNING:
+                continue
+            chunk = pending.pop(batch_id)
+            if state == BATCH_DONE:
+                responses.update(transport.collect(batch_id))
+            else:
+                logger.error("Batch %s failed", batch_id)
+            for request in chunk:
+                responses.setdefault(request.key, {"error": f"No response from batch {batch_id}"})
+        if pending:
+            if deadline and time.monotonic() > deadline:
+                for batch_id, chunk in pending.items():
+                    for request in chunk:
+                        responses[request.key] = {"error": f"Batch {batch_id} timed out"}
+                break
+            time.sleep(poll_interval)
+    return responses
+
+
+class BulkSession:
+    """Lockstep state of one manifest entry; images live on disk, not in memory."""
+
+    def __init__(self, entry: Dict[str, Any], config: Config, session_id: str):
+        self.key = entry["key"]
+        self.prompt = entry["prompt"]
+        self.input_paths = [str(p) for p in entry.get("images") or []]
+        max_iterations = entry.get("max_iterations")
+        success_threshold = entry.get("success_threshold")
+        self.max_iterations = config.default_max_iterations if max_iterations is None else max_iterations
+        self.success_threshold = config.success_threshold if success_threshold is None else success_threshold
+        self.session_id = session_id
+        self.session_dir = config.output_dir / session_id
+        self.started_at = datetime.now()
+        self.start = time.monotonic()
+        self.current_prompt = self.prompt
+        self.current_image_path: Optional[str] = None
+        self.pending_image_path: Optional[str] = None
+        self.history: List[Dict[str, Any]] = []
+        self.iteration = 0
+        self.done = False
+        self.success = False
+
+    def generation_request(self, config: Config) -> BulkRequest:
+        from .utils import enhance_prompt_with_feedback, prompt_char_budget
+
+        self.iteration += 1
+        if self.history:
+            feedback = self.history[-1].get("evaluation", {}).get("improvements")
+            if feedback and feedback.lower() not in ["none", "n/a", "none needed!"]:
+                self.current_prompt = enhance_prompt_with_feedback(
+                    original_prompt=self.prompt,
+                    feedback=feedback,
+                    iteration=self.iteration,
+                    previous_history=self.history,
+                    max_chars=prompt_char_budget(config.prompt_max_tokens, config.prompt_max_chars),
+                )
+        if self.current_image_path:
+            base = [self.current_image_path]
+        elif self.iteration == 1:
+            base = self.input_paths
+        else:
+            base = []
+        return BulkRequest(f"{self.key}#{self.iteration}:generate", "generate", self.current_prompt, base)
+
+    def accept_image(self, response: Dict[str, Any]) -> Optional[BulkRequest]:
+        """Store a generated image; returns the evaluation request, or None on error."""
+        from .utils import save_image, validate_image
+
+        image = response.get("image")
+        if image is None or not validate_image(image):
+            self._record({"error": response.get("error", "Generated image is invalid")})
+            return None
+        path = self.session_dir / f"iteration_{self.iteration:02d}.png"
+        save_image(image, path)
+        self.pending_image_path = str(path)
+        return BulkRequest(f"{self.key}#{self.iteration}:evaluate", "evaluate", self.prompt, [str(path)])
+
+    def accept_evaluation(self, response: Dict[str, Any]) -> None:
+        evaluation = response.get("evaluation")
+        if evaluation is None:
+            self._record({"error": response.get("error", "No evaluation returned")})
+            return
+        self.current_image_path = self.pending_image_path
+        self._record({"evaluation": evaluation, "image_path": self.current_image_path})
+        if evaluation["matches_intent"] and evaluation["confidence"] >= self.success_threshold:
+            self.success = True
+            self.done = True
+
+    def _record(self, data: Dict[str, Any]) -> None:
+        entry = {
+            "iteration": self.iteration,
+            "prompt_used": self.current_prompt,
+            "evaluation": data.get("evaluation", {"matches_intent": False, "confidence": 0.0, "improvements": ""}),
+            "image_path": data.get("image_path"),
+            "timestamp": datetime.now().isoformat(),
+        }
+        if "error" in data:
+            entry["error"] = data["error"]
+        self.history.append(entry)
+        if self.iteration >= self.max_iterations:
+            self.done = True
+
+    def best_entry(self) -> Optional[Dict[str, Any]]:
+        scored = [h for h in self.history if h.get("image_path")]
+        if not scored:
+            return None
+        if self.success:
+            return scored[-1]
+        return max(scored, key=lambda h: h["evaluation"]["confidence"])
+
+    def finish(self, config: Config) -> Dict[str, Any]:
+        """Write the session report and return the batch result record."""
+        best = self.best_entry()
+        confidence = best["evaluation"]["confidence"] if best else 0.0
+        report = {
+            "session_id": self.session_id,
+            "timestamp": self.started_at.isoformat(),
+            "original_prompt": self.prompt,
+            "config": {
+                "generator_model": config.generator_model,
+                "evaluator_model": config.evaluator_model,
+                "success_threshold": self.success_threshold,
+                "mode": "bulk",
+            },
+            "success": self.success,
+            "total_iterations": self.iteration,
+            "final_confidence": confidence,
+            "final_image_path": best["image_path"] if best else None,
+            "history": self.history,
+        }
+        report_path = self.session_dir / "session_report.json"
+        report_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, default=str)
+        if config.session_catalog:
+            try:
+                from .catalog import SessionCatalog
+                SessionCatalog.for_output_dir(config.output_dir).index_report(report, report_path)
+            except Exception as e:
+                logger.warning("Failed to index session in catalog: %s", e)
+
+        errors = [h["error"] for h in self.history if h.get("error")]
+        record = {
+            "key": self.key,
+            "prompt": self.prompt,
+            "success": self.success,
+            "iterations": self.iteration,
+            "confidence": confidence,
+            "final_image_path": report["final_image_path"],
+            "session_dir": str(self.session_dir),
+            "session_id": self.session_id,
+            "mode": "bulk",
+        }
+        if errors and best is None:
+            record["error"] = errors[-1]
+        record["duration_seconds"] = round(time.monotonic() - self.start, 3)
+        record["finished_at"] = datetime.now().isoformat()
+        return record
+
+
+def run_bulk(
+    manifest_path: Union[str, Path],
+    output_path: Union[str, Path],
+    config: Config,
+    transport: BatchTransport,
+    batch_size: int = 500,
+    poll_interval: float = 30.0,
+    round_timeout: Optional[float] = None,
+    on_result: Optional[Callable[[Dict[str, Any], BatchStats], None]] = None,
+) -> BatchStats:
+    """Run every unfinished manifest entry in lockstep rounds.
+
+    Each round submits one generation step for all active sessions, waits for
+    it, then submits one evaluation step. Sessions that succeed or run out of
+    iterations are written to ``output_path`` as soon as their round ends.
+
+    Args:
+        manifest_path: JSONL manifest of prompts
+        output_path: JSONL results file; entries already present are skipped
+        config: Configuration shared by all sessions
+        transport: Where batches are submitted
+        batch_size: Maximum requests per submission
+        poll_interval: Seconds between status polls
+        round_timeout: Give up on a step's submissions after this many seconds
+        on_result: Called with each finished record and the running stats
+
+    Returns:
+        Final BatchStats for this run
+    """
+    from .utils import sanitize_filename
+
+    stats = BatchStats(total=count_manifest_entries(manifest_path))
+    done = load_completed_keys(output_path)
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    sessions: Dict[str, BulkSession] = {}
+    for entry in iter_manifest(manifest_path):
+        if entry["key"] in done or entry["key"] in sessions:
+            stats.skipped += 1
+            continue
+        sessions[entry["key"]] = BulkSession(entry, config, f"{stamp}_{sanitize_filename(entry['key'])}")
+
+    def step(kind: str, requests: Dict[str, BulkRequest]) -> Dict[str, Dict[str, Any]]:
+        if not requests:
+            return {}
+        responses = run_batched(
+            transport, kind, list(requests.values()), batch_size, poll_interval, round_timeout
+        )
+        return {key: responses.get(request.key, {"error": "Missing response"}) for key, request in requests.items()}
+
+    with ResultWriter(output_path) as writer:
+        round_number = 0
+        while True:
+            active = [s for s in sessions.values() if not s.done]
+            if not active:
+                break
+            round_number += 1
+            logger.info("🔁 Bulk round %d: %d active session(s)", round_number, len(active))
+
+            generated = step("generate", {s.key: s.generation_request(config) for s in active})
+            evaluations = {}
+            for session in active:
+                request = session.accept_image(generated[session.key])
+                if request is not None:
+                    evaluations[session.key] = request
+
+            for key, response in step("evaluate", evaluations).items():
+                sessions[key].accept_evaluation(response)
+
+            for session in active:
+                if not session.done:
+                    continue
+                record = session.finish(config)
+                writer.write(record)
+                del sessions[session.key]
+                stats.processed += 1
+                if record.get("error"):
+                    stats.errors += 1
+                elif record["success"]:
+                    stats.succeeded += 1
+                else:
+                    stats.failed += 1
+                if on_result:
+                    on_result(record, stats)
+
+    logger.info(
+        "📦 Bulk run finished: %d processed in %d round(s), %d succeeded",
+        stats.processed, round_number, stats.succeeded,
+    )
+    return stats
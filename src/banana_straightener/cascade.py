@@ -0,0 +1,126 @@
+"""Evaluator cascade: a fast model scores every image, a strong one decides close calls.
+
+Most evaluations are clear passes or clear failures, and a cheap model gets
+those right. ``CascadeEvaluator`` sends each image to the fast model first
+and only escalates to the strong evaluator when the fast confidence is
+within ``margin`` of the success threshold (or the fast evaluation failed).
+Escalated images use the strong model's verdict. Both tiers' latencies, the
+escalation rate and how often the tiers agreed on the match verdict are
+recorded.
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from PIL import Image
+
+from .hedging import percentile
+from .metrics import Metrics
+from .models import BaseModel
+
+logger = logging.getLogger(__name__)
+
+TIERS = ("fast", "strong")
+
+
+def _failed(evaluation: Dict[str, Any]) -> bool:
+    return bool(evaluation.get("parse_failed")) or str(
+        evaluation.get("raw_feedback", "")
+    ).startswith("Evaluation failed")
+
+
+class CascadeEvaluator:
+    """Two-tier evaluator with escalation near the success threshold.
+
+    Used as the agent's evaluator: a plain wrapper offering the two
+    evaluation methods of a model (``evaluate_image`` and ``evaluate_images``).
+
+    Args:
+        fast: Cheap model asked first for every image
+        strong: Model whose verdict is used for escalated images
+        threshold: Default success threshold (``evaluate_image`` can override it)
+        margin: Fast confidences within this distance of the threshold escalate
+        metrics: Counters for ``cascade_evaluations``, ``cascade_escalations``,
+            ``cascade_comparisons`` (escalations where the fast tier gave a
+            usable verdict) and ``cascade_agreements``
+    """
+
+    def __init__(
+        self,
+        fast: BaseModel,
+        strong: BaseModel,
+        threshold: float = 0.85,
+        margin: float = 0.15,
+        metrics: Optional[Metrics] = None,
+    ):
+        self.fast = fast
+        self.strong = strong
+        self.threshold = threshold
+        self.margin = margin
+        self.metrics = metrics or Metrics()
+        self._latencies: Dict[str, List[float]] = {tier: [] for tier in TIERS}
+        self._lock = threading.Lock()
+
+    def _timed(self, tier: str, model: BaseModel, image, target_prompt, prompt_template):
+        start = time.perf_counter()
+        evaluation = model.evaluate_image(image, target_prompt, prompt_template=prompt_template)
+        with self._lock:
+            self._latencies[tier].append(time.perf_counter() - start)
+        return evaluation
+
+    def should_escalate(self, evaluation: Dict[str, Any], threshold: Optional[float] = None) -> bool:
+        threshold = self.threshold if threshold is None else threshold
+        return _failed(evaluation) or abs(evaluation["confidence"] - threshold) <= self.margin
+
+    def evaluate_image(
+        self,
+        image: Image.Image,
+        target_prompt: str,
+        prompt_template: Optional[str] = None,
+        success_threshold: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """Fast evaluation, replaced by the strong one when it is a close call."""
+        self.metrics.increment("cascade_evaluations")
+        fast = self._timed("fast", self.fast, image, target_prompt, prompt_template)
+        if not self.should_escalate(fast, success_threshold):
+            return {**fast, "cascade": {"tier": "fast"}}
+
+        logger.info("⚖️ Fast evaluator near threshold (%.2f), escalating", fast["confidence"])
+        self.metrics.increment("cascade_escalations")
+        strong = self._timed("strong", self.strong, image, target_prompt, prompt_template)
+        agreed = not _failed(fast) and fast["matches_intent"] == strong["matches_intent"]
+        if not _failed(fast):
+            self.metrics.increment("cascade_comparisons")
+            if agreed:
+                self.metrics.increment("cascade_agreements")
+        return {
+            **strong,
+            "cascade": {"tier": "strong", "fast_confidence": fast["confidence"], "agreed": agreed},
+        }
+
+    def evaluate_images(self, images: List[Image.Image], target_prompt: str, **kwargs) -> Dict[str, Any]:
+        """Comparative evaluations always go to the strong model."""
+        return self.strong.evaluate_images(images, target_prompt, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-tier call counts and latencies plus escalation and agreement rates."""
+        with self._lock:
+            latencies = {tier: list(values) for tier, values in self._latencies.items()}
+        tiers = {
+            tier: {
+                "calls": len(values),
+                "total_seconds": round(sum(values), 3),
+                "p50_seconds": percentile(values, 50),
+                "p95_seconds": percentile(values, 95),
+            }
+            for tier, values in latencies.items()
+        }
+        rates = self.metrics.snapshot()["rates"]
+        return {
+            "margin": self.margin,
+            "tiers": tiers,
+            "escalation_rate": rates.get("cascade_escalation_rate"),
+            "agreement_rate": rates.get("cascade_agreement_rate"),
+        }
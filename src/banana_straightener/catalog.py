@@ -0,0 +1,247 @@
+"""Indexed catalog of straightening sessions stored under the outputs directory.
+
+Every ``<session_id>/session_report.json`` written by the agent is also
+recorded in a SQLite database (``<output_dir>/sessions.sqlite``), so questions
+like "which sessions for this prompt succeeded" are answered by an indexed
+query instead of walking and parsing every report on disk. The catalog can be
+rebuilt from the reports at any time.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+CATALOG_FILENAME = "sessions.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    timestamp TEXT,
+    prompt TEXT NOT NULL,
+    success INTEGER NOT NULL,
+    total_iterations INTEGER,
+    final_confidence REAL,
+    generator_model TEXT,
+    evaluator_model TEXT,
+    success_threshold REAL,
+    total_seconds REAL,
+    session_dir TEXT,
+    report_path TEXT,
+    final_image_path TEXT,
+    indexed_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_prompt ON sessions (prompt);
+CREATE INDEX IF NOT EXISTS idx_sessions_timestamp ON sessions (timestamp);
+CREATE INDEX IF NOT EXISTS idx_sessions_success ON sessions (success, final_confidence);
+
+CREATE TABLE IF NOT EXISTS iterations (
+    session_id TEXT NOT NULL REFERENCES sessions (session_id) ON DELETE CASCADE,
+    iteration INTEGER NOT NULL,
+    matches_intent INTEGER,
+    confidence REAL,
+    prompt_used TEXT,
+    improvements TEXT,
+    image_path TEXT,
+    generation_seconds REAL,
+    evaluation_seconds REAL,
+    timestamp TEXT,
+    PRIMARY KEY (session_id, iteration)
+);
+"""
+
+
+def catalog_path(output_dir: Union[str, Path]) -> Path:
+    return Path(output_dir) / CATALOG_FILENAME
+
+
+def _session_row(report: Dict[str, Any], report_path: Optional[Path]) -> Tuple:
+    config = report.get("config") or {}
+    history = report.get("history") or []
+    total_seconds = sum(
+        sum((entry.get("timings") or {}).values()) for entry in history
+    ) or None
+    session_dir = str(report_path.parent) if report_path else report.get("session_dir")
+    return (
+        report["session_id"],
+        report.get("timestamp"),
+        report.get("original_prompt", ""),
+        int(bool(report.get("success"))),
+        report.get("total_iterations"),
+        report.get("final_confidence"),
+        config.get("generator_model"),
+        config.get("evaluator_model"),
+        config.get("success_threshold"),
+        total_seconds,
+        session_dir,
+        str(report_path) if report_path else None,
+        report.get("final_image_path"),
+        time.time(),
+    )
+
+
+def _iteration_rows(report: Dict[str, Any]) -> Iterator[Tuple]:
+    for entry in report.get("history") or []:
+        evaluation = entry.get("evaluation") or {}
+        timings = entry.get("timings") or {}
+        yield (
+            report["session_id"],
+            entry.get("iteration"),
+            int(bool(evaluation.get("matches_intent"))),
+            evaluation.get("confidence"),
+            entry.get("prompt_used"),
+            evaluation.get("improvements"),
+            entry.get("image_path"),
+            timings.get("generation_seconds"),
+            timings.get("evaluation_seconds"),
+            entry.get("timestamp"),
+        )
+
+
+def _load_report(path: str) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """Parse one report file; returns ``(path, None)`` if it is unreadable."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            report = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning("Skipping unreadable report %s: %s", path, e)
+        return path, None
+    if not isinstance(report, dict) or "session_id" not in report:
+        return path, None
+    return path, report
+
+
+class SessionCatalog:
+    """SQLite index over session reports."""
+
+    def __init__(self, db_path: Union[str, Path]):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.executescript(SCHEMA)
+
+    @classmethod
+    def for_output_dir(cls, output_dir: Union[str, Path]) -> "SessionCatalog":
+        return cls(catalog_path(output_dir))
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30.0)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    def _upsert(self, conn: sqlite3.Connection, report: Dict[str, Any], report_path: Optional[Path]) -> None:
+        conn.execute("DELETE FROM iterations WHERE session_id = ?", (report["session_id"],))
+        conn.execute(
+            "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            _session_row(report, report_path),
+        )
+        conn.executemany(
+            "INSERT OR REPLACE INTO iterations VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            list(_iteration_rows(report)),
+        )
+
+    def index_report(self, report: Dict[str, Any], report_path: Optional[Union[str, Path]] = None) -> None:
+        """Add or update a single session."""
+        with closing(self._connect()) as conn, conn:
+            self._upsert(conn, report, Path(report_path) if report_path else None)
+
+    def rebuild(self, output_dir: Union[str, Path], workers: Optional[int] = None) -> int:
+        """Re-index every ``session_report.json`` under ``output_dir``.
+
+        Reports are parsed in parallel worker processes and written in a single
+        transaction. Returns the number of sessions indexed.
+        """
+        paths = [str(p) for p in Path(output_dir).glob("*/session_report.json")]
+        if not paths:
+            return 0
+
+        workers = workers or min(32, os.cpu_count() or 1)
+        if workers > 1 and len(paths) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                parsed = list(pool.map(_load_report, paths, chunksize=max(1, len(paths) // (workers * 4))))
+        else:
+            parsed = [_load_report(p) for p in paths]
+
+        count = 0
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM iterations")
+            conn.execute("DELETE FROM sessions")
+            for path, report in parsed:
+                if report is None:
+                    continue
+                self._upsert(conn, report, Path(path))
+                count += 1
+        logger.info("🗂️ Indexed %d session(s) from %s", count, output_dir)
+        return count
+
+    def query(
+        self,
+        prompt: Optional[str] = None,
+        success: Optional[bool] = None,
+        min_confidence: Optional[float] = None,
+        since: Optional[str] = None,
+        limit: int = 50,
+    ) -> List[Dict[str, Any]]:
+        """Find sessions, newest first.
+
+        ``prompt`` is a case-insensitive substring match; ``since`` is an ISO
+        timestamp prefix such as ``2025-01-31``.
+        """
+        clauses, params = [], []
+        if prompt:
+            clauses.append("prompt LIKE ? ESCAPE '\\'")
+            escaped = prompt.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            params.append(f"%{escaped}%")
+        if success is not None:
+            clauses.append("success = ?")
+            params.append(int(success))
+        if min_confidence is not None:
+            clauses.append("final_confidence >= ?")
+            params.append(min_confidence)
+        if since:
+            clauses.append("timestamp >= ?")
+            params.append(since)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        params.append(limit)
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                f"SELECT * FROM sessions {where} ORDER BY timestamp DESC LIMIT ?", params
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """A session with its iterations, or None."""
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT * FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+            if row is None:
+                return None
+            session = dict(row)
+            session["iterations"] = [
+                dict(r) for r in conn.execute(
+                    "SELECT * FROM iterations WHERE session_id = ? ORDER BY iteration", (session_id,)
+                )
+            ]
+        return session
+
+    def stats(self) -> Dict[str, Any]:
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT COUNT(*) AS sessions, SUM(success) AS succeeded,"
+                " AVG(total_iterations) AS avg_iterations, AVG(final_confidence) AS avg_confidence"
+                " FROM sessions"
+            ).fetchone()
+        return {
+            "sessions": row["sessions"] or 0,
+            "succeeded": row["succeeded"] or 0,
+            "avg_iterations": row["avg_iterations"] or 0.0,
+            "avg_confidence": row["avg_confidence"] or 0.0,
+        }
@@ -1,26 +1,72 @@
 """Command-line interface for Banana Straightener."""
 
 import click
+from click.core import ParameterSource
+from dataclasses import replace
 from pathlib import Path
-from rich.console import Console
-from rich.progress import Progress, SpinnerColumn, TextColumn, BarColumn, TaskProgressColumn
-from rich.table import Table
-from rich.panel import Panel
-from rich.text import Text
-from PIL import Image
+import os
 import sys
-import webbrowser
 import logging
 
 from .agent import BananaStraightener
 from .config import Config
-from .utils import load_image
+from .preprocess import ImagePreprocessor
 from . import __version__
 
-console = Console()
+class _LazyConsole:
+    """Proxy that creates the rich Console on first use.
+
+    rich (and the tables, panels and progress bars used below) is imported
+    only by commands that print, keeping `straighten --help` fast.
+    """
+
+    _console = None
+
+    def _resolve(self):
+        if _LazyConsole._console is None:
+            from rich.console import Console
+            _LazyConsole._console = Console()
+        return _LazyConsole._console
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+
+console = _LazyConsole()
+
+def _cli_config(**fields) -> Config:
+    """``Config.from_env()`` with the command-line options the user passed applied on top.
+
+    Keywords are Config field names; each value is ``(option_name, value)``.
+    Options left at their click default do not override the environment.
+    """
+    ctx = click.get_current_context()
+    config = Config.from_env()
+    changes = {}
+    for field_name, (option, value) in fields.items():
+        if value is not None and ctx.get_parameter_source(option) not in (None, ParameterSource.DEFAULT):
+            changes[field_name] = value
+    if 'api_key' in changes:
+        # Like Config(api_key=...): the explicit key replaces GEMINI_API_KEY,
+        # and __post_init__ re-reads the GEMINI_API_KEYS pool
+        changes['api_keys'] = []
+    return replace(config, **changes) if changes else config
+
+def _explicit_max_iterations(config: Config):
+    """The iteration limit if the user set one (``--iterations`` or MAX_ITERATIONS).
+
+    None otherwise, so that the agent can apply a learned budget
+    (``ADAPTIVE_BUDGET=auto``) before falling back to the config default.
+    """
+    source = click.get_current_context().get_parameter_source('iterations')
+    if source not in (None, ParameterSource.DEFAULT) or os.getenv('MAX_ITERATIONS'):
+        return config.default_max_iterations
+    return None
 
 def show_banner():
     """Display the Banana Straightener banner."""
+    from rich.panel import Panel
+    from rich.text import Text
     banner = Text("🍌 BANANA STRAIGHTENER", style="bold yellow")
     subtitle = Text("Self-correcting image generation - iterate until it's right!", style="dim")
     console.print(Panel.fit(f"{banner}\n{subtitle}", border_style="yellow"))
@@ -64,15 +110,19 @@ def main(ctx, version, verbose):
               help='Gemini API key (or set GEMINI_API_KEY env var)')
 @click.option('--open', 'open_result', is_flag=True, 
               help='Open result directory when done')
-def generate(prompt, image, iterations, threshold, output, save_all, api_key, open_result):
+@click.option('--output-format', type=click.Choice(['text', 'jsonl']), default='text',
+              help='text (rich progress) or jsonl (one JSON event per line on stdout)')
+@click.option('--beam-width', type=int, default=0,
+              help='Keep this many candidates per round (beam search, text output only; default: greedy)')
+def generate(prompt, image, iterations, threshold, output, save_all, api_key, open_result, output_format, beam_width):
     """Generate or modify an image until it matches your prompt."""
+    if output_format == 'jsonl':
+        _generate_jsonl(prompt, image, iterations, threshold, output, save_all, api_key)
+        return
     
-    show_banner()
-    console.print(f"\n[bold]Target:[/bold] {prompt}")
-    if image:
-        img_list = list(image)
-        console.print(f"[dim]Starting from {len(img_list)} image(s)[/dim]")
-    console.print(f"[dim]Max iterations: {iterations} | Success threshold: {threshold:.0%}[/dim]\n")
+    from rich.panel import Panel
+    from rich.progress import Progress, SpinnerColumn, TextColumn, BarColumn, TaskProgressColumn
+    from rich.table import Table
     
     # Load configuration
     # Clamp values defensively
@@ -85,20 +135,32 @@ def generate(prompt, image, iterations, threshold, output, save_all, api_key, op
     except Exception:
         threshold = 0.85
 
-    config = Config(
-        api_key=api_key,
-        default_max_iterations=iterations,
-        success_threshold=threshold,
-        save_intermediates=save_all,
-        output_dir=Path(output)
+    config = _cli_config(
+        api_key=('api_key', api_key),
+        default_max_iterations=('iterations', iterations),
+        success_threshold=('threshold', threshold),
+        save_intermediates=('save_all', save_all),
+        output_dir=('output', Path(output)),
+        beam_width=('beam_width', max(0, beam_width)),
     )
+    iterations, threshold = config.default_max_iterations, config.success_threshold
+    max_iterations = _explicit_max_iterations(config)
+    
+    show_banner()
+    console.print(f"\n[bold]Target:[/bold] {prompt}")
+    if image:
+        img_list = list(image)
+        console.print(f"[dim]Starting from {len(img_list)} image(s)[/dim]")
+    if max_iterations is None and config.adaptive_budget == 'auto':
+        console.print(f"[dim]Max iterations: learned (default {iterations}) | Success threshold: {threshold:.0%}[/dim]\n")
+    else:
+        console.print(f"[dim]Max iterations: {iterations} | Success threshold: {threshold:.0%}[/dim]\n")
     
     # Load input image if provided
     input_images = []
     if image:
         try:
-            for img_path in image:
-                input_images.append(load_image(img_path))
+            input_images = ImagePreprocessor.for_config(config).load_many(list(image))
             console.print(f"✅ Loaded {len(input_images)} input image(s)")
         except Exception as e:
             console.print(f"[red]❌ Failed to load image(s): {e}[/red]")
@@ -133,14 +195,14 @@ def generate(prompt, image, iterations, threshold, output, save_all, api_key, op
             TextColumn("[progress.description]{task.description}"),
             BarColumn(),
             TaskProgressColumn(),
-            console=console,
+            console=console._resolve(),
         ) as progress:
             task = progress.add_task("🍌 Straightening your banana...", total=iterations)
             
             result = agent.straighten(
                 prompt=prompt,
                 input_images=input_images if input_images else None,
-                max_iterations=iterations,
+                max_iterations=max_iterations,
                 success_threshold=threshold,
                 callback=lambda i, img, eval: (
                     progress_callback(i, img, eval),
@@ -171,6 +233,12 @@ def generate(prompt, image, iterations, threshold, output, save_all, api_key, op
         summary_table.add_row("Status:", "[bold yellow]⚠️ Max iterations reached[/bold yellow]")
         summary_table.add_row("Best confidence:", f"{result.get('best_confidence', 0):.1%}")
         summary_table.add_row("Total iterations:", f"{result['iterations']}")
+    if result.get('beam'):
+        beam = result['beam']
+        summary_table.add_row(
+            "Beam calls:",
+            f"{beam['calls']['total']} (greedy baseline {beam['greedy_baseline_calls']})",
+        )
     
     summary_table.add_row("Output directory:", f"[link]{result['session_dir']}[/link]")
     if result.get('final_image_path'):
@@ -225,6 +293,64 @@ def generate(prompt, image, iterations, threshold, output, save_all, api_key, op
     
     console.print()
 
+def _generate_jsonl(prompt, image, iterations, threshold, output, save_all, api_key):
+    """Run `generate` emitting machine-readable JSON Lines events on stdout.
+
+    Every line is an object with ``event``, ``schema_version``, ``session_id``
+    and ``timestamp`` plus event-specific fields. No rich rendering happens.
+    """
+    import json
+    from datetime import datetime
+    from .agent import EVENT_SCHEMA_VERSION
+
+    session_id = None
+
+    def write_event(name, data):
+        record = {
+            'event': name,
+            'schema_version': EVENT_SCHEMA_VERSION,
+            'session_id': session_id,
+            'timestamp': datetime.now().isoformat(),
+        }
+        record.update(data)
+        sys.stdout.write(json.dumps(record, default=str) + "\n")
+        sys.stdout.flush()
+
+    try:
+        iterations = max(1, int(iterations))
+        threshold = max(0.0, min(1.0, float(threshold)))
+        config = _cli_config(
+            api_key=('api_key', api_key),
+            default_max_iterations=('iterations', iterations),
+            success_threshold=('threshold', threshold),
+            save_intermediates=('save_all', save_all),
+            output_dir=('output', Path(output)),
+        )
+        # Beam search does not emit events, so the stream always runs greedy
+        config = replace(config, beam_width=0)
+        iterations, threshold = config.default_max_iterations, config.success_threshold
+        input_images = ImagePreprocessor.for_config(config).load_many(list(image))
+        agent = BananaStraightener(config)
+    except Exception as e:
+        write_event('error', {'iteration': None, 'message': str(e), 'fatal': True})
+        sys.exit(1)
+
+    session_id = agent.session_id
+    try:
+        agent.straighten(
+            prompt=prompt,
+            input_images=input_images or None,
+            max_iterations=_explicit_max_iterations(config),
+            success_threshold=threshold,
+            on_event=write_event,
+        )
+    except KeyboardInterrupt:
+        write_event('error', {'iteration': None, 'message': 'Interrupted by user', 'fatal': True})
+        sys.exit(130)
+    except Exception as e:
+        write_event('error', {'iteration': None, 'message': str(e), 'fatal': True})
+        sys.exit(1)
+
 @main.command()
 @click.option('--port', '-p', type=int, default=7860, help='Port for web UI')
 @click.option('--share', is_flag=True, help='Create public shareable link')
@@ -238,10 +364,10 @@ def ui(port, share, api_key, no_browser):
     try:
         from .ui import launch_ui
         
-        config = Config(
-            api_key=api_key, 
-            gradio_port=port, 
-            gradio_share=share
+        config = _cli_config(
+            api_key=('api_key', api_key),
+            gradio_port=('port', port),
+            gradio_share=('share', share),
         )
         
         if not no_browser:
@@ -257,9 +383,517 @@ def ui(port, share, api_key, no_browser):
         console.print(f"[red]❌ Failed to start web UI: {e}[/red]")
         sys.exit(1)
 
+@main.command()
+@click.option('--host', default='127.0.0.1', help='Interface to bind (default: 127.0.0.1)')
+@click.option('--port', '-p', type=int, default=8000, help='Port for the job API (default: 8000)')
+@click.option('--workers', '-w', type=int, default=2, help='Concurrent jobs (default: 2)')
+@click.option('--max-queue', type=int, default=16,
+              help='Queued jobs before returning 429 (default: 16)')
+@click.option('--output', '-o', type=click.Path(), default='./outputs',
+              help='Output directory (default: ./outputs)')
+@click.option('--api-key', envvar='GEMINI_API_KEY', help='Gemini API key')
+def serve(host, port, workers, max_queue, output, api_key):
+    """Run a headless HTTP job API with Server-Sent Events progress."""
+    from .server import serve as run_server
+
+    config = _cli_config(api_key=('api_key', api_key), output_dir=('output', Path(output)))
+    if not config.api_key:
+        console.print("[red]❌ API key not found.[/red]")
+        console.print("[dim]💡 Set via environment: export GEMINI_API_KEY='your-key-here'[/dim]")
+        sys.exit(1)
+
+    show_banner()
+    console.print(f"🌐 Job API listening on http://{host}:{port}")
+    console.print(f"[dim]Workers: {workers} | Queue capacity: {max_queue}[/dim]\n")
+
+    try:
+        run_server(config, host=host, port=port, workers=workers, max_queue=max_queue)
+    except KeyboardInterrupt:
+        console.print("\n[yellow]⚠️ Server stopped[/yellow]")
+    except OSError as e:
+        console.print(f"[red]❌ Failed to start server: {e}[/red]")
+        sys.exit(1)
+
+def _format_eta(seconds):
+    if seconds is None:
+        return "--"
+    seconds = int(seconds)
+    hours, remainder = divmod(seconds, 3600)
+    minutes, seconds = divmod(remainder, 60)
+    return f"{hours}h {minutes:02d}m" if hours else f"{minutes}m {seconds:02d}s"
+
+@main.command()
+@click.argument('manifest', type=click.Path(exists=True, dir_okay=False))
+@click.option('--results', '-r', type=click.Path(dir_okay=False), default=None,
+              help='Results JSONL to append to (default: <output>/batch_results.jsonl)')
+@click.option('--concurrency', '-c', type=int, default=4, help='Jobs run in parallel (default: 4)')
+@click.option('--iterations', '-n', type=int, default=5,
+              help='Default maximum iterations per prompt (default: 5)')
+@click.option('--threshold', '-t', type=float, default=0.85,
+              help='Default success threshold 0.0-1.0 (default: 0.85)')
+@click.option('--output', '-o', type=click.Path(), default='./outputs',
+              help='Output directory (default: ./outputs)')
+@click.option('--shard', default=None,
+              help='Process only shard i of N (0-based, e.g. 0/4); results go to a per-shard file')
+@click.option('--steal', is_flag=True,
+              help='With --shard: claim jobs via lock files and help slower shards when done')
+@click.option('--save-all', is_flag=True, help='Save all intermediate images')
+@click.option('--api-key', envvar='GEMINI_API_KEY', help='Gemini API key')
+def batch(manifest, results, concurrency, iterations, threshold, output, shard, steal, save_all, api_key):
+    """Process a JSONL manifest of prompts, resuming where a previous run stopped."""
+    from rich.panel import Panel
+    from rich.progress import Progress, SpinnerColumn, TextColumn, BarColumn, TaskProgressColumn
+    from rich.table import Table
+    from .batch import parse_shard, run_batch, run_sharded_batch, shard_output_path
+
+    shard_spec = None
+    if shard:
+        try:
+            shard_spec = parse_shard(shard)
+        except ValueError as e:
+            console.print(f"[red]❌ {e}[/red]")
+            sys.exit(2)
+    elif steal:
+        console.print("[red]❌ --steal requires --shard[/red]")
+        sys.exit(2)
+
+    config = _cli_config(
+        api_key=('api_key', api_key),
+        default_max_iterations=('iterations', max(1, iterations)),
+        success_threshold=('threshold', max(0.0, min(1.0, threshold))),
+        save_intermediates=('save_all', save_all),
+        output_dir=('output', Path(output)),
+    )
+    output = str(config.output_dir)
+    if not config.api_key:
+        console.print("[red]❌ API key not found.[/red]")
+        console.print("[dim]💡 Set via environment: export GEMINI_API_KEY='your-key-here'[/dim]")
+        sys.exit(1)
+
+    if shard_spec:
+        results_dir = Path(results).parent if results else Path(output)
+        results_path = shard_output_path(results_dir, *shard_spec)
+    else:
+        results_path = Path(results) if results else Path(output) / "batch_results.jsonl"
+    show_banner()
+    console.print(f"\n[bold]Manifest:[/bold] {manifest}")
+    console.print(f"[dim]Results: {results_path} | Concurrency: {concurrency}[/dim]\n")
+
+    try:
+        with Progress(
+            SpinnerColumn(),
+            TextColumn("[progress.description]{task.description}"),
+            BarColumn(),
+            TaskProgressColumn(),
+            console=console._resolve(),
+        ) as progress:
+            task = progress.add_task("📦 Processing batch...", total=None)
+
+            def on_result(record, stats):
+                icon = "❌" if record.get('error') else ("✅" if record.get('success') else "⚠️")
+                progress.console.print(f"{icon} {record['prompt'][:60]}")
+                progress.update(
+                    task,
+                    total=max(1, stats.total - stats.skipped - stats.excluded),
+                    completed=stats.processed,
+                    description=(
+                        f"📦 {stats.throughput:.1f}/min | ETA {_format_eta(stats.eta_seconds)}"
+                    ),
+                )
+
+            if shard_spec:
+                stats = run_sharded_batch(
+                    manifest,
+                    results_path.parent,
+                    config,
+                    *shard_spec,
+                    concurrency=concurrency,
+                    steal=steal,
+                    on_result=on_result,
+                )
+            else:
+                stats = run_batch(
+                    manifest,
+                    results_path,
+                    config,
+                    concurrency=concurrency,
+                    on_result=on_result,
+                )
+    except KeyboardInterrupt:
+        console.print("\n[yellow]⚠️ Interrupted - re-run the same command to resume[/yellow]")
+        sys.exit(130)
+
+    summary_table = Table(show_header=False, box=None, padding=(0, 2))
+    summary_table.add_row("Processed:", str(stats.processed))
+    summary_table.add_row("Skipped (already done):", str(stats.skipped))
+    summary_table.add_row("Succeeded:", f"[green]{stats.succeeded}[/green]")
+    summary_table.add_row("Below threshold:", f"[yellow]{stats.failed}[/yellow]")
+    summary_table.add_row("Errors:", f"[red]{stats.errors}[/red]")
+    summary_table.add_row("Throughput:", f"{stats.throughput:.1f} prompts/min")
+    summary_table.add_row("Results:", f"[link]{results_path}[/link]")
+    console.print(Panel(summary_table, title="[bold]📦 Batch Results[/bold]", border_style="green"))
+
+@main.command('batch-merge')
+@click.argument('inputs', nargs=-1, required=True, type=click.Path(exists=True))
+@click.option('--merged', '-m', type=click.Path(dir_okay=False), default=None,
+              help='Merged results JSONL (default: batch_results.merged.jsonl next to the inputs)')
+def batch_merge(inputs, merged):
+    """Merge per-shard batch results (files or directories) into one summary."""
+    from rich.panel import Panel
+    from rich.table import Table
+    from .batch import merge_results
+
+    paths = []
+    for item in inputs:
+        item = Path(item)
+        if item.is_dir():
+            paths.extend(sorted(item.glob("batch_results.shard-*.jsonl")))
+        else:
+            paths.append(item)
+    if not paths:
+        console.print("[yellow]⚠️ No shard result files found[/yellow]")
+        sys.exit(1)
+
+    merged_path = Path(merged) if merged else paths[0].parent / "batch_results.merged.jsonl"
+    summary = merge_results(paths, merged_path)
+
+    summary_table = Table(show_header=False, box=None, padding=(0, 2))
+    summary_table.add_row("Shard files:", str(len(paths)))
+    summary_table.add_row("Prompts:", str(summary['total']))
+    summary_table.add_row("Succeeded:", f"[green]{summary['succeeded']}[/green]")
+    summary_table.add_row("Below threshold:", f"[yellow]{summary['below_threshold']}[/yellow]")
+    summary_table.add_row("Errors:", f"[red]{summary['errors']}[/red]")
+    summary_table.add_row("Success rate:", f"{summary['success_rate']:.1%}")
+    summary_table.add_row("Avg iterations:", f"{summary['avg_iterations']:.2f}")
+    summary_table.add_row("Session reports:", str(summary['session_reports_found']))
+    summary_table.add_row("Merged results:", f"[link]{merged_path}[/link]")
+    summary_table.add_row("Summary:", f"[link]{summary['summary_path']}[/link]")
+    console.print(Panel(summary_table, title="[bold]📦 Merged Batch[/bold]", border_style="green"))
+
+@main.command()
+@click.argument('manifest', type=click.Path(exists=True, dir_okay=False))
+@click.option('--results', '-r', type=click.Path(dir_okay=False), default=None,
+              help='Results JSONL to append to (default: <output>/bulk_results.jsonl)')
+@click.option('--iterations', '-n', type=int, default=5,
+              help='Default maximum iterations per prompt (default: 5)')
+@click.option('--threshold', '-t', type=float, default=0.85,
+              help='Default success threshold 0.0-1.0 (default: 0.85)')
+@click.option('--output', '-o', type=click.Path(), default='./outputs',
+              help='Output directory (default: ./outputs)')
+@click.option('--batch-size', type=int, default=500,
+              help='Maximum requests per batch submission (default: 500)')
+@click.option('--poll-interval', type=float, default=30.0,
+              help='Seconds between batch status checks (default: 30)')
+@click.option('--transport', type=click.Choice(['gemini', 'local']), default='gemini',
+              help='gemini: Batch API (cheaper, slow); local: direct calls in a thread pool')
+@click.option('--api-key', envvar='GEMINI_API_KEY', help='Gemini API key')
+def bulk(manifest, results, iterations, threshold, output, batch_size, poll_interval, transport, api_key):
+    """Run a manifest offline in lockstep rounds through batch submissions."""
+    from rich.panel import Panel
+    from rich.table import Table
+    from .bulk import GeminiBatchTransport, LocalBatchTransport, run_bulk
+
+    config = _cli_config(
+        api_key=('api_key', api_key),
+        default_max_iterations=('iterations', max(1, iterations)),
+        success_threshold=('threshold', max(0.0, min(1.0, threshold))),
+        output_dir=('output', Path(output)),
+    )
+    output = str(config.output_dir)
+    if not config.api_key:
+        console.print("[red]❌ API key not found.[/red]")
+        console.print("[dim]💡 Set via environment: export GEMINI_API_KEY='your-key-here'[/dim]")
+        sys.exit(1)
+
+    if transport == 'local':
+        from .models import GeminiModel
+        batch_transport = LocalBatchTransport(
+            GeminiModel(config.api_key, config.generator_model),
+            GeminiModel(config.api_key, config.evaluator_model),
+            evaluation_prompt_template=config.evaluation_prompt_template,
+        )
+    else:
+        batch_transport = GeminiBatchTransport(config)
+
+    results_path = Path(results) if results else Path(output) / "bulk_results.jsonl"
+    show_banner()
+    console.print(f"\n[bold]Manifest:[/bold] {manifest}")
+    console.print(f"[dim]Results: {results_path} | Transport: {transport} | Batch size: {batch_size}[/dim]\n")
+
+    def on_result(record, stats):
+        icon = "❌" if record.get('error') else ("✅" if record.get('success') else "⚠️")
+        console.print(f"{icon} {record['prompt'][:60]} ({record['iterations']} iterations)")
+
+    try:
+        stats = run_bulk(
+            manifest,
+            results_path,
+            config,
+            batch_transport,
+            batch_size=max(1, batch_size),
+            poll_interval=max(0.0, poll_interval),
+            on_result=on_result,
+        )
+    except KeyboardInterrupt:
+        console.print("\n[yellow]⚠️ Interrupted - re-run to resume; unfinished prompts restart from scratch[/yellow]")
+        sys.exit(130)
+
+    summary_table = Table(show_header=False, box=None, padding=(0, 2))
+    summary_table.add_row("Processed:", str(stats.processed))
+    summary_table.add_row("Skipped (already done):", str(stats.skipped))
+    summary_table.add_row("Succeeded:", f"[green]{stats.succeeded}[/green]")
+    summary_table.add_row("Below threshold:", f"[yellow]{stats.failed}[/yellow]")
+    summary_table.add_row("Errors:", f"[red]{stats.errors}[/red]")
+    summary_table.add_row("Results:", f"[link]{results_path}[/link]")
+    console.print(Panel(summary_table, title="[bold]📦 Bulk Results[/bold]", border_style="green"))
+
+def _default_queue_db(output):
+    return Path(output) / "jobs.sqlite"
+
+@main.command()
+@click.option('--concurrency', '-c', type=int, default=1, help='Worker processes (default: 1)')
+@click.option('--db', 'db_path', type=click.Path(), default=None,
+              help='Queue database (default: <output>/jobs.sqlite)')
+@click.option('--output', '-o', type=click.Path(), default='./outputs',
+              help='Output directory (default: ./outputs)')
+@click.option('--lease', type=float, default=300.0,
+              help='Seconds before an unresponsive job is re-queued (default: 300)')
+@click.option('--exit-when-empty', is_flag=True, help='Stop once the queue is drained')
+@click.option('--save-all', is_flag=True, help='Save all intermediate images')
+@click.option('--api-key', envvar='GEMINI_API_KEY', help='Gemini API key')
+def worker(concurrency, db_path, output, lease, exit_when_empty, save_all, api_key):
+    """Process jobs from the persistent queue."""
+    from .jobqueue import run_workers
+
+    config = _cli_config(
+        api_key=('api_key', api_key),
+        output_dir=('output', Path(output)),
+        save_intermediates=('save_all', save_all),
+    )
+    output = str(config.output_dir)
+    if not config.api_key:
+        console.print("[red]❌ API key not found.[/red]")
+        console.print("[dim]💡 Set via environment: export GEMINI_API_KEY='your-key-here'[/dim]")
+        sys.exit(1)
+
+    db_path = Path(db_path) if db_path else _default_queue_db(output)
+    console.print(f"🍌 Starting {max(1, concurrency)} worker(s) on {db_path}")
+    try:
+        run_workers(
+            db_path,
+            config,
+            concurrency=max(1, concurrency),
+            lease_seconds=lease,
+            exit_when_empty=exit_when_empty,
+        )
+    except KeyboardInterrupt:
+        console.print("\n[yellow]⚠️ Workers stopped[/yellow]")
+
+@main.group()
+def queue():
+    """Submit jobs to and inspect the persistent job queue."""
+
+@queue.command('submit')
+@click.argument('prompt')
+@click.option('--image', '-i', type=click.Path(exists=True), multiple=True,
+              help='Input image(s) to modify (repeat for multiple)')
+@click.option('--iterations', '-n', type=int, default=None, help='Maximum iterations')
+@click.option('--threshold', '-t', type=float, default=None, help='Success threshold 0.0-1.0')
+@click.option('--priority', type=int, default=0, help='Higher runs first (default: 0)')
+@click.option('--db', 'db_path', type=click.Path(), default=None,
+              help='Queue database (default: <output>/jobs.sqlite)')
+@click.option('--output', '-o', type=click.Path(), default='./outputs',
+              help='Output directory (default: ./outputs)')
+def queue_submit(prompt, image, iterations, threshold, priority, db_path, output):
+    """Add a job to the queue."""
+    from .jobqueue import JobQueue
+
+    job_queue = JobQueue(Path(db_path) if db_path else _default_queue_db(output))
+    job_id = job_queue.submit(
+        prompt,
+        image_paths=[str(Path(p).resolve()) for p in image],
+        max_iterations=iterations,
+        success_threshold=threshold,
+        priority=priority,
+    )
+    console.print(f"📥 Queued job [bold]{job_id}[/bold] (priority {priority})")
+
+@queue.command('status')
+@click.option('--db', 'db_path', type=click.Path(), default=None,
+              help='Queue database (default: <output>/jobs.sqlite)')
+@click.option('--output', '-o', type=click.Path(), default='./outputs',
+              help='Output directory (default: ./outputs)')
+@click.option('--window', type=float, default=60.0,
+              help='Throughput window in minutes (default: 60)')
+def queue_status(db_path, output, window):
+    """Show queue depth and throughput."""
+    from rich.table import Table
+    from .jobqueue import JobQueue
+
+    db_path = Path(db_path) if db_path else _default_queue_db(output)
+    if not db_path.exists():
+        console.print(f"[yellow]⚠️ No queue database at {db_path}[/yellow]")
+        return
+
+    stats = JobQueue(db_path).status(window_seconds=window * 60)
+    table = Table(title="Job Queue")
+    table.add_column("Metric", style="cyan", width=24)
+    table.add_column("Value", style="green")
+    for status_name, count in stats['counts'].items():
+        table.add_row(status_name.capitalize(), str(count))
+    table.add_row("Active workers", str(stats['active_workers']))
+    table.add_row(f"Finished (last {window:g} min)", str(stats['finished_in_window']))
+    table.add_row("Throughput", f"{stats['throughput_per_hour']:.1f} jobs/hour")
+    table.add_row("Avg job duration", f"{stats['avg_duration_seconds']:.1f}s")
+    console.print(table)
+
+@main.group()
+def sessions():
+    """Query the catalog of past sessions."""
+
+@sessions.command('list')
+@click.option('--prompt', '-p', default=None, help='Filter by prompt substring')
+@click.option('--success/--failed', default=None, help='Only successful / unsuccessful sessions')
+@click.option('--min-confidence', type=float, default=None, help='Minimum final confidence')
+@click.option('--since', default=None, help='Only sessions on/after this date (YYYY-MM-DD)')
+@click.option('--limit', '-n', type=int, default=20, help='Maximum rows (default: 20)')
+@click.option('--output', '-o', type=click.Path(), default='./outputs',
+              help='Output directory (default: ./outputs)')
+@click.option('--json', 'as_json', is_flag=True, help='Print JSON instead of a table')
+def sessions_list(prompt, success, min_confidence, since, limit, output, as_json):
+    """List sessions matching the given filters, newest first."""
+    from rich.table import Table
+    from .catalog import SessionCatalog, catalog_path
+
+    if not catalog_path(output).exists():
+        console.print(f"[yellow]⚠️ No session catalog in {output}[/yellow]")
+        console.print("[dim]💡 Build one with: straighten sessions rebuild[/dim]")
+        return
+
+    rows = SessionCatalog.for_output_dir(output).query(
+        prompt=prompt, success=success, min_confidence=min_confidence, since=since, limit=limit
+    )
+    if as_json:
+        import json
+        click.echo(json.dumps(rows, indent=2, default=str))
+        return
+
+    table = Table(title=f"Sessions ({len(rows)})")
+    table.add_column("Session", style="cyan")
+    table.add_column("When", style="dim")
+    table.add_column("Match", width=5)
+    table.add_column("Conf.", width=6)
+    table.add_column("Iter", width=4)
+    table.add_column("Prompt")
+    for row in rows:
+        table.add_row(
+            row['session_id'],
+            (row['timestamp'] or '')[:16].replace('T', ' '),
+            "✅" if row['success'] else "❌",
+            f"{row['final_confidence'] or 0:.0%}",
+            str(row['total_iterations']),
+            row['prompt'][:60],
+        )
+    console.print(table)
+
+@sessions.command('show')
+@click.argument('session_id')
+@click.option('--output', '-o', type=click.Path(), default='./outputs',
+              help='Output directory (default: ./outputs)')
+def sessions_show(session_id, output):
+    """Show one session and its iterations."""
+    from rich.panel import Panel
+    from rich.table import Table
+    from .catalog import SessionCatalog, catalog_path
+
+    session = SessionCatalog.for_output_dir(output).get(session_id) if catalog_path(output).exists() else None
+    if not session:
+        console.print(f"[red]❌ Session {session_id} not found[/red]")
+        sys.exit(1)
+
+    summary_table = Table(show_header=False, box=None, padding=(0, 2))
+    summary_table.add_row("Prompt:", session['prompt'])
+    summary_table.add_row("Status:", "✅ Success" if session['success'] else "⚠️ Max iterations reached")
+    summary_table.add_row("Confidence:", f"{session['final_confidence'] or 0:.1%}")
+    summary_table.add_row("Models:", f"{session['generator_model']} / {session['evaluator_model']}")
+    summary_table.add_row("Session dir:", f"[link]{session['session_dir']}[/link]")
+    if session['final_image_path']:
+        summary_table.add_row("Final image:", f"[link]{session['final_image_path']}[/link]")
+    console.print(Panel(summary_table, title=f"[bold]🍌 {session_id}[/bold]", border_style="yellow"))
+
+    progress_table = Table()
+    progress_table.add_column("Iter", style="cyan", width=4)
+    progress_table.add_column("Match", width=5)
+    progress_table.add_column("Confidence", width=10)
+    progress_table.add_column("Time", width=8)
+    progress_table.add_column("Next Steps", style="dim")
+    for it in session['iterations']:
+        seconds = (it['generation_seconds'] or 0) + (it['evaluation_seconds'] or 0)
+        improvements = it['improvements'] or ''
+        progress_table.add_row(
+            str(it['iteration']),
+            "✅" if it['matches_intent'] else "❌",
+            f"{it['confidence'] or 0:.1%}",
+            f"{seconds:.1f}s" if seconds else "-",
+            improvements[:50] + "..." if len(improvements) > 50 else improvements or "Looking good!",
+        )
+    console.print(progress_table)
+
+@sessions.command('rebuild')
+@click.option('--output', '-o', type=click.Path(exists=True, file_okay=False), default='./outputs',
+              help='Output directory (default: ./outputs)')
+@click.option('--workers', '-w', type=int, default=None, help='Parser processes (default: CPU count)')
+def sessions_rebuild(output, workers):
+    """Rebuild the catalog by parsing every session report on disk."""
+    from .catalog import SessionCatalog
+
+    with console.status("🗂️ Indexing session reports..."):
+        count = SessionCatalog.for_output_dir(output).rebuild(output, workers=workers)
+    console.print(f"✅ Indexed {count} session(s) into {Path(output) / 'sessions.sqlite'}")
+
+@main.group()
+def budget():
+    """Iteration budgets learned from past sessions."""
+
+@budget.command('suggest')
+@click.argument('prompt')
+@click.option('--with-images', is_flag=True, help='The prompt will be run with input images')
+@click.option('--output', '-o', type=click.Path(), default='./outputs',
+              help='Output directory (default: ./outputs)')
+def budget_suggest(prompt, with_images, output):
+    """Suggest max iterations and stop-early floors for a prompt."""
+    from rich.table import Table
+    from .budget import IterationBudget, budget_path
+
+    suggestion = IterationBudget(budget_path(output)).suggest(prompt, with_images)
+    if suggestion is None:
+        console.print(f"[yellow]⚠️ Not enough session history in {output} yet[/yellow]")
+        console.print("[dim]💡 Learn from existing reports with: straighten budget rebuild[/dim]")
+        return
+
+    table = Table(show_header=False, box=None, padding=(0, 2))
+    table.add_row("Max iterations:", str(suggestion['max_iterations']))
+    table.add_row("Based on:", f"{suggestion['sessions']} sessions ({suggestion['profile']})")
+    table.add_row("Success rate:", f"{suggestion['success_rate']:.0%}")
+    for iteration, floor in suggestion['stop_below'].items():
+        table.add_row(f"Stop after {iteration} if below:", f"{floor:.2f}")
+    console.print(table)
+
+@budget.command('rebuild')
+@click.option('--output', '-o', type=click.Path(exists=True, file_okay=False), default='./outputs',
+              help='Output directory (default: ./outputs)')
+def budget_rebuild(output):
+    """Relearn the iteration budget from every session report on disk."""
+    from .budget import IterationBudget, budget_path, iter_session_reports
+
+    with console.status("📈 Learning from session reports..."):
+        count = IterationBudget(budget_path(output)).rebuild(iter_session_reports(output))
+    console.print(f"✅ Learned from {count} session(s) into {budget_path(output)}")
+
 @main.command()
 def examples():
     """Show example prompts and usage patterns."""
+    from rich.panel import Panel
     show_banner()
     
     examples_content = """[bold]🎨 Example Prompts:[/bold]
@@ -308,6 +942,7 @@ straighten ui
 @main.command()
 def config():
     """Show current configuration and environment."""
+    from rich.table import Table
     show_banner()
     
     config_obj = Config.from_env()
@@ -321,10 +956,24 @@ def config():
     api_status = "✅ Set" if config_obj.api_key else "❌ Missing"
     api_source = config_obj.get_api_key_source()
     config_table.add_row("API Key", api_status, api_source)
+    if len(config_obj.api_keys) > 1:
+        config_table.add_row("API Key Pool", f"{len(config_obj.api_keys)} keys", "GEMINI_API_KEYS")
     
     # Models
     config_table.add_row("Generator Model", config_obj.generator_model, "Config")
     config_table.add_row("Evaluator Model", config_obj.evaluator_model, "Config")
+    if config_obj.evaluator_cascade:
+        config_table.add_row(
+            "Evaluator Cascade",
+            f"{config_obj.cascade_fast_model} (margin {config_obj.cascade_margin:g})",
+            "EVALUATOR_CASCADE",
+        )
+    if config_obj.generator_routing:
+        config_table.add_row(
+            "Draft Generator",
+            f"{config_obj.draft_generator_model} (until {config_obj.routing_switch_confidence:.0%})",
+            "GENERATOR_ROUTING",
+        )
     
     # Settings
     config_table.add_row("Max Iterations", str(config_obj.default_max_iterations), "Config")
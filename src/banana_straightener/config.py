@@ -1,20 +1,45 @@
 """Configuration management for Banana Straightener."""
 
 import os
-from dataclasses import dataclass
-from typing import Optional
+from dataclasses import dataclass, field
+from typing import List, Optional
 from pathlib import Path
-from dotenv import load_dotenv, find_dotenv
 
-# Load .env file from current directory or parent directories
-dotenv_path = find_dotenv()
-load_dotenv(dotenv_path)
+_dotenv_loaded = False
+
+
+def load_env() -> None:
+    """Load the nearest .env file into the environment (once per process).
+
+    Called on first real use (creating a Config) rather than at import time,
+    so importing the package has no filesystem side effects.
+    """
+    global _dotenv_loaded
+    if _dotenv_loaded:
+        return
+    from dotenv import load_dotenv, find_dotenv
+
+    # Load .env file from current directory or parent directories
+    load_dotenv(find_dotenv())
+    _dotenv_loaded = True
+
+
+def parse_api_keys(value: Optional[str]) -> List[str]:
+    """Split a comma/whitespace separated list of API keys."""
+    return [key for key in (value or "").replace(",", " ").split() if key]
+
 
 @dataclass
 class Config:
     """Configuration for Banana Straightener."""
     
     api_key: Optional[str] = None
+    # Several keys (GEMINI_API_KEYS) spread requests across their quotas; a
+    # key is benched for key_bench_seconds after a 429 (doubling on repeats).
+    # key_rpm_limit is each key's requests-per-minute quota, if known
+    api_keys: List[str] = field(default_factory=list)
+    key_bench_seconds: float = 30.0
+    key_rpm_limit: int = 0
     generator_model: str = "gemini-2.5-flash-image-preview"
     evaluator_model: str = "gemini-2.5-flash-image-preview"
     
@@ -22,6 +47,108 @@ class Config:
     success_threshold: float = 0.85
     save_intermediates: bool = False
     output_dir: Path = Path("./outputs")
+    session_catalog: bool = True  # Index session reports in <output_dir>/sessions.sqlite
+    
+    # Images kept in memory by straighten_iterative: "best_latest" spills the
+    # rest to disk, "all" keeps every iteration's image
+    history_retention: str = "best_latest"
+    history_thumbnail_size: int = 0  # Max edge of in-memory gallery thumbnails (0 = none)
+    
+    # Budget for feedback-enhanced generation prompts (0 = unlimited); tokens
+    # are estimated at four characters each and the tighter limit applies
+    prompt_max_tokens: int = 0
+    prompt_max_chars: int = 0
+    
+    # Loop detection on perceptual image hashes: images within
+    # unchanged_hash_distance bits of the previous one count as unchanged.
+    # After unchanged_streak_limit such iterations the next prompt switches to
+    # an alternative approach; unchanged_stop_streak > 0 stops the session.
+    unchanged_hash_distance: int = 4
+    unchanged_streak_limit: int = 2
+    unchanged_stop_streak: int = 0
+    
+    # Local checks before each evaluate call; failing images (tiny, blank,
+    # detail-free or, opt-in, identical to their base) are regenerated without
+    # paying for an evaluation, up to precheck_retries times per iteration.
+    # precheck_min_base_diff is a mean absolute grayscale difference, which a
+    # small local edit to a large image barely moves, so it defaults to off
+    precheck_enabled: bool = True
+    precheck_retries: int = 2
+    precheck_min_size: int = 32
+    precheck_min_stddev: float = 2.0
+    precheck_min_entropy: float = 0.5
+    precheck_min_base_diff: float = 0.0
+    
+    # Ask the generator to critique its own image in the same request; a
+    # separate evaluate call is made only when the self-reported confidence is
+    # within self_critique_margin of the success threshold
+    self_critique: bool = False
+    self_critique_margin: float = 0.1
+    
+    # When no iteration succeeds, rank the best_attempt_candidates
+    # highest-confidence images with one comparative evaluation and keep the
+    # winner as the best attempt (instead of the last image)
+    compare_best_attempts: bool = False
+    best_attempt_candidates: int = 3
+    
+    # Request evaluations as JSON validated against a response schema; the
+    # text format is still used when the structured response is unusable
+    structured_evaluation: bool = True
+    
+    # Input image preprocessing: longest edge (0 keeps the original size),
+    # resize filter, parallel decodes and preprocessed images cached in memory
+    input_max_size: int = 1024
+    input_resample: str = "lanczos"
+    input_workers: int = 4
+    input_cache_size: int = 32
+    
+    # Images sent for evaluation: longest edge (0 keeps the generated size),
+    # format (png, jpeg or webp) and quality for the lossy formats
+    evaluation_max_size: int = 0
+    evaluation_format: str = "png"
+    evaluation_quality: int = 90
+    
+    # Upload each distinct image once (Gemini Files API) and send file
+    # references instead of inline bytes; references are kept in
+    # output_dir/file_refs.json until they expire. Not used with a key pool
+    file_refs: bool = False
+    
+    # Hedge evaluation requests: when no response arrives within the
+    # hedge_percentile of recent evaluation latencies (after
+    # hedge_min_samples calls), send a duplicate and use the first answer
+    hedge_evaluations: bool = False
+    hedge_percentile: float = 95.0
+    hedge_min_samples: int = 10
+    
+    # Iteration budget learned from finished sessions (iteration_budget.json
+    # in output_dir): "off", "suggest" (learn and log/report suggestions) or
+    # "auto" (also use the suggested max_iterations when none is given and
+    # stop early below the learned confidence floor). budget_coverage is the
+    # share of past successes the suggested max_iterations must cover
+    adaptive_budget: str = "suggest"
+    budget_coverage: float = 0.9
+    
+    # Beam search over prompt refinements: keep the beam_width best states
+    # per round (0 or 1 keeps the greedy loop), expand each into
+    # beam_expansion refined prompts, run beam_concurrency expansions at once
+    beam_width: int = 0
+    beam_expansion: int = 2
+    beam_concurrency: int = 4
+    
+    # Evaluator cascade: cascade_fast_model scores every image and only those
+    # within cascade_margin of the success threshold go to evaluator_model
+    evaluator_cascade: bool = False
+    cascade_fast_model: str = "gemini-2.5-flash-lite"
+    cascade_margin: float = 0.15
+    
+    # Generator routing: draft_generator_model generates until an accepted
+    # image reaches routing_switch_confidence (or after
+    # routing_max_draft_iterations draft iterations; 0 = no limit), then
+    # generator_model takes over for the rest of the session
+    generator_routing: bool = False
+    draft_generator_model: str = "gemini-2.0-flash-preview-image-generation"
+    routing_switch_confidence: float = 0.6
+    routing_max_draft_iterations: int = 2
     
     evaluation_prompt_template: str = """
     Analyze this image and determine if it successfully shows: "{target_prompt}"
@@ -45,24 +172,80 @@ class Config:
     gradio_share: bool = False
     
     def __post_init__(self):
-        """Initialize configuration after dataclass creation."""
+        """Initialize configuration after dataclass creation.
+        
+        The output directory is not created here; it is created by whatever
+        first writes into it (session files, catalog, batch results).
+        """
         if not self.api_key:
+            load_env()
             self.api_key = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
+        if not self.api_keys:
+            load_env()
+            self.api_keys = parse_api_keys(os.getenv("GEMINI_API_KEYS"))
+        
+        self.api_keys = list(dict.fromkeys(k for k in self.api_keys if k))
+        if not self.api_key and self.api_keys:
+            self.api_key = self.api_keys[0]
+        elif self.api_key and self.api_keys and self.api_key not in self.api_keys:
+            self.api_keys.insert(0, self.api_key)
         
         self.output_dir = Path(self.output_dir)
-        self.output_dir.mkdir(parents=True, exist_ok=True)
     
     @classmethod
     def from_env(cls) -> "Config":
         """Create configuration from environment variables and .env files."""
+        load_env()
         return cls(
             api_key=os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY"),
+            api_keys=parse_api_keys(os.getenv("GEMINI_API_KEYS")),
+            key_bench_seconds=float(os.getenv("KEY_BENCH_SECONDS", "30")),
+            key_rpm_limit=int(os.getenv("KEY_RPM_LIMIT", "0")),
             generator_model=os.getenv("GENERATOR_MODEL", "gemini-2.5-flash-image-preview"),
             evaluator_model=os.getenv("EVALUATOR_MODEL", "gemini-2.5-flash-image-preview"),
             default_max_iterations=int(os.getenv("MAX_ITERATIONS", "5")),
             success_threshold=float(os.getenv("SUCCESS_THRESHOLD", "0.85")),
             save_intermediates=os.getenv("SAVE_INTERMEDIATES", "false").lower() == "true",
             output_dir=Path(os.getenv("OUTPUT_DIR", "./outputs")),
+            session_catalog=os.getenv("SESSION_CATALOG", "true").lower() == "true",
+            history_retention=os.getenv("HISTORY_RETENTION", "best_latest"),
+            history_thumbnail_size=int(os.getenv("HISTORY_THUMBNAIL_SIZE", "0")),
+            prompt_max_tokens=int(os.getenv("PROMPT_MAX_TOKENS", "0")),
+            prompt_max_chars=int(os.getenv("PROMPT_MAX_CHARS", "0")),
+            unchanged_hash_distance=int(os.getenv("UNCHANGED_HASH_DISTANCE", "4")),
+            unchanged_streak_limit=int(os.getenv("UNCHANGED_STREAK_LIMIT", "2")),
+            unchanged_stop_streak=int(os.getenv("UNCHANGED_STOP_STREAK", "0")),
+            precheck_enabled=os.getenv("PRECHECK_ENABLED", "true").lower() == "true",
+            precheck_retries=int(os.getenv("PRECHECK_RETRIES", "2")),
+            precheck_min_base_diff=float(os.getenv("PRECHECK_MIN_BASE_DIFF", "0")),
+            self_critique=os.getenv("SELF_CRITIQUE", "false").lower() == "true",
+            self_critique_margin=float(os.getenv("SELF_CRITIQUE_MARGIN", "0.1")),
+            compare_best_attempts=os.getenv("COMPARE_BEST_ATTEMPTS", "false").lower() == "true",
+            best_attempt_candidates=int(os.getenv("BEST_ATTEMPT_CANDIDATES", "3")),
+            structured_evaluation=os.getenv("STRUCTURED_EVALUATION", "true").lower() == "true",
+            input_max_size=int(os.getenv("INPUT_MAX_SIZE", "1024")),
+            input_resample=os.getenv("INPUT_RESAMPLE", "lanczos"),
+            input_workers=int(os.getenv("INPUT_WORKERS", "4")),
+            input_cache_size=int(os.getenv("INPUT_CACHE_SIZE", "32")),
+            evaluation_max_size=int(os.getenv("EVALUATION_MAX_SIZE", "0")),
+            evaluation_format=os.getenv("EVALUATION_FORMAT", "png").lower(),
+            evaluation_quality=int(os.getenv("EVALUATION_QUALITY", "90")),
+            file_refs=os.getenv("FILE_REFS", "false").lower() == "true",
+            hedge_evaluations=os.getenv("HEDGE_EVALUATIONS", "false").lower() == "true",
+            hedge_percentile=float(os.getenv("HEDGE_PERCENTILE", "95")),
+            hedge_min_samples=int(os.getenv("HEDGE_MIN_SAMPLES", "10")),
+            adaptive_budget=os.getenv("ADAPTIVE_BUDGET", "suggest").lower(),
+            budget_coverage=float(os.getenv("BUDGET_COVERAGE", "0.9")),
+            beam_width=int(os.getenv("BEAM_WIDTH", "0")),
+            beam_expansion=int(os.getenv("BEAM_EXPANSION", "2")),
+            beam_concurrency=int(os.getenv("BEAM_CONCURRENCY", "4")),
+            evaluator_cascade=os.getenv("EVALUATOR_CASCADE", "false").lower() == "true",
+            cascade_fast_model=os.getenv("CASCADE_FAST_MODEL", "gemini-2.5-flash-lite"),
+            cascade_margin=float(os.getenv("CASCADE_MARGIN", "0.15")),
+            generator_routing=os.getenv("GENERATOR_ROUTING", "false").lower() == "true",
+            draft_generator_model=os.getenv("DRAFT_GENERATOR_MODEL", "gemini-2.0-flash-preview-image-generation"),
+            routing_switch_confidence=float(os.getenv("ROUTING_SWITCH_CONFIDENCE", "0.6")),
+            routing_max_draft_iterations=int(os.getenv("ROUTING_MAX_DRAFT_ITERATIONS", "2")),
             gradio_port=int(os.getenv("GRADIO_PORT", "7860")),
             gradio_share=os.getenv("GRADIO_SHARE", "false").lower() == "true",
         )
@@ -73,6 +256,7 @@ class Config:
             return "Not found"
         
         # Check if .env file exists and contains the API key
+        from dotenv import find_dotenv
         dotenv_path = find_dotenv()
         if dotenv_path:
             try:
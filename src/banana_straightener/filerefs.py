@@ -0,0 +1,214 @@
+"""Upload-once file references for images reused across requests.
+
+A generated image is sent inline for its evaluation and again as the base
+image of the next generation, and multi-image edits resend every input image
+on every iteration. With a ``FileRefStore`` the model uploads each distinct
+image once (keyed by content hash) and later requests refer to the upload
+instead of carrying the bytes.
+
+Uploaded files expire (Gemini keeps them for 48 hours), so every reference
+records its expiry and is re-uploaded shortly before it lapses. The mapping
+can be persisted to a JSON file so that later sessions reuse live uploads.
+Uploads belong to the API key that made them, so the mapping is namespaced
+by key.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass
+from io import BytesIO
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple, Union
+
+from .keypool import key_label
+from .metrics import Metrics
+
+logger = logging.getLogger(__name__)
+
+FILE_REFS_FILENAME = "file_refs.json"
+# Gemini deletes uploaded files after 48 hours
+DEFAULT_FILE_TTL_SECONDS = 48 * 3600
+
+
+@dataclass
+class FileRef:
+    """An uploaded file usable as a request part until ``expires_at`` (epoch seconds)."""
+
+    uri: str
+    mime_type: str
+    expires_at: float
+    name: str = ""
+
+
+class GeminiUploader:
+    """Uploads through the Gemini Files API."""
+
+    def __init__(self, api_key: str, clock: Callable[[], float] = time.time):
+        self.api_key = api_key
+        self.clock = clock
+        self._client = None
+
+    def upload(self, data: bytes, mime_type: str) -> FileRef:
+        from google.genai import types
+
+        if self._client is None:
+            from google import genai as new_genai
+
+            self._client = new_genai.Client(api_key=self.api_key)
+        uploaded = self._client.files.upload(
+            file=BytesIO(data), config=types.UploadFileConfig(mime_type=mime_type)
+        )
+        expiration = getattr(uploaded, "expiration_time", None)
+        expires_at = expiration.timestamp() if expiration else self.clock() + DEFAULT_FILE_TTL_SECONDS
+        return FileRef(uploaded.uri, uploaded.mime_type or mime_type, expires_at, uploaded.name or "")
+
+
+class LocalUploader:
+    """Stand-in upload service that stores files in a directory.
+
+    Returns ``file://`` references with a fixed lifetime. Useful for tests and
+    for measuring how often images would be uploaded.
+    """
+
+    def __init__(self, root: Union[str, Path], ttl_seconds: float = DEFAULT_FILE_TTL_SECONDS,
+                 clock: Callable[[], float] = time.time):
+        self.root = Path(root)
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.uploads = 0
+
+    def upload(self, data: bytes, mime_type: str) -> FileRef:
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.uploads += 1
+        name = f"files/{hashlib.sha256(data).hexdigest()[:16]}-{self.uploads}"
+        path = self.root / name.replace("/", "_")
+        path.write_bytes(data)
+        return FileRef(path.resolve().as_uri(), mime_type, self.clock() + self.ttl_seconds, name)
+
+
+class FileRefStore:
+    """Content hash -> uploaded file reference, with expiry handling.
+
+    Args:
+        uploader: Object with ``upload(data, mime_type) -> FileRef``
+        namespace: Prefix for stored keys (uploads are only valid for the key
+            that made them)
+        path: Optional JSON file the mapping is loaded from and saved to
+        refresh_margin: Re-upload references expiring within this many seconds
+        metrics: Default counters for ``file_ref_lookups``, ``file_ref_hits``,
+            ``file_ref_uploads`` and ``file_ref_expired`` (``ref_for`` can
+            direct them elsewhere)
+        clock: Time source (epoch seconds)
+    """
+
+    _shared: Dict[Tuple, "FileRefStore"] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(
+        self,
+        uploader,
+        namespace: str = "",
+        path: Optional[Union[str, Path]] = None,
+        refresh_margin: float = 600.0,
+        metrics: Optional[Metrics] = None,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.uploader = uploader
+        self.namespace = namespace
+        self.path = Path(path) if path else None
+        self.refresh_margin = refresh_margin
+        self.metrics = metrics or Metrics()
+        self.clock = clock
+        self._refs: Dict[str, FileRef] = self._load()
+        self._lock = threading.Lock()
+        # Per-digest locks so concurrent requests for one image upload it once
+        self._upload_locks: Dict[str, threading.Lock] = {}
+
+    @classmethod
+    def for_config(cls, config) -> "FileRefStore":
+        """Process-wide store for the config's API key, persisted in output_dir."""
+        path = Path(config.output_dir) / FILE_REFS_FILENAME
+        key = (config.api_key, str(path))
+        with cls._shared_lock:
+            if key not in cls._shared:
+                cls._shared[key] = cls(
+                    GeminiUploader(config.api_key), namespace=key_label(config.api_key), path=path
+                )
+            return cls._shared[key]
+
+    def _key(self, digest: str) -> str:
+        return f"{self.namespace}:{digest}" if self.namespace else digest
+
+    def _load(self) -> Dict[str, FileRef]:
+        if self.path is None:
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning("Ignoring unreadable file reference map %s: %s", self.path, e)
+            return {}
+        now = self.clock()
+        return {
+            key: FileRef(**ref) for key, ref in data.items()
+            if ref.get("expires_at", 0) - self.refresh_margin > now
+        }
+
+    def _save(self) -> None:
+        if self.path is None:
+            return
+        now = self.clock()
+        with self._lock:
+            live = {key: asdict(ref) for key, ref in self._refs.items() if ref.expires_at > now}
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(f".tmp{os.getpid()}.{threading.get_ident()}")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(live, f, indent=2, sort_keys=True)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logger.warning("Failed to save file reference map: %s", e)
+
+    def _live(self, key: str) -> Optional[FileRef]:
+        ref = self._refs.get(key)
+        if ref is not None and ref.expires_at - self.refresh_margin > self.clock():
+            return ref
+        return None
+
+    def ref_for(self, data: bytes, mime_type: str, metrics: Optional[Metrics] = None) -> FileRef:
+        """Reference for ``data``, uploading it unless a live upload exists."""
+        metrics = metrics or self.metrics
+        metrics.increment("file_ref_lookups")
+        key = self._key(hashlib.sha256(data).hexdigest())
+        with self._lock:
+            ref = self._live(key)
+            if ref is not None:
+                metrics.increment("file_ref_hits")
+                return ref
+            upload_lock = self._upload_locks.setdefault(key, threading.Lock())
+
+        with upload_lock:
+            with self._lock:
+                ref = self._live(key)  # uploaded by another thread meanwhile
+                if ref is not None:
+                    metrics.increment("file_ref_hits")
+                    return ref
+                expired = key in self._refs
+            if expired:
+                metrics.increment("file_ref_expired")
+            ref = self.uploader.upload(data, mime_type)
+            metrics.increment("file_ref_uploads")
+            with self._lock:
+                self._refs[key] = ref
+        self._save()
+        return ref
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._refs)
@@ -0,0 +1,153 @@
+"""Hedged requests: duplicate a slow call and take whichever answers first.
+
+Evaluation calls are small but their latency has a long tail, and one slow
+response stalls the whole iteration. ``RequestHedger`` tracks recent
+latencies; when a request has not answered within the configured percentile
+of them, an identical backup request is sent and the first successful
+response wins. HTTP calls already in flight cannot be interrupted, so the
+loser finishes in the background and its result is discarded.
+
+Calls that cannot be hedged yet run on the caller's thread. Otherwise the
+primary and the backup each get a thread of their own, started immediately:
+a shared, bounded pool would cap the whole process's evaluation concurrency
+and count time spent queued towards the hedge delay.
+"""
+
+import logging
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+from .metrics import Metrics
+
+logger = logging.getLogger(__name__)
+
+
+def percentile(values, pct: float) -> Optional[float]:
+    """Nearest-rank percentile (``pct`` in 0-100) of a sequence, or None if empty."""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+class RequestHedger:
+    """Runs calls with a backup request fired after a latency percentile.
+
+    Args:
+        percentile: Latency percentile (0-100) of recent calls after which
+            the backup request is sent
+        min_samples: Calls observed before hedging starts
+        window: Recent latencies kept for the percentile
+        min_delay: Never hedge sooner than this many seconds
+        metrics: Default counters for ``hedged_calls``, ``hedges_fired`` and
+            ``hedge_wins`` (``call`` can direct them elsewhere)
+    """
+
+    _shared: Dict[Tuple, "RequestHedger"] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(
+        self,
+        percentile: float = 95.0,
+        min_samples: int = 10,
+        window: int = 100,
+        min_delay: float = 0.0,
+        metrics: Optional[Metrics] = None,
+    ):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.metrics = metrics or Metrics()
+        self._latencies: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_config(cls, config) -> "RequestHedger":
+        """Process-wide hedger, so latency history carries over between sessions."""
+        key = (config.hedge_percentile, config.hedge_min_samples)
+        with cls._shared_lock:
+            if key not in cls._shared:
+                cls._shared[key] = cls(config.hedge_percentile, config.hedge_min_samples)
+            return cls._shared[key]
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def delay(self) -> Optional[float]:
+        """Seconds to wait before hedging, or None while there are too few samples."""
+        with self._lock:
+            if len(self._latencies) < max(1, self.min_samples):
+                return None
+            latencies = list(self._latencies)
+        return max(self.min_delay, percentile(latencies, self.percentile))
+
+    def _timed(self, func: Callable[[], Any]):
+        start = time.perf_counter()
+        result = func()
+        return result, time.perf_counter() - start
+
+    def _start(self, func: Callable[[], Any]) -> Future:
+        """Run ``func`` on a new thread; the future holds ``(result, seconds)``."""
+        future: Future = Future()
+
+        def run():
+            future.set_running_or_notify_cancel()
+            try:
+                future.set_result(self._timed(func))
+            except BaseException as e:
+                future.set_exception(e)
+
+        threading.Thread(target=run, name="hedge", daemon=True).start()
+        return future
+
+    def call(self, func: Callable[[], Any], metrics: Optional[Metrics] = None) -> Any:
+        """Run ``func`` (a request), hedging it if it is slower than usual."""
+        metrics = metrics or self.metrics
+        metrics.increment("hedged_calls")
+        delay = self.delay()
+        if delay is None:
+            result, elapsed = self._timed(func)
+            self.record(elapsed)
+            return result
+
+        primary = self._start(func)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            result, elapsed = primary.result()
+            self.record(elapsed)
+            return result
+
+        logger.debug("Request slower than %.2fs, sending a hedge", delay)
+        metrics.increment("hedges_fired")
+        backup = self._start(func)
+        pending = {primary, backup}
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = error or future.exception()
+                    continue
+                result, elapsed = future.result()
+                # Latency the caller saw (the slower request's is never known)
+                self.record(elapsed if future is primary else delay + elapsed)
+                if future is backup:
+                    metrics.increment("hedge_wins")
+                return result
+        raise error
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            latencies = list(self._latencies)
+        return {
+            "samples": len(latencies),
+            "p50_seconds": percentile(latencies, 50),
+            f"p{self.percentile:g}_seconds": percentile(latencies, self.percentile),
+            "hedge_delay_seconds": self.delay(),
+        }
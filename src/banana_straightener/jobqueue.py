@@ -0,0 +1,408 @@
+"""Persistent SQLite-backed job queue and worker pool.
+
+Jobs survive restarts and can be shared by several worker processes on one
+machine. The database runs in WAL mode so readers (``straighten queue
+status``) never block workers. A worker claims a job by taking a lease; if the
+worker dies, the lease expires and the job is handed to the next worker.
+"""
+
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    prompt TEXT NOT NULL,
+    image_paths TEXT NOT NULL DEFAULT '[]',
+    max_iterations INTEGER,
+    success_threshold REAL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker_id TEXT,
+    lease_expires REAL,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs (status, priority DESC, id);
+CREATE INDEX IF NOT EXISTS idx_jobs_finished ON jobs (finished_at);
+"""
+
+JOB_STATUSES = ("queued", "running", "completed", "failed")
+
+
+class JobQueue:
+    """Durable priority queue of straightening jobs stored in SQLite."""
+
+    def __init__(
+        self,
+        db_path: Union[str, Path],
+        lease_seconds: float = 300.0,
+        max_attempts: int = 3,
+    ):
+        self.db_path = Path(db_path)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        # Autocommit mode; transactions are opened explicitly where needed
+        conn = sqlite3.connect(self.db_path, timeout=30.0, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def submit(
+        self,
+        prompt: str,
+        image_paths: Optional[List[str]] = None,
+        max_iterations: Optional[int] = None,
+        success_threshold: Optional[float] = None,
+        priority: int = 0,
+    ) -> int:
+        """Add a job and return its id. Higher priority runs first."""
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "INSERT INTO jobs (prompt, image_paths, max_iterations, success_threshold,"
+                " priority, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    prompt,
+                    json.dumps([str(p) for p in image_paths or []]),
+                    max_iterations,
+                    success_threshold,
+                    priority,
+                    time.time(),
+                ),
+            )
+            return cursor.lastrowid
+
+    def claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """Lease the next runnable job, or return None if there is none.
+
+        Runnable means queued, or running with an expired lease (the previous
+        worker is presumed dead).
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            self._expire_leases(conn, now)
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = 'queued'"
+                " ORDER BY priority DESC, id LIMIT 1"
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', worker_id = ?, lease_expires = ?,"
+                " attempts = attempts + 1, started_at = ? WHERE id = ?",
+                (worker_id, now + self.lease_seconds, now, row["id"]),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            # BEGIN itself may have failed (e.g. busy timeout); keep that error
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+        job = dict(row)
+        job["image_paths"] = json.loads(job["image_paths"])
+        job["attempts"] += 1
+        return job
+
+    def _expire_leases(self, conn: sqlite3.Connection, now: float) -> int:
+        """Re-queue running jobs whose lease has lapsed (fail them after max_attempts)."""
+        conn.execute(
+            "UPDATE jobs SET status = 'failed', finished_at = ?, worker_id = NULL,"
+            " error = 'Lease expired too many times'"
+            " WHERE status = 'running' AND lease_expires < ? AND attempts >= ?",
+            (now, now, self.max_attempts),
+        )
+        cursor = conn.execute(
+            "UPDATE jobs SET status = 'queued', worker_id = NULL, lease_expires = NULL"
+            " WHERE status = 'running' AND lease_expires < ?",
+            (now,),
+        )
+        if cursor.rowcount:
+            logger.warning("♻️ Re-queued %d job(s) with expired leases", cursor.rowcount)
+        return cursor.rowcount
+
+    def requeue_expired(self) -> int:
+        """Re-queue jobs whose lease expired; returns the number re-queued."""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            count = self._expire_leases(conn, time.time())
+            conn.execute("COMMIT")
+            return count
+        finally:
+            conn.close()
+
+    def heartbeat(self, job_id: int, worker_id: str) -> bool:
+        """Extend the lease on a job; False if the worker no longer owns it."""
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE id = ? AND worker_id = ?"
+                " AND status = 'running'",
+                (time.time() + self.lease_seconds, job_id, worker_id),
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, job_id: int, worker_id: str, result: Dict[str, Any]) -> bool:
+        """Record a job's result."""
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'completed', finished_at = ?, result = ?,"
+                " lease_expires = NULL, error = NULL WHERE id = ? AND worker_id = ?",
+                (time.time(), json.dumps(result, default=str), job_id, worker_id),
+            )
+            return cursor.rowcount == 1
+
+    def fail(self, job_id: int, worker_id: str, error: str) -> bool:
+        """Re-queue a failed job, or mark it failed once attempts are used up."""
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END,"
+                " finished_at = CASE WHEN attempts >= ? THEN ? ELSE NULL END,"
+                " worker_id = NULL, lease_expires = NULL, error = ?"
+                " WHERE id = ? AND worker_id = ?",
+                (self.max_attempts, self.max_attempts, time.time(), error, job_id, worker_id),
+            )
+            return cursor.rowcount == 1
+
+    def get(self, job_id: int) -> Optional[Dict[str, Any]]:
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["image_paths"] = json.loads(job["image_paths"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def status(self, window_seconds: float = 3600.0) -> Dict[str, Any]:
+        """Queue depth per status plus throughput over the recent window."""
+        now = time.time()
+        with closing(self._connect()) as conn:
+            counts = {s: 0 for s in JOB_STATUSES}
+            for row in conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status"):
+                counts[row["status"]] = row["n"]
+            recent = conn.execute(
+                "SELECT COUNT(*) AS n, AVG(finished_at - started_at) AS avg_duration"
+                " FROM jobs WHERE status IN ('completed', 'failed') AND finished_at >= ?",
+                (now - window_seconds,),
+            ).fetchone()
+            workers = conn.execute(
+                "SELECT COUNT(DISTINCT worker_id) AS n FROM jobs"
+                " WHERE status = 'running' AND lease_expires >= ?",
+                (now,),
+            ).fetchone()["n"]
+
+        finished = recent["n"] or 0
+        return {
+            "counts": counts,
+            "depth": counts["queued"],
+            "active_workers": workers,
+            "window_seconds": window_seconds,
+            "finished_in_window": finished,
+            "throughput_per_hour": finished * 3600.0 / window_seconds if window_seconds else 0.0,
+            "avg_duration_seconds": recent["avg_duration"] or 0.0,
+        }
+
+
+def _default_agent_factory(config: Config, session_id: str):
+    from .agent import BananaStraightener
+
+    return BananaStraightener(config, session_id=session_id)
+
+
+class _LeaseKeeper(threading.Thread):
+    """Renews a job's lease from a background thread while the job runs.
+
+    Iterations (and beam rounds) can take longer than the lease, so the lease
+    is renewed on a timer rather than from the agent's callbacks. ``lost`` is
+    set once a renewal finds that the job belongs to another worker.
+    """
+
+    def __init__(self, queue: "JobQueue", job_id: int, worker_id: str):
+        super().__init__(name=f"lease-job{job_id}", daemon=True)
+        self.queue = queue
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.interval = max(queue.lease_seconds / 3, 0.01)
+        self.lost = threading.Event()
+        self._stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            try:
+                renewed = self.queue.heartbeat(self.job_id, self.worker_id)
+            except sqlite3.Error as e:
+                # Transient (e.g. a locked database); the next renewal retries
+                logger.warning("Lease renewal for job %s failed: %s", self.job_id, e)
+                continue
+            if not renewed:
+                logger.warning("Lost the lease on job %s; another worker owns it", self.job_id)
+                self.lost.set()
+                return
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self.join()
+
+
+def run_job(
+    queue: JobQueue,
+    job: Dict[str, Any],
+    config: Config,
+    worker_id: str,
+    agent_factory: Optional[Callable[[Config, str], Any]] = None,
+) -> bool:
+    """Run one claimed job through ``straighten`` and write the result back.
+
+    Returns False if the job failed or the worker lost its lease (the result
+    is then discarded; the job belongs to whichever worker re-claimed it).
+    """
+    from .preprocess import ImagePreprocessor
+
+    agent_factory = agent_factory or _default_agent_factory
+    session_id = f"{time.strftime('%Y%m%d_%H%M%S')}_job{job['id']}"
+
+    lease = _LeaseKeeper(queue, job["id"], worker_id)
+    lease.start()
+    try:
+        images = ImagePreprocessor.for_config(config).load_many(job["image_paths"])
+        agent = agent_factory(config, session_id)
+        result = agent.straighten(
+            prompt=job["prompt"],
+            input_images=images or None,
+            max_iterations=job["max_iterations"],
+            success_threshold=job["success_threshold"],
+        )
+    except Exception as e:
+        lease.stop()
+        logger.error("Job %s failed: %s", job["id"], e)
+        if not queue.fail(job["id"], worker_id, str(e)):
+            logger.warning("Lost the lease on job %s; failure not recorded", job["id"])
+        return False
+    lease.stop()
+
+    summary = {
+        "success": result["success"],
+        "iterations": result["iterations"],
+        "confidence": result.get("confidence", result.get("best_confidence", 0.0)),
+        "final_image_path": result.get("final_image_path"),
+        "session_dir": result.get("session_dir"),
+        "session_id": result.get("session_id"),
+    }
+    if lease.lost.is_set() or not queue.complete(job["id"], worker_id, summary):
+        logger.warning("Lost the lease on job %s; discarding its result", job["id"])
+        return False
+    logger.info("✅ Job %s finished (success=%s)", job["id"], summary["success"])
+    return True
+
+
+def worker_loop(
+    db_path: Union[str, Path],
+    config: Config,
+    worker_id: Optional[str] = None,
+    lease_seconds: float = 300.0,
+    poll_interval: float = 2.0,
+    exit_when_empty: bool = False,
+    agent_factory: Optional[Callable[[Config, str], Any]] = None,
+) -> int:
+    """Claim and run jobs until interrupted (or until the queue drains).
+
+    Returns the number of jobs processed.
+    """
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    queue = JobQueue(db_path, lease_seconds=lease_seconds)
+    processed = 0
+
+    while True:
+        job = queue.claim(worker_id)
+        if job is None:
+            if exit_when_empty:
+                return processed
+            time.sleep(poll_interval)
+            continue
+        logger.info("🍌 Worker %s claimed job %s", worker_id, job["id"])
+        run_job(queue, job, config, worker_id, agent_factory)
+        processed += 1
+
+
+def _worker_process(db_path, config, index, lease_seconds, poll_interval, exit_when_empty):
+    """Entry point for child worker processes."""
+    try:
+        worker_loop(
+            db_path,
+            config,
+            worker_id=f"{socket.gethostname()}:{os.getpid()}:{index}",
+            lease_seconds=lease_seconds,
+            poll_interval=poll_interval,
+            exit_when_empty=exit_when_empty,
+        )
+    except KeyboardInterrupt:
+        pass
+
+
+def run_workers(
+    db_path: Union[str, Path],
+    config: Config,
+    concurrency: int = 1,
+    lease_seconds: float = 300.0,
+    poll_interval: float = 2.0,
+    exit_when_empty: bool = False,
+) -> None:
+    """Run ``concurrency`` worker processes against the queue."""
+    if concurrency <= 1:
+        worker_loop(
+            db_path,
+            config,
+            lease_seconds=lease_seconds,
+            poll_interval=poll_interval,
+            exit_when_empty=exit_when_empty,
+        )
+        return
+
+    processes = [
+        multiprocessing.Process(
+            target=_worker_process,
+            args=(str(db_path), config, i, lease_seconds, poll_interval, exit_when_empty),
+            name=f"straighten-worker-{i}",
+        )
+        for i in range(concurrency)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
+        raise
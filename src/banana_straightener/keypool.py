@@ -0,0 +1,269 @@
+"""Spread Gemini requests across several API keys.
+
+A single key's quota caps throughput no matter how many workers run. With
+``GEMINI_API_KEYS`` set, models talk to a ``PooledClient`` that picks a key
+per request from a process-wide ``KeyPool``: keys with more remaining
+per-minute quota, fewer requests in flight and fewer recent errors are
+preferred, and a key that answers 429 is benched for a while (doubling on
+repeated 429s) while the request is retried on another key.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+from .metrics import Metrics
+
+logger = logging.getLogger(__name__)
+
+# Recent outcomes per key used for the error rate
+ERROR_WINDOW = 20
+# Longest bench, however many 429s in a row
+MAX_BENCH_SECONDS = 600.0
+
+
+def key_label(api_key: str) -> str:
+    """Loggable identifier for a key (never the key itself)."""
+    return f"key-{api_key[-4:]}" if len(api_key) > 8 else "key-****"
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """True for quota/rate-limit failures (HTTP 429, RESOURCE_EXHAUSTED)."""
+    if getattr(error, "code", None) == 429 or getattr(error, "status_code", None) == 429:
+        return True
+    text = str(error)
+    return "429" in text or "RESOURCE_EXHAUSTED" in text
+
+
+class KeyState:
+    """Usage and health of one API key."""
+
+    def __init__(self, api_key: str):
+        self.api_key = api_key
+        self.label = key_label(api_key)
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.consecutive_rate_limits = 0
+        self.benched_until = 0.0
+        self.recent: Deque[bool] = deque(maxlen=ERROR_WINDOW)  # True = error
+        self.minute: Deque[float] = deque()  # request start times in the last 60s
+
+    @property
+    def error_rate(self) -> float:
+        return sum(self.recent) / len(self.recent) if self.recent else 0.0
+
+    def to_dict(self, now: float) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "rate_limited": self.rate_limited,
+            "in_flight": self.in_flight,
+            "error_rate": round(self.error_rate, 3),
+            "benched_seconds": round(max(0.0, self.benched_until - now), 1),
+        }
+
+
+class KeyPool:
+    """Chooses an API key per request and benches rate-limited keys.
+
+    Args:
+        api_keys: Keys to balance across (duplicates are ignored)
+        bench_seconds: Bench length after a first 429; doubles per repeat
+        rpm_limit: Requests per minute allowed per key (0 = unknown), used to
+            prefer keys with more remaining quota
+        clock: Time source (for tests)
+    """
+
+    _shared: Dict[Tuple, "KeyPool"] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(
+        self,
+        api_keys: List[str],
+        bench_seconds: float = 30.0,
+        rpm_limit: int = 0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        keys = list(dict.fromkeys(k for k in api_keys if k))
+        if not keys:
+            raise ValueError("KeyPool needs at least one API key")
+        self.keys = [KeyState(k) for k in keys]
+        self.bench_seconds = bench_seconds
+        self.rpm_limit = rpm_limit
+        self._clock = clock
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_config(cls, config) -> "KeyPool":
+        """Process-wide pool for a config's keys, shared by every agent and worker thread."""
+        key = (tuple(config.api_keys), config.key_bench_seconds, config.key_rpm_limit)
+        with cls._shared_lock:
+            if key not in cls._shared:
+                cls._shared[key] = cls(list(config.api_keys), config.key_bench_seconds, config.key_rpm_limit)
+            return cls._shared[key]
+
+    def _score(self, state: KeyState, now: float) -> Tuple:
+        while state.minute and now - state.minute[0] > 60.0:
+            state.minute.popleft()
+        remaining = self.rpm_limit - len(state.minute) - state.in_flight if self.rpm_limit else float("inf")
+        # Higher is better: keys with quota left first, then healthy, then idle
+        return (remaining > 0, -round(state.error_rate, 1), remaining, -state.in_flight, -state.requests)
+
+    def acquire(self) -> Optional[KeyState]:
+        """Reserve the best available key, or None if all are benched."""
+        with self._lock:
+            now = self._clock()
+            available = [s for s in self.keys if s.benched_until <= now]
+            if not available:
+                return None
+            state = max(available, key=lambda s: self._score(s, now))
+            state.in_flight += 1
+            state.requests += 1
+            state.minute.append(now)
+            return state
+
+    def release(self, state: KeyState, error: Optional[BaseException] = None) -> bool:
+        """Record a request's outcome; returns True if the key was benched."""
+        with self._lock:
+            state.in_flight = max(0, state.in_flight - 1)
+            state.recent.append(error is not None)
+            if error is None:
+                state.consecutive_rate_limits = 0
+                return False
+            state.errors += 1
+            if not is_rate_limit_error(error):
+                return False
+            state.rate_limited += 1
+            state.consecutive_rate_limits += 1
+            bench = min(MAX_BENCH_SECONDS, self.bench_seconds * 2 ** (state.consecutive_rate_limits - 1))
+            state.benched_until = self._clock() + bench
+        logger.warning("⏸️ %s rate limited, benched for %.0fs", state.label, bench)
+        return True
+
+    def next_available_in(self) -> float:
+        """Seconds until the first benched key returns (0 if one is free)."""
+        with self._lock:
+            now = self._clock()
+            return max(0.0, min(s.benched_until for s in self.keys) - now)
+
+    def usage(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            now = self._clock()
+            return {s.label: s.to_dict(now) for s in self.keys}
+
+
+class _PooledModels:
+    """Stand-in for ``client.models`` that dispatches each call through the pool."""
+
+    def __init__(self, pooled: "PooledClient"):
+        self._pooled = pooled
+
+    def generate_content(self, **kwargs):
+        return self._pooled.call(lambda client: client.models.generate_content(**kwargs))
+
+    def generate_content_stream(self, **kwargs) -> Iterator[Any]:
+        return self._pooled.stream(lambda client: client.models.generate_content_stream(**kwargs))
+
+
+class PooledClient:
+    """Duck-typed ``genai.Client`` whose ``models`` calls rotate across a KeyPool.
+
+    A 429 benches the key and the call is retried on the next best key (at
+    most two attempts per key); when every key is benched the call waits up
+    to ``max_wait`` seconds for the first one to come back. Per-key request,
+    error and rate-limit counts are recorded in ``metrics`` as
+    ``api_key.<label>.*`` counters.
+    """
+
+    def __init__(
+        self,
+        pool: KeyPool,
+        metrics: Optional[Metrics] = None,
+        client_factory: Optional[Callable[[str], Any]] = None,
+        max_wait: float = 60.0,
+    ):
+        self.pool = pool
+        self.metrics = metrics or Metrics()
+        self.max_wait = max_wait
+        self._client_factory = client_factory or self._default_client_factory
+        self._clients: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self.models = _PooledModels(self)
+
+    @staticmethod
+    def _default_client_factory(api_key: str):
+        from google import genai
+
+        return genai.Client(api_key=api_key)
+
+    def _client(self, api_key: str):
+        with self._lock:
+            if api_key not in self._clients:
+                self._clients[api_key] = self._client_factory(api_key)
+            return self._clients[api_key]
+
+    def _acquire(self) -> KeyState:
+        state = self.pool.acquire()
+        if state is None:
+            wait = self.pool.next_available_in()
+            if wait > self.max_wait:
+                raise RuntimeError(f"All API keys are rate limited for another {wait:.0f}s")
+            logger.info("⏳ All API keys benched, waiting %.1fs", wait)
+            time.sleep(wait)
+            state = self.pool.acquire()
+            if state is None:
+                raise RuntimeError("All API keys are rate limited")
+        return state
+
+    def _record(self, state: KeyState, error: Optional[BaseException]) -> bool:
+        prefix = f"api_key.{state.label}"
+        self.metrics.increment(f"{prefix}.requests")
+        benched = self.pool.release(state, error)
+        if error is not None:
+            self.metrics.increment(f"{prefix}.errors")
+        if benched:
+            self.metrics.increment(f"{prefix}.rate_limited")
+        return benched
+
+    @property
+    def _max_attempts(self) -> int:
+        return 2 * len(self.pool.keys)
+
+    def call(self, request: Callable[[Any], Any]):
+        """Run ``request(client)`` on the best key, failing over after 429s."""
+        for attempt in range(1, self._max_attempts + 1):
+            state = self._acquire()
+            try:
+                result = request(self._client(state.api_key))
+            except Exception as e:
+                if self._record(state, e) and attempt < self._max_attempts:
+                    self.metrics.increment("api_key_failovers")
+                    continue
+                raise
+            self._record(state, None)
+            return result
+
+    def stream(self, request: Callable[[Any], Iterator[Any]]) -> Iterator[Any]:
+        """Like ``call`` for streaming responses; fails over only before the first chunk."""
+        for attempt in range(1, self._max_attempts + 1):
+            state = self._acquire()
+            started = False
+            try:
+                for chunk in request(self._client(state.api_key)):
+                    started = True
+                    yield chunk
+            except GeneratorExit:
+                # Consumer stopped early (e.g. after the first image)
+                self._record(state, None)
+                raise
+            except Exception as e:
+                if self._record(state, e) and not started and attempt < self._max_attempts:
+                    self.metrics.increment("api_key_failovers")
+                    continue
+                raise
+            self._record(state, None)
+            return
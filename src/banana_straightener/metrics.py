@@ -0,0 +1,53 @@
+"""Lightweight run metrics shared by an agent and its models.
+
+Counters are plain named integers; rates listed in ``RATES`` are derived from
+them when a snapshot is taken, so callers only ever increment counters.
+"""
+
+import threading
+from collections import Counter
+from typing import Any, Dict, Tuple
+
+# Derived rates: name -> (numerator counters, denominator counter)
+RATES: Dict[str, Tuple[Tuple[str, ...], str]] = {
+    # Evaluations whose final verdict came from parser defaults, not the model
+    "evaluation_parse_failure_rate": (("evaluation_parse_failures",), "evaluations"),
+    # Structured requests that had to be retried in the text format
+    "evaluation_structured_fallback_rate": (("evaluation_structured_fallbacks",), "evaluations"),
+    # Hedged calls that sent a backup request, and backups that answered first
+    "hedge_rate": (("hedges_fired",), "hedged_calls"),
+    "hedge_win_rate": (("hedge_wins",), "hedges_fired"),
+    # Cascade evaluations sent on to the strong evaluator, and escalations
+    # where both tiers gave the same match verdict
+    "cascade_escalation_rate": (("cascade_escalations",), "cascade_evaluations"),
+    "cascade_agreement_rate": (("cascade_agreements",), "cascade_comparisons"),
+    # Image parts served from an existing upload instead of uploading again
+    "file_ref_hit_rate": (("file_ref_hits",), "file_ref_lookups"),
+}
+
+
+class Metrics:
+    """Thread-safe counters for one run (or one process)."""
+
+    def __init__(self):
+        self._counters: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def increment(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self._counters[name] += amount
+
+    def get(self, name: str) -> int:
+        with self._lock:
+            return self._counters[name]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Counters plus every derived rate whose denominator is non-zero."""
+        with self._lock:
+            counters = dict(sorted(self._counters.items()))
+        rates = {}
+        for name, (numerators, denominator) in RATES.items():
+            total = counters.get(denominator, 0)
+            if total:
+                rates[name] = round(sum(counters.get(n, 0) for n in numerators) / total, 4)
+        return {"counters": counters, "rates": rates}
@@ -1,16 +1,69 @@
 """Model interfaces and implementations for image generation and evaluation."""
 
 from abc import ABC, abstractmethod
-from typing import Optional, Dict, Any, List
+from typing import TYPE_CHECKING, Optional, Dict, Any, List, Tuple
 from PIL import Image
 from tenacity import retry, stop_after_attempt, wait_exponential
-from google import genai as new_genai
-from google.genai import types
 import logging
+import re
 from io import BytesIO
 
+from .metrics import Metrics
+from .preprocess import EvaluationEncoder
+
+if TYPE_CHECKING:
+    from .filerefs import FileRefStore
+    from .hedging import RequestHedger
+    from .keypool import KeyPool
+
 logger = logging.getLogger(__name__)
 
+# Request used by evaluate_images; each image follows an "IMAGE n:" label
+COMPARATIVE_EVALUATION_TEMPLATE = (
+    "Compare the {count} images below, each labelled IMAGE n, against the request: \"{target_prompt}\"\n\n"
+    "For every image give an evaluation block, then rank all images from best to worst:\n"
+    "IMAGE 1:\n"
+    "MATCH: [YES/NO]\n"
+    "CONFIDENCE: [0.0-1.0]\n"
+    "CORRECT_ELEMENTS: [list]\n"
+    "MISSING_ELEMENTS: [list]\n"
+    "IMPROVEMENTS: [specific, actionable feedback]\n"
+    "IMAGE 2:\n"
+    "...\n"
+    "RANKING: [image numbers, best first, e.g. 2, 1, 3]"
+)
+
+# Critique format requested alongside the image in generate_and_evaluate
+SELF_CRITIQUE_TEMPLATE = (
+    "Judge honestly whether the image successfully shows: \"{target_prompt}\"\n"
+    "Format your critique as:\n"
+    "MATCH: [YES/NO]\n"
+    "CONFIDENCE: [0.0-1.0]\n"
+    "CORRECT_ELEMENTS: [list]\n"
+    "MISSING_ELEMENTS: [list]\n"
+    "IMPROVEMENTS: [detailed, specific, actionable feedback]"
+)
+
+
+def rank_evaluations(evaluations: List[Dict[str, Any]], ranking: Optional[List[int]] = None) -> Dict[str, Any]:
+    """Combine per-image evaluations into a comparative result.
+
+    ``ranking`` holds 0-based indices, best first; indices that are missing
+    or invalid are completed by descending confidence.
+    """
+    by_confidence = sorted(range(len(evaluations)), key=lambda i: -evaluations[i]['confidence'])
+    order: List[int] = []
+    for index in list(ranking or []) + by_confidence:
+        if 0 <= index < len(evaluations) and index not in order:
+            order.append(index)
+    for rank, index in enumerate(order, 1):
+        evaluations[index]['rank'] = rank
+    return {
+        'evaluations': evaluations,
+        'ranking': order,
+        'best_index': order[0] if order else None,
+    }
+
 
 class BaseModel(ABC):
     """Abstract base class for models."""
@@ -24,15 +77,80 @@ class BaseModel(ABC):
     def evaluate_image(self, image: Image.Image, target_prompt: str) -> Dict[str, Any]:
         """Evaluate if image matches the target prompt."""
         pass
+    
+    def generate_and_evaluate(
+        self,
+        prompt: str,
+        target_prompt: str,
+        base_images: Optional[List[Image.Image]] = None,
+        prompt_template: Optional[str] = None,
+    ) -> Tuple[Image.Image, Optional[Dict[str, Any]]]:
+        """Generate an image plus a self-evaluation from the same request.
+
+        Models that cannot critique their own output return None for the
+        evaluation, and callers fall back to `evaluate_image`.
+        """
+        if base_images:
+            return self.generate_image(prompt, base_images=base_images), None
+        return self.generate_image(prompt), None
+    
+    def evaluate_images(self, images: List[Image.Image], target_prompt: str, **kwargs) -> Dict[str, Any]:
+        """Evaluate several candidates and rank them, best first.
+
+        The default evaluates each image separately and ranks by confidence;
+        models that can compare images in one request override this.
+        """
+        evaluations = [self.evaluate_image(image, target_prompt) for image in images]
+        return rank_evaluations(evaluations)
 
 class GeminiModel(BaseModel):
     """Gemini model implementation for generation and evaluation using google.genai."""
 
-    def __init__(self, api_key: str, model_name: str = "gemini-2.5-flash-image-preview"):
-        """Initialize Gemini model client and defaults."""
+    def __init__(
+        self,
+        api_key: str,
+        model_name: str = "gemini-2.5-flash-image-preview",
+        metrics: Optional[Metrics] = None,
+        structured_evaluation: bool = True,
+        key_pool: Optional["KeyPool"] = None,
+        hedger: Optional["RequestHedger"] = None,
+        evaluation_encoder: Optional[EvaluationEncoder] = None,
+        file_store: Optional["FileRefStore"] = None,
+    ):
+        """Initialize Gemini model client and defaults.
+
+        Args:
+            api_key: Gemini API key
+            model_name: Model used for every request
+            metrics: Counters shared with the agent (a private set if omitted)
+            structured_evaluation: Request evaluations as schema-validated
+                JSON, falling back to the text format (turned off for good
+                if the model rejects the schema)
+            key_pool: Optional KeyPool; requests are then spread across its
+                keys instead of using ``api_key`` alone
+            hedger: Optional RequestHedger used for evaluation requests
+            evaluation_encoder: Encodes images sent for evaluation (full-size
+                PNG if omitted)
+            file_store: Optional FileRefStore; images are then uploaded once
+                and sent as file references instead of inline bytes
+        """
+        # google.genai takes most of a second to import; load it only when a
+        # model is actually created so the CLI and package import stay fast
+        from google import genai as new_genai
+
         self.api_key = api_key
         self.model_name = model_name
-        self.client = new_genai.Client(api_key=self.api_key)
+        self.metrics = metrics or Metrics()
+        if key_pool is not None and len(key_pool.keys) > 1:
+            from .keypool import PooledClient
+
+            self.client = PooledClient(key_pool, self.metrics)
+        else:
+            self.client = new_genai.Client(api_key=self.api_key)
+        self.structured_evaluation = structured_evaluation
+        self.hedger = hedger
+        self.evaluation_encoder = evaluation_encoder or EvaluationEncoder()
+        self.file_store = file_store
         self.generation_config = {
             "temperature": 0.7,
             "top_p": 0.95,
@@ -79,6 +197,22 @@ class GeminiModel(BaseModel):
     
     def _generate_with_new_api(self, prompt: str, base_images: Optional[List[Image.Image]] = None) -> Image.Image:
         """Generate or edit image using google.genai client."""
+        result_image, _ = self._stream_image_and_text(
+            self._generation_contents(prompt, base_images), stop_after_image=True
+        )
+        if result_image is None:
+            raise RuntimeError("No image data received from Gemini API")
+        return result_image
+    
+    def _generation_contents(
+        self,
+        prompt: str,
+        base_images: Optional[List[Image.Image]] = None,
+        extra_instructions: str = "",
+    ) -> list:
+        """Build the request contents for a generate/edit call."""
+        from google.genai import types
+
         # Prepare content parts
         parts = []
 
@@ -88,10 +222,10 @@ class GeminiModel(BaseModel):
                 f"Edit this image: {prompt}. Modify the existing image to match this description "
                 f"while preserving its structure and context."
             )
-            parts.append(types.Part.from_text(text=edit_prompt))
+            parts.append(types.Part.from_text(text=edit_prompt + extra_instructions))
             logger.debug("Using image edit prompt")
         else:
-            parts.append(types.Part.from_text(text=prompt))
+            parts.append(types.Part.from_text(text=prompt + extra_instructions))
             logger.debug("Generating new image from text")
 
         # Add image(s) if provided
@@ -99,30 +233,36 @@ class GeminiModel(BaseModel):
             for img in base_images:
                 img_bytes = BytesIO()
                 img.save(img_bytes, format="PNG")
-                img_bytes.seek(0)
-                parts.append(types.Part.from_bytes(data=img_bytes.read(), mime_type="image/png"))
+                parts.append(self._image_part(img_bytes.getvalue(), "image/png"))
             logger.info("🖼️ Sending %d input image(s) to API", len(base_images))
 
-        contents = [
+        return [
             types.Content(
                 role="user",
                 parts=parts,
             ),
         ]
+    
+    def _stream_image_and_text(self, contents: list, stop_after_image: bool = False) -> Tuple[Optional[Image.Image], str]:
+        """Stream a generation response, collecting the first image and all text."""
+        from google.genai import types
 
         config = types.GenerateContentConfig(
             response_modalities=["IMAGE", "TEXT"],
         )
 
+        result_image = None
+        text_parts: List[str] = []
         # Generate and stream response
         for chunk in self.client.models.generate_content_stream(
             model=self.model_name,
             contents=contents,
             config=config,
         ):
-            if chunk.candidates and chunk.candidates[0].content and chunk.candidates[0].content.parts:
-                part = chunk.candidates[0].content.parts[0]
-                if getattr(part, "inline_data", None) and getattr(part.inline_data, "data", None):
+            if not (chunk.candidates and chunk.candidates[0].content and chunk.candidates[0].content.parts):
+                continue
+            for part in chunk.candidates[0].content.parts:
+                if result_image is None and getattr(part, "inline_data", None) and getattr(part.inline_data, "data", None):
                     image_data = BytesIO(part.inline_data.data)
                     result_image = Image.open(image_data).convert("RGB")
                     logger.info(
@@ -130,9 +270,52 @@ class GeminiModel(BaseModel):
                         result_image.size[0],
                         result_image.size[1],
                     )
-                    return result_image
+                    if stop_after_image:
+                        return result_image, "".join(text_parts)
+                elif getattr(part, "text", None):
+                    text_parts.append(part.text)
 
-        raise RuntimeError("No image data received from Gemini API")
+        return result_image, "".join(text_parts)
+    
+    def generate_and_evaluate(
+        self,
+        prompt: str,
+        target_prompt: str,
+        base_images: Optional[List[Image.Image]] = None,
+        prompt_template: Optional[str] = None,
+    ) -> Tuple[Image.Image, Optional[Dict[str, Any]]]:
+        """Generate an image and a structured self-critique in a single request.
+
+        The critique uses the evaluation format, so it is parsed with
+        `_parse_evaluation` and flagged ``self_evaluated``. If the response
+        has no parseable critique the evaluation is None; if the combined call
+        fails this falls back to `generate_image`.
+        """
+        template = prompt_template or SELF_CRITIQUE_TEMPLATE
+        instructions = (
+            "\n\nAfter generating the image, critically evaluate it as text.\n"
+            + template.format(target_prompt=target_prompt)
+        )
+        try:
+            result_image, text = self._stream_image_and_text(
+                self._generation_contents(prompt, base_images, instructions)
+            )
+            if result_image is None:
+                raise RuntimeError("No image data received from Gemini API")
+        except Exception as e:
+            logger.warning("Combined generate+critique failed, generating only: %s", e)
+            return self.generate_image(prompt, base_images), None
+
+        if "CONFIDENCE:" not in text:
+            logger.debug("No self-critique in generation response")
+            return result_image, None
+        evaluation = self._parse_evaluation(text, target_prompt)
+        if evaluation.get("parse_failed"):
+            self.metrics.increment("self_critique_parse_failures")
+            logger.debug("Self-critique could not be parsed, evaluating separately")
+            return result_image, None
+        evaluation["self_evaluated"] = True
+        return result_image, evaluation
     
     def _generate_fallback(self, prompt: str) -> Image.Image:
         """Fallback method when generation fails."""
@@ -165,6 +348,7 @@ class GeminiModel(BaseModel):
     @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
     def evaluate_image(self, image: Image.Image, target_prompt: str, prompt_template: Optional[str] = None) -> Dict[str, Any]:
         """Evaluate if the image matches the target prompt using google.genai."""
+        from google.genai import types
 
         template = prompt_template or (
             "Analyze this image and determine if it successfully shows: \"{target_prompt}\"\n\n"
@@ -183,31 +367,34 @@ class GeminiModel(BaseModel):
         )
 
         evaluation_prompt = template.format(target_prompt=target_prompt)
+        self.metrics.increment("evaluations")
 
         try:
-            # Convert image to bytes
-            buf = BytesIO()
-            image.save(buf, format="PNG")
-            buf.seek(0)
-
             parts = [
                 types.Part.from_text(text=evaluation_prompt),
-                types.Part.from_bytes(data=buf.read(), mime_type="image/png"),
+                self._evaluation_image_part(image),
             ]
             contents = [types.Content(role="user", parts=parts)]
 
+            if self.structured_evaluation:
+                evaluation = self._evaluate_structured(contents, target_prompt)
+                if evaluation is not None:
+                    return evaluation
+                self.metrics.increment("evaluation_structured_fallbacks")
+
             config = types.GenerateContentConfig(response_modalities=["TEXT"],)
 
-            response = self.client.models.generate_content(
-                model=self.model_name,
-                contents=contents,
-                config=config,
-            )
+            response = self._evaluation_request(contents, config)
 
             text = getattr(response, "text", "") or ""
-            return self._parse_evaluation(text, target_prompt)
+            evaluation = self._parse_evaluation(text, target_prompt)
+            if evaluation.get("parse_failed"):
+                self.metrics.increment("evaluation_parse_failures")
+                logger.warning("Evaluation response did not follow the expected format")
+            return evaluation
         except Exception as e:
             logger.error("Evaluation error: %s", e)
+            self.metrics.increment("evaluation_errors")
             return {
                 "matches_intent": False,
                 "confidence": 0.0,
@@ -217,6 +404,152 @@ class GeminiModel(BaseModel):
                 "raw_feedback": f"Evaluation failed: {e}",
             }
     
+    def _evaluation_image_part(self, image: Image.Image):
+        """Image part for an evaluation request, encoded by the evaluation encoder."""
+        data, mime_type = self.evaluation_encoder.encode(image)
+        self.metrics.increment("evaluation_payload_bytes", len(data))
+        return self._image_part(data, mime_type)
+    
+    def _image_part(self, data: bytes, mime_type: str):
+        """Inline image part, or a file reference when a file store is set."""
+        from google.genai import types
+
+        if self.file_store is not None:
+            try:
+                ref = self.file_store.ref_for(data, mime_type, self.metrics)
+                return types.Part.from_uri(file_uri=ref.uri, mime_type=ref.mime_type)
+            except Exception as e:
+                logger.warning("File upload failed, sending the image inline: %s", e)
+                self.metrics.increment("file_ref_upload_errors")
+        return types.Part.from_bytes(data=data, mime_type=mime_type)
+    
+    def _evaluation_request(self, contents: list, config):
+        """Send a text-only evaluation request, hedged when a hedger is set."""
+        def request():
+            return self.client.models.generate_content(
+                model=self.model_name,
+                contents=contents,
+                config=config,
+            )
+
+        return self.hedger.call(request, self.metrics) if self.hedger else request()
+    
+    def _evaluate_structured(self, contents: list, target_prompt: str) -> Optional[Dict[str, Any]]:
+        """Request the evaluation as JSON matching EvaluationResponse.
+
+        Returns None when the request fails or the response does not validate,
+        so the caller can retry with the text format.
+        """
+        from google.genai import types
+        from pydantic import ValidationError
+
+        from .schemas import EvaluationResponse
+
+        try:
+            response = self._evaluation_request(contents, types.GenerateContentConfig(
+                response_modalities=["TEXT"],
+                response_mime_type="application/json",
+                response_schema=EvaluationResponse,
+            ))
+        except Exception as e:
+            if getattr(e, "code", None) == 400:
+                # The model rejected the schema itself; retrying would fail the same way
+                self.structured_evaluation = False
+                self.metrics.increment("evaluation_structured_unsupported")
+                logger.warning("%s does not support structured evaluation, using text format: %s",
+                               self.model_name, e)
+            else:
+                logger.warning("Structured evaluation request failed, using text format: %s", e)
+            return None
+
+        text = getattr(response, "text", "") or ""
+        parsed = getattr(response, "parsed", None)
+        try:
+            if not isinstance(parsed, EvaluationResponse):
+                parsed = EvaluationResponse.model_validate_json(text)
+        except ValidationError as e:
+            self.metrics.increment("evaluation_structured_parse_failures")
+            logger.warning("Structured evaluation did not match the schema: %s", e.errors()[:1])
+            return None
+
+        self.metrics.increment("evaluation_structured")
+        evaluation = parsed.to_evaluation(text)
+        if not evaluation["improvements"] and not evaluation["matches_intent"]:
+            evaluation["improvements"] = f"Please regenerate the image to better match: {target_prompt}"
+        return evaluation
+    
+    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
+    def evaluate_images(
+        self,
+        images: List[Image.Image],
+        target_prompt: str,
+        prompt_template: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Score and rank several candidate images in a single request.
+
+        Returns ``evaluations`` (one per image, in input order, each with a
+        ``rank``), ``ranking`` (0-based indices, best first) and
+        ``best_index``. Falls back to one evaluate_image call per image if
+        the comparative request fails.
+        """
+        from google.genai import types
+
+        if len(images) == 1:
+            return rank_evaluations([self.evaluate_image(images[0], target_prompt, prompt_template)])
+
+        template = prompt_template or COMPARATIVE_EVALUATION_TEMPLATE
+        parts = [types.Part.from_text(text=template.format(target_prompt=target_prompt, count=len(images)))]
+        for number, image in enumerate(images, 1):
+            parts.append(types.Part.from_text(text=f"IMAGE {number}:"))
+            parts.append(self._evaluation_image_part(image))
+
+        try:
+            response = self._evaluation_request(
+                [types.Content(role="user", parts=parts)],
+                types.GenerateContentConfig(response_modalities=["TEXT"],),
+            )
+            text = getattr(response, "text", "") or ""
+            return self._parse_comparative_evaluation(text, target_prompt, len(images))
+        except Exception as e:
+            logger.error("Comparative evaluation error, evaluating separately: %s", e)
+            return super().evaluate_images(images, target_prompt)
+    
+    @classmethod
+    def _parse_comparative_evaluation(cls, response_text: str, target_prompt: str, count: int) -> Dict[str, Any]:
+        """Parse a multi-image response: one evaluation block per IMAGE heading plus RANKING."""
+        blocks: Dict[int, List[str]] = {}
+        current = None
+        ranking: List[int] = []
+        for line in response_text.strip().split('\n'):
+            heading = re.match(r'^\W*IMAGE\s+(\d+)\W*$', line.strip(), re.IGNORECASE)
+            if heading:
+                current = int(heading.group(1)) - 1
+                blocks.setdefault(current, [])
+            elif line.strip().upper().startswith('RANKING:'):
+                ranking = [int(n) - 1 for n in re.findall(r'\d+', line.split(':', 1)[1])]
+                current = None
+            elif current is not None:
+                blocks[current].append(line)
+
+        evaluations = []
+        for index in range(count):
+            block = blocks.get(index)
+            if block is None:
+                evaluations.append({
+                    'matches_intent': False,
+                    'confidence': 0.0,
+                    'correct_elements': [],
+                    'missing_elements': [],
+                    'improvements': f"No evaluation returned for this image of: {target_prompt}",
+                    'raw_feedback': '',
+                })
+            else:
+                evaluations.append(cls._parse_evaluation('\n'.join(block), target_prompt))
+
+        result = rank_evaluations(evaluations, ranking)
+        result['raw_feedback'] = response_text
+        return result
+    
     @staticmethod
     def _parse_evaluation(response_text: str, target_prompt: str) -> Dict[str, Any]:
         """Parse the evaluation response into structured data."""
@@ -227,8 +560,10 @@ class GeminiModel(BaseModel):
             'correct_elements': [],
             'missing_elements': [],
             'improvements': '',
-            'raw_feedback': response_text
+            'raw_feedback': response_text,
+            'format': 'text',
         }
+        found_match = found_confidence = False
         
         # Track if we're in multi-line improvements section
         improvements_lines = []
@@ -238,11 +573,13 @@ class GeminiModel(BaseModel):
             line = line.strip()
             if line.startswith('MATCH:'):
                 evaluation['matches_intent'] = 'YES' in line.upper()
+                found_match = True
             elif line.startswith('CONFIDENCE:'):
                 try:
                     confidence_str = line.split(':', 1)[1].strip()
                     confidence_str = confidence_str.replace('%', '')
                     evaluation['confidence'] = min(1.0, max(0.0, float(confidence_str)))
+                    found_confidence = True
                 except (ValueError, IndexError):
                     evaluation['confidence'] = 0.5
             elif line.startswith('CORRECT_ELEMENTS:'):
@@ -265,6 +602,10 @@ class GeminiModel(BaseModel):
             else:
                 in_improvements = False
         
+        if not (found_match and found_confidence):
+            # Defaults above are guesses, not the evaluator's verdict
+            evaluation['parse_failed'] = True
+        
         # Join all improvements
         if improvements_lines:
             evaluation['improvements'] = ' '.join(improvements_lines).strip()
@@ -0,0 +1,264 @@
+"""Fast loading and preprocessing of input images.
+
+Camera JPEGs are often 20+ megapixels, while requests only need an image of
+at most ``max_size`` pixels on the long edge. ``ImagePreprocessor`` asks the
+JPEG decoder for a reduced-scale draft (1/2, 1/4 or 1/8) close to the target
+size, applies the EXIF orientation once, resizes with a configurable filter
+and caches the result by file content hash, so a reference image shared by
+many jobs is decoded only once per process. Several inputs are decoded in
+parallel; Pillow releases the GIL while decoding.
+
+``EvaluationEncoder`` does the same for outgoing evaluation requests: it
+downsizes and encodes a generated image once and reuses the bytes.
+"""
+
+import hashlib
+import logging
+import math
+import threading
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, List, Tuple, Union
+
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+RESAMPLE_FILTERS = {
+    "nearest": Image.Resampling.NEAREST,
+    "box": Image.Resampling.BOX,
+    "bilinear": Image.Resampling.BILINEAR,
+    "hamming": Image.Resampling.HAMMING,
+    "bicubic": Image.Resampling.BICUBIC,
+    "lanczos": Image.Resampling.LANCZOS,
+}
+
+_EXIF_ORIENTATION = 0x0112
+
+
+def resample_filter(name: str) -> Image.Resampling:
+    """Resampling filter for a case-insensitive name such as ``"lanczos"``."""
+    try:
+        return RESAMPLE_FILTERS[name.lower()]
+    except KeyError:
+        raise ValueError(
+            f"Unknown resample filter '{name}' (expected one of: {', '.join(RESAMPLE_FILTERS)})"
+        ) from None
+
+
+def file_digest(path: Union[str, Path]) -> str:
+    """SHA-1 of a file's contents."""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ImagePreprocessor:
+    """Decodes, orients and downsizes input images, with a bounded cache.
+
+    Args:
+        max_size: Longest edge after preprocessing (0 keeps the original size)
+        resample: Name of the resize filter (see ``RESAMPLE_FILTERS``)
+        workers: Images decoded in parallel by ``load_many``
+        cache_size: Preprocessed images kept in memory (0 disables caching)
+    """
+
+    _shared: Dict[Tuple, "ImagePreprocessor"] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, max_size: int = 1024, resample: str = "lanczos", workers: int = 4, cache_size: int = 32):
+        self.max_size = max_size
+        self.resample = resample_filter(resample)
+        self.workers = max(1, workers)
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, Image.Image]" = OrderedDict()
+        # (path, mtime_ns, size) -> content digest, so unchanged files are not re-hashed
+        self._digests: Dict[Tuple[str, int, int], str] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def for_config(cls, config) -> "ImagePreprocessor":
+        """Process-wide preprocessor for a config's input settings (shares its cache)."""
+        key = (config.input_max_size, config.input_resample, config.input_workers, config.input_cache_size)
+        with cls._shared_lock:
+            if key not in cls._shared:
+                cls._shared[key] = cls(*key)
+            return cls._shared[key]
+
+    def prepare(self, image: Image.Image) -> Image.Image:
+        """Orient, convert to RGB and downsize an already decoded image."""
+        if image.getexif().get(_EXIF_ORIENTATION, 1) != 1:
+            image = ImageOps.exif_transpose(image)
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        return self._resize(image)
+
+    def prepare_many(self, images: List[Image.Image]) -> List[Image.Image]:
+        return self._map(self.prepare, images)
+
+    def load(self, path: Union[str, Path]) -> Image.Image:
+        """Load a preprocessed image, from the cache when the file is unchanged."""
+        path = Path(path)
+        key = self._cache_key(path) if self.cache_size else None
+        if key is not None:
+            with self._lock:
+                cached = self._cache.get(key)
+                if cached is not None:
+                    self._cache.move_to_end(key)
+                    self.hits += 1
+                    return cached.copy()
+
+        image = self._decode(path)
+
+        if key is not None:
+            with self._lock:
+                self.misses += 1
+                self._cache[key] = image
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+            return image.copy()
+        return image
+
+    def load_many(self, paths: List[Union[str, Path]]) -> List[Image.Image]:
+        """Load several images in parallel, preserving their order."""
+        return self._map(self.load, paths)
+
+    def _map(self, func, items: list) -> list:
+        if len(items) <= 1 or self.workers == 1:
+            return [func(item) for item in items]
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(items))) as pool:
+            return list(pool.map(func, items))
+
+    def _cache_key(self, path: Path) -> str:
+        stat = path.stat()
+        file_key = (str(path.resolve()), stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            digest = self._digests.get(file_key)
+        if digest is None:
+            digest = file_digest(path)
+            with self._lock:
+                self._digests[file_key] = digest
+        return f"{digest}:{self.max_size}:{self.resample.name}"
+
+    def _decode(self, path: Path) -> Image.Image:
+        with Image.open(path) as img:
+            if img.format == "JPEG" and self.max_size and max(img.size) > self.max_size:
+                # Decode at the smallest 1/2^n scale that is still >= the target size
+                scale = self.max_size / max(img.size)
+                img.draft("RGB", (math.ceil(img.width * scale), math.ceil(img.height * scale)))
+            image = ImageOps.exif_transpose(img)
+            if image.mode != "RGB":
+                image = image.convert("RGB")
+            else:
+                image.load()
+        return self._resize(image)
+
+    def _resize(self, image: Image.Image) -> Image.Image:
+        if not self.max_size or max(image.size) <= self.max_size:
+            return image
+        scale = self.max_size / max(image.size)
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        return image.resize(size, self.resample)
+
+
+# Evaluation payload format name -> (Pillow format, MIME type)
+PAYLOAD_FORMATS = {
+    "png": ("PNG", "image/png"),
+    "jpeg": ("JPEG", "image/jpeg"),
+    "webp": ("WEBP", "image/webp"),
+}
+
+
+class EvaluationEncoder:
+    """Encodes images for evaluation requests, downscaled once and cached per image.
+
+    An evaluation only needs a verdict and some text, so the image can be
+    sent smaller and in a lossy format. The same image object is often
+    encoded more than once (request retries, hedged duplicates, cascade
+    tiers), so encodings are cached by image identity.
+
+    Args:
+        max_size: Longest edge sent for evaluation (0 keeps the original size)
+        fmt: Payload format name (see ``PAYLOAD_FORMATS``)
+        quality: Quality for the lossy formats
+        resample: Name of the resize filter (see ``RESAMPLE_FILTERS``)
+        cache_size: Encoded images kept in memory (0 disables caching)
+    """
+
+    _shared: Dict[Tuple, "EvaluationEncoder"] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(
+        self,
+        max_size: int = 0,
+        fmt: str = "png",
+        quality: int = 90,
+        resample: str = "lanczos",
+        cache_size: int = 16,
+    ):
+        if fmt.lower() not in PAYLOAD_FORMATS:
+            raise ValueError(
+                f"Unknown evaluation format '{fmt}' (expected one of: {', '.join(PAYLOAD_FORMATS)})"
+            )
+        self.max_size = max_size
+        self.format, self.mime_type = PAYLOAD_FORMATS[fmt.lower()]
+        self.quality = quality
+        self.resample = resample_filter(resample)
+        self.cache_size = cache_size
+        # id(image) -> (weak reference to the image, encoded bytes)
+        self._cache: "OrderedDict[int, Tuple[weakref.ref, bytes]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def for_config(cls, config) -> "EvaluationEncoder":
+        """Process-wide encoder for a config's evaluation payload settings."""
+        key = (config.evaluation_max_size, config.evaluation_format, config.evaluation_quality)
+        with cls._shared_lock:
+            if key not in cls._shared:
+                cls._shared[key] = cls(*key)
+            return cls._shared[key]
+
+    def encode(self, image: Image.Image) -> Tuple[bytes, str]:
+        """Encoded payload and its MIME type, from the cache for a seen image."""
+        key = id(image)
+        if self.cache_size:
+            with self._lock:
+                cached = self._cache.get(key)
+                # A dead reference means the id was reused by a different image
+                if cached is not None and cached[0]() is image:
+                    self._cache.move_to_end(key)
+                    self.hits += 1
+                    return cached[1], self.mime_type
+
+        data = self._encode(image)
+
+        if self.cache_size:
+            with self._lock:
+                self.misses += 1
+                self._cache[key] = (weakref.ref(image), data)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return data, self.mime_type
+
+    def _encode(self, image: Image.Image) -> bytes:
+        if self.max_size and max(image.size) > self.max_size:
+            scale = self.max_size / max(image.size)
+            size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+            image = image.resize(size, self.resample)
+        if self.format != "PNG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        buf = BytesIO()
+        if self.format == "PNG":
+            image.save(buf, format="PNG")
+        else:
+            image.save(buf, format=self.format, quality=self.quality)
+        return buf.getvalue()
@@ -0,0 +1,136 @@
+"""Bounded-memory retention of per-iteration images.
+
+Decoded full-resolution images are large (a 1024x1024 RGB image is 3 MB), so
+keeping every iteration's image alive makes memory grow with the number of
+iterations. ``ImageRetention`` keeps only the best and the latest image in
+memory and spills the rest to PNG files, leaving ``ImageRef`` handles that
+load them back on demand.
+"""
+
+import logging
+from pathlib import Path
+from typing import List, Optional, Union
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+
+def image_nbytes(image: Optional[Image.Image]) -> int:
+    """Approximate size of a decoded image buffer."""
+    if image is None:
+        return 0
+    width, height = image.size
+    return width * height * len(image.getbands())
+
+
+class ImageRef:
+    """Handle to an image held in memory or spilled to disk."""
+
+    def __init__(
+        self,
+        image: Optional[Image.Image] = None,
+        path: Optional[Union[str, Path]] = None,
+        thumbnail: Optional[Image.Image] = None,
+    ):
+        if image is None and path is None:
+            raise ValueError("ImageRef needs an image or a path")
+        self._image = image
+        self.path = Path(path) if path else None
+        self.thumbnail = thumbnail
+        self.size = image.size if image is not None else None
+
+    @property
+    def in_memory(self) -> bool:
+        return self._image is not None
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held in memory by this reference (image plus thumbnail)."""
+        return image_nbytes(self._image) + image_nbytes(self.thumbnail)
+
+    def load(self) -> Image.Image:
+        """Return the image, reading it from disk if it was spilled."""
+        if self._image is not None:
+            return self._image
+        with Image.open(self.path) as img:
+            return img.convert("RGB")
+
+    def display_value(self) -> Union[Image.Image, str]:
+        """Cheapest value for UI display.
+
+        The in-memory image, else the thumbnail kept for a spilled image, else
+        the file path.
+        """
+        if self._image is not None:
+            return self._image
+        return self.thumbnail if self.thumbnail is not None else str(self.path)
+
+    def spill(self, path: Union[str, Path]) -> None:
+        """Release the in-memory image, writing it to ``path`` if needed."""
+        if self._image is None:
+            return
+        if self.path is None or not self.path.exists():
+            path = Path(path)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._image.save(path, "PNG")
+            self.path = path
+        self._image = None
+
+
+class ImageRetention:
+    """Keeps the best and latest images in memory; spills the others.
+
+    Args:
+        spill_dir: Directory for spilled images
+        keep_all: Disable spilling (every image stays in memory)
+        thumbnail_size: Max edge of an in-memory thumbnail kept for every
+            image (0 disables thumbnails)
+    """
+
+    def __init__(self, spill_dir: Union[str, Path], keep_all: bool = False, thumbnail_size: int = 0):
+        self.spill_dir = Path(spill_dir)
+        self.keep_all = keep_all
+        self.thumbnail_size = thumbnail_size
+        self.refs: List[ImageRef] = []
+        self._confidences: List[float] = []
+        self._iterations: List[int] = []
+        self.peak_bytes = 0
+
+    @property
+    def retained_bytes(self) -> int:
+        return sum(ref.nbytes for ref in self.refs)
+
+    def add(
+        self,
+        iteration: int,
+        image: Image.Image,
+        confidence: float,
+        path: Optional[Union[str, Path]] = None,
+    ) -> ImageRef:
+        """Track a new image; ``path`` is an existing file holding it, if any."""
+        thumbnail = None
+        if self.thumbnail_size:
+            thumbnail = image.copy()
+            thumbnail.thumbnail((self.thumbnail_size, self.thumbnail_size))
+
+        ref = ImageRef(image, path=path, thumbnail=thumbnail)
+        self.refs.append(ref)
+        self._confidences.append(confidence)
+        self._iterations.append(iteration)
+        # Peak is measured before spilling: best + previous latest + new image
+        self.peak_bytes = max(self.peak_bytes, self.retained_bytes)
+
+        if not self.keep_all:
+            best = max(range(len(self.refs)), key=lambda i: self._confidences[i])
+            latest = len(self.refs) - 1
+            for index, other in enumerate(self.refs):
+                if index not in (best, latest) and other.in_memory:
+                    other.spill(self.spill_dir / f"iteration_{self._iterations[index]:02d}.png")
+                    logger.debug("Spilled iteration %s image to disk", self._iterations[index])
+        return ref
+
+    def best(self) -> Optional[ImageRef]:
+        if not self.refs:
+            return None
+        return self.refs[max(range(len(self.refs)), key=lambda i: self._confidences[i])]
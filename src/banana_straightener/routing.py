@@ -0,0 +1,77 @@
+"""Generator routing: a fast draft model for early iterations, the main model after.
+
+Early iterations mostly fix gross composition, which a faster and cheaper
+image model handles well. ``GeneratorRouter`` decides per iteration whether
+to use the draft model. It keeps the draft model until an accepted image
+reaches ``switch_confidence``, or until ``max_draft_iterations`` draft
+iterations have run. After that the session stays on the main generator.
+``model_usage`` summarises a history per generator model for the session
+report.
+"""
+
+from typing import Any, Dict, List, Optional
+
+
+class GeneratorRouter:
+    """Per-iteration choice between the draft and the main generator.
+
+    Args:
+        switch_confidence: Accepted confidence at which the session moves to
+            the main generator
+        max_draft_iterations: Draft iterations allowed before switching
+            regardless of confidence (0 = no limit)
+    """
+
+    def __init__(self, switch_confidence: float = 0.6, max_draft_iterations: int = 2):
+        self.switch_confidence = switch_confidence
+        self.max_draft_iterations = max_draft_iterations
+
+    def use_draft(self, history: List[Dict[str, Any]]) -> bool:
+        """True while the next iteration should still use the draft model."""
+        drafts = [entry for entry in history if entry.get('generator_tier') == 'draft']
+        if len(drafts) < len(history):
+            return False  # the main generator has been used; never switch back
+        if self.max_draft_iterations and len(drafts) >= self.max_draft_iterations:
+            return False
+        accepted = [entry for entry in history if not entry.get('rejected')]
+        return not accepted or accepted[-1]['evaluation']['confidence'] < self.switch_confidence
+
+
+def model_usage(history: List[Dict[str, Any]], success: bool = False) -> Dict[str, Dict[str, Any]]:
+    """Per-model iterations, generation latency and confidence contribution.
+
+    ``confidence_gain`` sums the change in confidence each model's accepted
+    images made over the previous accepted image (the first image counts
+    from zero). ``produced_final`` marks the model of the last accepted
+    image when the session succeeded.
+    """
+    usage: Dict[str, Dict[str, Any]] = {}
+    previous: Optional[float] = None
+    last_model = None
+    for entry in history:
+        model = entry.get('generator_model')
+        if model is None:
+            continue
+        stats = usage.setdefault(model, {
+            'tier': entry.get('generator_tier'),
+            'iterations': 0,
+            'rejected': 0,
+            'generation_seconds': 0.0,
+            'confidence_gain': 0.0,
+            'produced_final': False,
+        })
+        stats['iterations'] += 1
+        stats['generation_seconds'] += (entry.get('timings') or {}).get('generation_seconds', 0.0)
+        if entry.get('rejected'):
+            stats['rejected'] += 1
+            continue
+        confidence = entry['evaluation']['confidence']
+        stats['confidence_gain'] += confidence - (previous or 0.0)
+        previous = confidence
+        last_model = model
+    for model, stats in usage.items():
+        stats['generation_seconds'] = round(stats['generation_seconds'], 3)
+        stats['mean_generation_seconds'] = round(stats['generation_seconds'] / stats['iterations'], 3)
+        stats['confidence_gain'] = round(stats['confidence_gain'], 4)
+        stats['produced_final'] = success and model == last_model
+    return usage
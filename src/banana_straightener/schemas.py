@@ -0,0 +1,34 @@
+"""Response schemas for structured (JSON) model output.
+
+Kept separate from ``models`` so pydantic is only imported when a structured
+request is actually made.
+"""
+
+from typing import Any, Dict, List
+
+from pydantic import BaseModel, Field
+
+
+class EvaluationResponse(BaseModel):
+    """Evaluator verdict requested as JSON through a response schema."""
+
+    matches_intent: bool = Field(description="Whether the image matches the requested description")
+    confidence: float = Field(ge=0.0, le=1.0, description="Confidence from 0.0 to 1.0")
+    correct_elements: List[str] = Field(default_factory=list, description="Elements shown correctly")
+    missing_elements: List[str] = Field(default_factory=list, description="Elements missing or wrong")
+    improvements: str = Field(
+        default="",
+        description="Detailed, specific, actionable changes needed; empty if none",
+    )
+
+    def to_evaluation(self, raw_feedback: str) -> Dict[str, Any]:
+        """Convert to the evaluation dict used throughout the agent."""
+        return {
+            "matches_intent": self.matches_intent,
+            "confidence": self.confidence,
+            "correct_elements": ", ".join(self.correct_elements),
+            "missing_elements": ", ".join(self.missing_elements),
+            "improvements": self.improvements.strip(),
+            "raw_feedback": raw_feedback,
+            "format": "json",
+        }
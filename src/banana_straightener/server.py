@@ -0,0 +1,406 @@
+"""Headless HTTP job API for Banana Straightener.
+
+Exposes a small JSON API so backend services can submit straightening jobs,
+poll their status, stream per-iteration progress as Server-Sent Events and
+fetch the final image. Jobs run on a bounded worker pool; when the queue is
+full new submissions are rejected with HTTP 429.
+
+Endpoints:
+    POST /jobs                 submit a job (JSON body, images as base64)
+    GET  /jobs/<id>            job status
+    GET  /jobs/<id>/events     Server-Sent Events stream of iterations
+    GET  /jobs/<id>/image      final image as PNG
+    GET  /health               liveness and queue depth
+"""
+
+import io
+import json
+import logging
+import queue
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional
+
+from PIL import Image
+
+from .config import Config
+from .retention import ImageRef
+from .utils import base64_to_image
+
+logger = logging.getLogger(__name__)
+
+# Terminal job states; anything else is still in flight
+FINISHED_STATES = ("completed", "error")
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity."""
+
+
+class Job:
+    """A single straightening job and its event log."""
+
+    def __init__(
+        self,
+        prompt: str,
+        images: Optional[List[Image.Image]] = None,
+        max_iterations: Optional[int] = None,
+        success_threshold: Optional[float] = None,
+    ):
+        self.id = uuid.uuid4().hex
+        self.prompt = prompt
+        self.images = images or []
+        self.max_iterations = max_iterations
+        self.success_threshold = success_threshold
+        self.status = "queued"
+        self.success = False
+        self.error: Optional[str] = None
+        self.created_at = datetime.now().isoformat()
+        self.started_at: Optional[str] = None
+        self.finished_at: Optional[str] = None
+        self.events: List[Dict[str, Any]] = []
+        self.final_image_png: Optional[bytes] = None
+        self._cond = threading.Condition()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATES
+
+    def add_event(self, event: Dict[str, Any]) -> None:
+        """Append an event and wake up any SSE listeners."""
+        with self._cond:
+            self.events.append(event)
+            self._cond.notify_all()
+
+    def set_status(self, status: str) -> None:
+        with self._cond:
+            self.status = status
+            if status == "running":
+                self.started_at = datetime.now().isoformat()
+            elif status in FINISHED_STATES:
+                self.finished_at = datetime.now().isoformat()
+                # Release input images; they are not needed once the job ends
+                self.images = []
+            self._cond.notify_all()
+
+    def wait_for_events(self, after: int, timeout: float = 15.0) -> List[Dict[str, Any]]:
+        """Block until events past index ``after`` exist or the job finishes."""
+        with self._cond:
+            self._cond.wait_for(
+                lambda: len(self.events) > after or self.finished, timeout=timeout
+            )
+            return self.events[after:]
+
+    def to_dict(self) -> Dict[str, Any]:
+        last = self.events[-1] if self.events else None
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "success": self.success,
+            "prompt": self.prompt,
+            "iterations": len(self.events),
+            "confidence": last["evaluation"].get("confidence", 0.0) if last else 0.0,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "has_image": self.final_image_png is not None,
+        }
+
+
+def _iteration_event(iteration_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Strip non-serializable fields (images) from an iteration record."""
+    return {
+        key: value
+        for key, value in iteration_data.items()
+        if not isinstance(value, (Image.Image, ImageRef))
+    }
+
+
+class JobManager:
+    """Bounded worker pool that runs jobs through ``straighten_iterative``."""
+
+    def __init__(
+        self,
+        config: Config,
+        workers: int = 2,
+        max_queue: int = 16,
+        max_retained_jobs: int = 256,
+        agent_factory: Optional[Callable[[Config, str], Any]] = None,
+    ):
+        self.config = config
+        self.max_retained_jobs = max_retained_jobs
+        self._agent_factory = agent_factory or self._default_agent_factory
+        self._queue: "queue.Queue[Optional[Job]]" = queue.Queue(maxsize=max(1, max_queue))
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._threads = [
+            threading.Thread(target=self._worker_loop, name=f"straighten-worker-{i}", daemon=True)
+            for i in range(max(1, workers))
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    @staticmethod
+    def _default_agent_factory(config: Config, session_id: str):
+        from .agent import BananaStraightener
+
+        return BananaStraightener(config, session_id=session_id)
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def submit(self, job: Job) -> Job:
+        """Enqueue a job, raising QueueFullError when at capacity."""
+        # Register first so a worker or client never sees an unknown job id
+        with self._lock:
+            self._jobs[job.id] = job
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                self._jobs.pop(job.id, None)
+            raise QueueFullError("Job queue is full, retry later")
+        with self._lock:
+            self._evict_finished()
+        logger.info("📥 Queued job %s", job.id)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _evict_finished(self) -> None:
+        """Drop the oldest finished jobs once retention is exceeded."""
+        excess = len(self._jobs) - self.max_retained_jobs
+        if excess <= 0:
+            return
+        for job_id in [jid for jid, j in self._jobs.items() if j.finished][:excess]:
+            del self._jobs[job_id]
+
+    def _worker_loop(self) -> None:
+        while True:
+            job = self._queue.get()
+            if job is None:
+                self._queue.task_done()
+                return
+            try:
+                self._run_job(job)
+            finally:
+                self._queue.task_done()
+
+    def _run_job(self, job: Job) -> None:
+        job.set_status("running")
+        logger.info("🍌 Running job %s", job.id)
+        last_image = None
+        try:
+            # Concurrent jobs started in the same second need distinct session dirs
+            session_id = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{job.id}"
+            agent = self._agent_factory(self.config, session_id)
+            for iteration_data in agent.straighten_iterative(
+                prompt=job.prompt,
+                input_images=job.images or None,
+                max_iterations=job.max_iterations,
+                success_threshold=job.success_threshold,
+            ):
+                if iteration_data.get("current_image") is not None:
+                    last_image = iteration_data["current_image"]
+                job.success = bool(iteration_data.get("success"))
+                job.add_event(_iteration_event(iteration_data))
+
+            if last_image is not None:
+                buf = io.BytesIO()
+                last_image.save(buf, format="PNG")
+                job.final_image_png = buf.getvalue()
+            job.set_status("completed")
+        except Exception as e:
+            logger.error("Job %s failed: %s", job.id, e)
+            job.error = str(e)
+            job.set_status("error")
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop the workers after the queued jobs have been processed."""
+        for _ in self._threads:
+            self._queue.put(None)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+
+def parse_job_request(payload: Dict[str, Any]) -> Job:
+    """Build a Job from a decoded JSON request body."""
+    prompt = payload.get("prompt")
+    if not isinstance(prompt, str) or not prompt.strip():
+        raise ValueError("'prompt' is required")
+
+    images = []
+    for encoded in payload.get("images") or []:
+        if isinstance(encoded, str) and encoded.startswith("data:"):
+            encoded = encoded.split(",", 1)[-1]
+        images.append(base64_to_image(encoded).convert("RGB"))
+
+    max_iterations = payload.get("max_iterations")
+    if max_iterations is not None:
+        max_iterations = max(1, int(max_iterations))
+    success_threshold = payload.get("success_threshold")
+    if success_threshold is not None:
+        success_threshold = max(0.0, min(1.0, float(success_threshold)))
+
+    return Job(prompt.strip(), images, max_iterations, success_threshold)
+
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    """HTTP handler routing requests to the server's JobManager."""
+
+    server_version = "BananaStraightener"
+    max_body_bytes = 64 * 1024 * 1024
+
+    @property
+    def manager(self) -> JobManager:
+        return self.server.manager
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+    def _send_json(self, status: int, data: Dict[str, Any]) -> None:
+        body = json.dumps(data, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _route(self):
+        parts = [p for p in self.path.split("?", 1)[0].split("/") if p]
+        job = None
+        if len(parts) >= 2 and parts[0] == "jobs":
+            job = self.manager.get(parts[1])
+        return parts, job
+
+    def do_POST(self):
+        parts, _ = self._route()
+        if parts != ["jobs"]:
+            self._send_json(404, {"error": "Not found"})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self._send_json(400, {"error": "Invalid Content-Length"})
+            return
+        if length > self.max_body_bytes:
+            self._send_json(413, {"error": "Request body too large"})
+            return
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            job = parse_job_request(payload)
+        except Exception as e:
+            self._send_json(400, {"error": f"Invalid request: {e}"})
+            return
+
+        try:
+            self.manager.submit(job)
+        except QueueFullError as e:
+            self.send_response(429)
+            self.send_header("Retry-After", "5")
+            body = json.dumps({"error": str(e)}).encode("utf-8")
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        self._send_json(202, job.to_dict())
+
+    def do_GET(self):
+        parts, job = self._route()
+
+        if parts == ["health"]:
+            self._send_json(200, {"status": "ok", "queue_depth": self.manager.queue_depth})
+            return
+        if not parts or parts[0] != "jobs" or len(parts) > 3:
+            self._send_json(404, {"error": "Not found"})
+            return
+        if job is None:
+            self._send_json(404, {"error": "Unknown job"})
+            return
+
+        if len(parts) == 2:
+            self._send_json(200, job.to_dict())
+        elif parts[2] == "events":
+            self._stream_events(job)
+        elif parts[2] == "image":
+            if job.final_image_png is None:
+                self._send_json(409 if not job.finished else 404, {"error": "Image not available"})
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("Content-Length", str(len(job.final_image_png)))
+            self.end_headers()
+            self.wfile.write(job.final_image_png)
+        else:
+            self._send_json(404, {"error": "Not found"})
+
+    def _stream_events(self, job: Job) -> None:
+        """Stream iteration events as Server-Sent Events until the job ends."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+        sent = 0
+        try:
+            while True:
+                events = job.wait_for_events(sent)
+                for event in events:
+                    sent += 1
+                    self._write_sse("iteration", event, event_id=sent)
+                if not events and not job.finished:
+                    # Keep idle connections alive through proxies
+                    self.wfile.write(b": keep-alive\n\n")
+                    self.wfile.flush()
+                if job.finished and sent >= len(job.events):
+                    self._write_sse("done", job.to_dict())
+                    return
+        except (BrokenPipeError, ConnectionResetError):
+            logger.debug("SSE client for job %s disconnected", job.id)
+
+    def _write_sse(self, event: str, data: Dict[str, Any], event_id: Optional[int] = None) -> None:
+        lines = [f"event: {event}"]
+        if event_id is not None:
+            lines.append(f"id: {event_id}")
+        lines.append(f"data: {json.dumps(data, default=str)}")
+        self.wfile.write(("\n".join(lines) + "\n\n").encode("utf-8"))
+        self.wfile.flush()
+
+
+def create_server(manager: JobManager, host: str = "127.0.0.1", port: int = 8000) -> ThreadingHTTPServer:
+    """Create (but do not start) an HTTP server bound to the given manager."""
+    server = ThreadingHTTPServer((host, port), JobRequestHandler)
+    server.daemon_threads = True
+    server.manager = manager
+    return server
+
+
+def serve(
+    config: Config,
+    host: str = "127.0.0.1",
+    port: int = 8000,
+    workers: int = 2,
+    max_queue: int = 16,
+) -> None:
+    """Run the job API until interrupted."""
+    manager = JobManager(config, workers=workers, max_queue=max_queue)
+    server = create_server(manager, host, port)
+    logger.info("🌐 Serving job API on http://%s:%s", host, server.server_address[1])
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        manager.shutdown(wait=False)
@@ -0,0 +1,101 @@
+"""Append-only per-session event log.
+
+Each session writes ``<session_dir>/session_log.jsonl``: one ``start`` record,
+one ``iteration`` record per finished iteration and one ``end`` record. Every
+line is flushed and fsync'd as it is written, so the cost per iteration is a
+single small append, a crash loses at most the iteration in progress, and the
+file can be tailed by monitoring tools while the session runs. The summary
+``session_report.json`` is built from this log when the session ends.
+"""
+
+import json
+import logging
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+SESSION_LOG_FILENAME = "session_log.jsonl"
+
+
+def _json_default(value: Any) -> Any:
+    # Images are never written to the log; they live in their own files
+    if isinstance(value, Image.Image):
+        return None
+    return str(value)
+
+
+class SessionLog:
+    """Durable JSONL log for one session."""
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self._file = None
+
+    def append(self, record_type: str, data: Dict[str, Any]) -> None:
+        """Write one record and force it to disk."""
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, "a", encoding="utf-8")
+            if self._file.tell() and not self._ends_with_newline():
+                self._file.write("\n")
+        record = {"type": record_type, "logged_at": datetime.now().isoformat(), "data": data}
+        self._file.write(json.dumps(record, default=_json_default) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _ends_with_newline(self) -> bool:
+        with open(self.path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    @staticmethod
+    def read(path: Union[str, Path]) -> List[Dict[str, Any]]:
+        """Read all complete records, ignoring a truncated final line."""
+        records = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    logger.debug("Ignoring truncated line in %s", path)
+        return records
+
+
+def build_report(records: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Assemble a session report from log records.
+
+    Only the last run in the log is used (an agent reused for several prompts
+    appends one run after another). Works on logs of interrupted sessions too:
+    without an ``end`` record the report is marked ``incomplete``.
+    """
+    starts = [i for i, r in enumerate(records) if r.get("type") == "start"]
+    if not starts:
+        return None
+    records = records[starts[-1]:]
+    start = records[0]["data"]
+    end = next((r["data"] for r in reversed(records) if r.get("type") == "end"), None)
+    history = [r["data"] for r in records if r.get("type") == "iteration"]
+    confidences = [h.get("evaluation", {}).get("confidence", 0.0) for h in history]
+
+    report = dict(start)
+    if end is not None:
+        report.update(end)
+    else:
+        report.update({
+            "success": False,
+            "total_iterations": len(history),
+            "final_confidence": max(confidences, default=0.0),
+            "incomplete": True,
+        })
+    report["history"] = history
+    return report
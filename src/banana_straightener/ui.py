@@ -110,8 +110,9 @@ def launch_ui(config: Optional[Config] = None, open_browser: bool = True):
             
             # Track all iterations for gallery and history
             iteration_images = []
+            iteration_refs = []  # (ImageRef, caption); spilled images are shown by path
             iteration_info = []
-            session_images = []  # Store actual PIL images for ZIP
+            session_images = []  # Image references for ZIP
             
             # Initialize progress for Gradio 5.0+
             
@@ -123,20 +124,23 @@ def launch_ui(config: Optional[Config] = None, open_browser: bool = True):
                 success_threshold=threshold,
             ):
                 current_image = iteration_data['current_image']
+                image_ref = iteration_data.get('image_ref')
                 evaluation = iteration_data['evaluation']
                 iteration = iteration_data['iteration']
                 
                 # Update progress for Gradio 5.0+
                 progress(iteration / max_iterations, f"🔄 Iteration {iteration}/{max_iterations}")
                 
-                # Add to gallery (convert to format Gradio expects) and store for ZIP
-                if current_image:
-                    iteration_images.append((current_image, f"Iteration {iteration}"))
-                    session_images.append(current_image)
-                    images_state.append(current_image)
-                
-                # Store evaluation data for ZIP
-                evals_state.append(evaluation)
+                # Add to gallery (convert to format Gradio expects) and store for ZIP.
+                # The ZIP pairs images and evaluations by position, so an
+                # evaluation is kept only with its image (pre-check rejected
+                # iterations have neither)
+                if image_ref is not None:
+                    iteration_refs.append((image_ref, f"Iteration {iteration}"))
+                    session_images.append(image_ref)
+                    images_state.append(image_ref)
+                    evals_state.append(evaluation)
+                    iteration_images = [(ref.display_value(), caption) for ref, caption in iteration_refs]
                 
                 # Create status message
                 match_status = "✅ Match" if evaluation['matches_intent'] else "❌ No match"
@@ -314,7 +318,7 @@ The banana is straighter, but not quite perfect yet. Try increasing iterations o
         try:
             slider_value = int(slider_value)
             if slider_value <= len(images_state) and slider_value > 0:
-                return images_state[slider_value - 1]
+                return images_state[slider_value - 1].load()
         except (ValueError, IndexError):
             pass
         return None
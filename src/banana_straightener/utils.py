@@ -2,14 +2,17 @@
 
 from typing import Union, Optional, List
 from pathlib import Path
-from PIL import Image
+from PIL import Image, ImageChops, ImageStat
 import base64
 import io
+import re
 import zipfile
 import json
 from datetime import datetime
 import logging
 
+from .retention import ImageRef
+
 logger = logging.getLogger(__name__)
 
 def load_image(image_path: Union[str, Path]) -> Image.Image:
@@ -34,75 +37,197 @@ def base64_to_image(base64_string: str) -> Image.Image:
     image_data = base64.b64decode(base64_string)
     return Image.open(io.BytesIO(image_data))
 
+# Rough chars-per-token ratio used to turn a token budget into characters
+CHARS_PER_TOKEN = 4
+
+# Word-overlap ratio above which two feedback items count as the same item
+FEEDBACK_SIMILARITY = 0.8
+
+_NO_FEEDBACK = ['none', 'n/a', 'none needed!']
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count of a prompt (about four characters per token)."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def prompt_char_budget(max_tokens: int = 0, max_chars: int = 0) -> Optional[int]:
+    """Combine token and character limits into one character budget (None = unlimited)."""
+    limits = [limit for limit in (max_tokens * CHARS_PER_TOKEN, max_chars) if limit > 0]
+    return min(limits) if limits else None
+
+
 def enhance_prompt_with_feedback(
     original_prompt: str,
     feedback: str,
     iteration: int,
-    previous_history: list = None
+    previous_history: list = None,
+    max_chars: Optional[int] = None,
+    force_alternative: bool = False,
 ) -> str:
     """
     Enhance the prompt based on evaluation feedback and previous attempts.
     
     This function creates a more specific prompt by incorporating
     the feedback from the previous iteration and tracking what's been tried before.
+    Only unresolved feedback items are kept (duplicates and items the evaluator
+    now lists as correct are dropped), and when ``max_chars`` is set the lowest
+    priority sections and items are dropped until the prompt fits.
+    ``force_alternative`` switches to an alternative approach regardless of
+    the feedback text (used when the generated image stops changing).
     """
-    if not feedback or feedback.lower() in ['none', 'n/a', 'none needed!']:
-        return original_prompt
-    
+    has_feedback = bool(feedback) and feedback.lower() not in _NO_FEEDBACK
     previous_history = previous_history or []
     
+    if force_alternative:
+        # An image that stopped changing needs a new approach even without feedback
+        return _create_alternative_approach(
+            original_prompt, feedback if has_feedback else "", iteration, previous_history, max_chars
+        )
+    if not has_feedback:
+        return original_prompt
+    
     # Check for repetitive feedback patterns
     if len(previous_history) > 1:
         recent_feedback = [h.get('evaluation', {}).get('improvements', '') for h in previous_history[-3:]]
         if _is_feedback_repetitive(feedback, recent_feedback):
             # Try alternative approaches when stuck in loops
-            return _create_alternative_approach(original_prompt, feedback, iteration, previous_history)
+            return _create_alternative_approach(original_prompt, feedback, iteration, previous_history, max_chars)
     
-    # Build enhanced prompt with cumulative learnings
-    enhanced_parts = [f"Original request: {original_prompt}"]
+    optional = []
     
     # Add iteration-specific strategy
     strategy = _get_iteration_strategy(iteration, len(previous_history))
-    enhanced_parts.append(f"\nIteration {iteration} strategy: {strategy}")
-    
-    # Add current specific improvements
-    enhanced_parts.append(f"\nSpecific improvements needed:\n{feedback}")
+    optional.append(f"\nIteration {iteration} strategy: {strategy}")
     
     # Add learnings from previous attempts if available
     if previous_history:
         attempted_approaches = _extract_attempted_approaches(previous_history)
         if attempted_approaches:
-            enhanced_parts.append(f"\nPrevious attempts tried: {attempted_approaches}")
-            enhanced_parts.append("Try a different approach from those listed above.")
-    
-    enhanced_parts.append("\nGenerate an image that addresses these specific issues while maintaining the original intent.")
-    
-    return "\n".join(enhanced_parts).strip()
+            optional.append(
+                f"\nPrevious attempts tried: {attempted_approaches}\n"
+                "Try a different approach from those listed above."
+            )
+    
+    optional.append("\nGenerate an image that addresses these specific issues while maintaining the original intent.")
+    
+    return _fit_prompt_to_budget(
+        f"Original request: {original_prompt}",
+        "Specific improvements needed:",
+        select_unresolved_feedback(feedback, previous_history),
+        optional,
+        max_chars,
+    )
+
+def _word_similarity(text1: str, text2: str) -> float:
+    """Jaccard similarity of the lower-cased word sets of two texts."""
+    words1 = set(re.findall(r"[\w']+", text1.lower()))
+    words2 = set(re.findall(r"[\w']+", text2.lower()))
+    if not words1 or not words2:
+        return 0.0
+    return len(words1 & words2) / len(words1 | words2)
 
 def _is_feedback_repetitive(current_feedback: str, recent_feedback: list) -> bool:
     """Check if current feedback is too similar to recent feedback."""
     if not recent_feedback:
         return False
     
-    current_words = set(current_feedback.lower().split())
+    return any(
+        past_feedback and _word_similarity(current_feedback, past_feedback) > FEEDBACK_SIMILARITY
+        for past_feedback in recent_feedback
+    )
+
+def split_feedback_items(feedback) -> List[str]:
+    """Split an evaluator paragraph or list into individual feedback items."""
+    if not feedback:
+        return []
+    if isinstance(feedback, (list, tuple)):
+        feedback = "\n".join(str(item) for item in feedback)
+    
+    items = []
+    for line in re.split(r'[\n;]+', feedback):
+        line = re.sub(r'^\s*(?:[-*•]|\d+[.)])\s*', '', line).strip()
+        for sentence in re.split(r'(?<=[.!?])\s+', line):
+            sentence = sentence.strip()
+            if len(sentence) > 2 and sentence.lower() not in _NO_FEEDBACK:
+                items.append(sentence)
+    return items
+
+def select_unresolved_feedback(feedback: str, previous_history: list = None) -> List[str]:
+    """
+    Unique feedback items that still need work.
     
-    for past_feedback in recent_feedback:
-        if not past_feedback:
-            continue
-        past_words = set(past_feedback.lower().split())
-        
-        # Calculate similarity
-        if current_words and past_words:
-            intersection = current_words & past_words
-            union = current_words | past_words
-            similarity = len(intersection) / len(union) if union else 0
-            
-            if similarity > 0.8:  # 80% similarity threshold
-                return True
-    
-    return False
-
-def _create_alternative_approach(original_prompt: str, feedback: str, iteration: int, history: list) -> str:
+    Near-duplicate items are collapsed and items the latest evaluation lists
+    under correct elements are treated as addressed. Items that were already
+    raised in earlier iterations come first, since they have resisted fixing.
+    """
+    previous_history = previous_history or []
+    addressed = []
+    earlier = []
+    if previous_history:
+        addressed = split_feedback_items(previous_history[-1].get('evaluation', {}).get('correct_elements'))
+        for entry in previous_history[:-1]:
+            earlier.extend(split_feedback_items(entry.get('evaluation', {}).get('improvements')))
+    
+    def is_known(item: str, others: List[str]) -> bool:
+        return any(_word_similarity(item, other) >= FEEDBACK_SIMILARITY for other in others)
+    
+    items = split_feedback_items(feedback)
+    unique: List[str] = []
+    for item in items:
+        if not is_known(item, unique):
+            unique.append(item)
+    
+    unresolved = [item for item in unique if not is_known(item, addressed)] or unique
+    return sorted(unresolved, key=lambda item: not is_known(item, earlier))
+
+def _fit_prompt_to_budget(
+    header: str,
+    items_title: str,
+    items: List[str],
+    optional: List[str],
+    max_chars: Optional[int] = None,
+) -> str:
+    """
+    Join prompt sections, staying within ``max_chars`` when given.
+    
+    The header (original request) is always kept. Over budget, optional
+    sections are dropped last-first, then the lowest priority feedback items,
+    and finally the remaining item is shortened.
+    """
+    items = list(items)
+    optional = list(optional)
+    
+    def render() -> str:
+        parts = [header]
+        if items:
+            parts.append(f"\n{items_title}\n" + "\n".join(f"- {item}" for item in items))
+        parts.extend(optional)
+        return "\n".join(parts).strip()
+    
+    prompt = render()
+    if not max_chars:
+        return prompt
+    
+    while len(prompt) > max_chars and optional:
+        optional.pop()
+        prompt = render()
+    while len(prompt) > max_chars and len(items) > 1:
+        items.pop()
+        prompt = render()
+    if len(prompt) > max_chars and items:
+        keep = len(items[0]) - (len(prompt) - max_chars) - 3
+        items = [items[0][:keep].rstrip() + "..."] if keep > 0 else []
+        prompt = render()
+    return prompt
+
+def _create_alternative_approach(
+    original_prompt: str,
+    feedback: str,
+    iteration: int,
+    history: list,
+    max_chars: Optional[int] = None,
+) -> str:
     """Create alternative approaches when stuck in repetitive loops."""
     alternatives = []
     
@@ -119,23 +244,24 @@ def _create_alternative_approach(original_prompt: str, feedback: str, iteration:
     # Analyze what's been tried from history
     tried_approaches = _extract_attempted_approaches(history)
     
-    enhanced = f"""
-    Original request: {original_prompt}
-    
-    ITERATION {iteration} - ALTERNATIVE APPROACH NEEDED
-    Previous attempts have been repetitive. Trying a new strategy:
-    
-    Current issue: {feedback}
-    
-    Alternative approaches to try:
-    {chr(10).join(['• ' + alt for alt in alternatives])}
-    
-    Previously attempted: {tried_approaches}
-    
-    Use a fundamentally different approach than before. Be creative and specific.
-    """
-    
-    return enhanced.strip()
+    header = (
+        f"Original request: {original_prompt}\n\n"
+        f"ITERATION {iteration} - ALTERNATIVE APPROACH NEEDED\n"
+        "Previous attempts have been repetitive. Trying a new strategy:"
+    )
+    optional = [
+        "\nAlternative approaches to try:\n" + "\n".join('• ' + alt for alt in alternatives),
+        f"\nPreviously attempted: {tried_approaches}",
+        "\nUse a fundamentally different approach than before. Be creative and specific.",
+    ]
+    
+    return _fit_prompt_to_budget(
+        header,
+        "Current issues:",
+        select_unresolved_feedback(feedback, history),
+        optional,
+        max_chars,
+    )
 
 def _get_iteration_strategy(iteration: int, history_length: int) -> str:
     """Get strategy based on iteration number."""
@@ -281,15 +407,103 @@ def resize_image_if_needed(image: Image.Image, max_size: int = 1024) -> Image.Im
     
     return image.resize((new_width, new_height), Image.Resampling.LANCZOS)
 
+def perceptual_hash(image: Image.Image, hash_size: int = 8) -> str:
+    """
+    Average hash of an image as a hex string.
+    
+    The image is reduced to a ``hash_size`` x ``hash_size`` grayscale
+    thumbnail and thresholded at its mean in one pass inside PIL, so near
+    identical images (re-encodes, tiny edits) get hashes a few bits apart.
+    """
+    small = image.convert("L").resize((hash_size, hash_size), Image.Resampling.BOX)
+    mean = ImageStat.Stat(small).mean[0]
+    return small.point(lambda p: 255 if p > mean else 0, mode="1").tobytes().hex()
+
+def hash_distance(hash1: str, hash2: str) -> int:
+    """Number of differing bits between two perceptual hashes."""
+    return bin(int(hash1, 16) ^ int(hash2, 16)).count("1")
+
+# Improvement text fed back to the generator for each pre-check failure
+REJECTION_FEEDBACK = {
+    'too_small': "The image came back too small; generate a full-size image.",
+    'uniform': "The image was blank or a single flat colour; generate a complete, detailed image.",
+    'low_entropy': "The image had almost no visible detail; generate a fully rendered image.",
+    'unchanged': "The image was returned unchanged; make clearly visible edits.",
+}
+
+def precheck_image(
+    image: Image.Image,
+    base_image: Optional[Image.Image] = None,
+    min_size: int = 32,
+    min_stddev: float = 2.0,
+    min_entropy: float = 0.5,
+    min_base_diff: float = 0.0,
+) -> dict:
+    """
+    Cheap local checks run before paying for an evaluation call.
+    
+    Rejects images that are tiny, near-uniform (grayscale standard
+    deviation), nearly detail-free (histogram entropy in bits) or, when
+    ``min_base_diff`` is set, identical to the base image they were edited
+    from (mean absolute pixel difference).
+    Statistics are computed by PIL on a thumbnail of at most 256px.
+    
+    Returns:
+        Dict with ``passed``, ``reason`` (None or a REJECTION_FEEDBACK key) and ``stats``
+    """
+    width, height = image.size
+    gray = image.convert("L")
+    if max(width, height) > 256:
+        gray.thumbnail((256, 256), Image.Resampling.BOX)
+    
+    stats = {
+        'width': width,
+        'height': height,
+        'stddev': round(ImageStat.Stat(gray).stddev[0], 3),
+        'entropy': round(gray.entropy(), 3),
+        'base_diff': None,
+    }
+    if base_image is not None:
+        base_gray = base_image.convert("L").resize(gray.size, Image.Resampling.BOX)
+        stats['base_diff'] = round(ImageStat.Stat(ImageChops.difference(gray, base_gray)).mean[0], 3)
+    
+    reason = None
+    if min(width, height) < min_size:
+        reason = 'too_small'
+    elif stats['stddev'] < min_stddev:
+        reason = 'uniform'
+    elif stats['entropy'] < min_entropy:
+        reason = 'low_entropy'
+    elif stats['base_diff'] is not None and stats['base_diff'] < min_base_diff:
+        reason = 'unchanged'
+    
+    return {'passed': reason is None, 'reason': reason, 'stats': stats}
+
+def summarize_rejections(history: list) -> dict:
+    """Count pre-check rejections across a session's history."""
+    by_reason = {}
+    for entry in history:
+        for rejection in entry.get('rejections') or []:
+            by_reason[rejection['reason']] = by_reason.get(rejection['reason'], 0) + 1
+    return {
+        'total': sum(by_reason.values()),
+        'by_reason': by_reason,
+        'rejected_iterations': sum(1 for entry in history if entry.get('rejected')),
+    }
+
 def create_session_zip(
     session_dir: Path,
-    images: List[Image.Image],
+    images: List[Union[Image.Image, ImageRef]],
     evaluations: List[dict],
     prompt: str,
     input_image: Optional[Image.Image] = None,
     input_images: Optional[List[Image.Image]] = None,
 ) -> Path:
-    """Create a ZIP file with all session artifacts."""
+    """Create a ZIP file with all session artifacts.
+
+    ``images`` may mix PIL images and ImageRef handles; spilled images are
+    loaded one at a time while writing.
+    """
     # Ensure the session directory exists
     session_dir.mkdir(parents=True, exist_ok=True)
     zip_path = session_dir / f"session_{session_dir.name}.zip"
@@ -297,6 +511,8 @@ def create_session_zip(
     with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
         # Add all iteration images
         for i, image in enumerate(images, 1):
+            if isinstance(image, ImageRef):
+                image = image.load()
             if image and validate_image(image):
                 img_buffer = io.BytesIO()
                 image.save(img_buffer, format='PNG', optimize=True)
@@ -0,0 +1,65 @@
+"""Shared fixtures for tests that exercise the agent without API calls."""
+
+import pytest
+from PIL import Image, ImageDraw
+
+from banana_straightener import BananaStraightener, Config
+from banana_straightener.models import BaseModel
+
+
+class FakeModel(BaseModel):
+    """Deterministic stand-in for GeminiModel.
+
+    Each generated image gets a distinct background colour behind the same
+    yellow square (so all share one perceptual hash); evaluations return the
+    configured confidences in order (repeating the last one).
+    """
+
+    def __init__(self, confidences=(0.3, 0.6, 0.9), threshold=0.85):
+        self.confidences = list(confidences)
+        self.threshold = threshold
+        self.generate_calls = 0
+        self.evaluate_calls = 0
+
+    def generate_image(self, prompt, base_images=None, **kwargs):
+        self.generate_calls += 1
+        shade = (self.generate_calls * 40) % 256
+        image = Image.new("RGB", (64, 64), (shade, 255 - shade, 128))
+        ImageDraw.Draw(image).rectangle((16, 16, 47, 47), fill=(255, 220, 0))
+        return image
+
+    def evaluate_image(self, image, target_prompt, prompt_template=None, **kwargs):
+        index = min(self.evaluate_calls, len(self.confidences) - 1)
+        self.evaluate_calls += 1
+        confidence = self.confidences[index]
+        matches = confidence >= self.threshold
+        return {
+            "matches_intent": matches,
+            "confidence": confidence,
+            "correct_elements": "shape",
+            "missing_elements": "" if matches else "colour",
+            "improvements": "" if matches else f"Make it more yellow (round {index + 1})",
+            "raw_feedback": f"CONFIDENCE: {confidence}",
+        }
+
+
+@pytest.fixture
+def fake_model():
+    return FakeModel()
+
+
+@pytest.fixture
+def make_agent(tmp_path):
+    """Factory building agents wired to FakeModel instead of Gemini."""
+
+    def factory(config=None, confidences=(0.3, 0.6, 0.9), session_id=None, **config_kwargs):
+        if config is None:
+            config_kwargs.setdefault("output_dir", tmp_path / "outputs")
+            config = Config(api_key="dummy-key-for-testing", **config_kwargs)
+        agent = BananaStraightener(config, session_id=session_id)
+        model = FakeModel(confidences, threshold=config.success_threshold)
+        agent.generator = model
+        agent.evaluator = model
+        return agent
+
+    return factory
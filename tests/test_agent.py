@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Agent loop behaviour tests using the fake model (no API calls required).
+"""
+
+import json
+
+from PIL import Image
+
+from banana_straightener.models import SELF_CRITIQUE_TEMPLATE
+
+from .conftest import FakeModel
+
+
+def test_unchanged_images_trigger_alternative_then_stop(make_agent):
+    # FakeModel images differ only in background colour: one perceptual hash
+    agent = make_agent(
+        confidences=(0.3,),
+        default_max_iterations=6,
+        unchanged_streak_limit=1,
+        unchanged_stop_streak=2,
+    )
+    result = agent.straighten("a straight banana")
+
+    history = result["history"]
+    assert result["success"] is False
+    assert result["iterations"] == 3
+    assert [h["unchanged_streak"] for h in history] == [0, 1, 2]
+    assert len({h["image_hash"] for h in history}) == 1
+    assert "ALTERNATIVE APPROACH" not in history[1]["prompt_used"]
+    assert "ALTERNATIVE APPROACH" in history[2]["prompt_used"]
+
+
+class SilentModel(FakeModel):
+    """Never gives any improvement feedback."""
+
+    def evaluate_image(self, image, target_prompt, prompt_template=None, **kwargs):
+        return {**super().evaluate_image(image, target_prompt), "improvements": ""}
+
+
+def test_unchanged_images_trigger_alternative_without_feedback(make_agent):
+    for iterative in (False, True):
+        agent = make_agent(default_max_iterations=3, unchanged_streak_limit=1)
+        agent.generator = agent.evaluator = SilentModel(confidences=(0.3,))
+
+        if iterative:
+            history = list(agent.straighten_iterative("a straight banana"))
+        else:
+            history = agent.straighten("a straight banana")["history"]
+        assert [h["unchanged_streak"] for h in history] == [0, 1, 2]
+        assert history[1]["prompt_used"] == "a straight banana"
+        assert "ALTERNATIVE APPROACH" in history[2]["prompt_used"]
+
+
+def test_straighten_iterative_stops_on_unchanged_images(make_agent):
+    agent = make_agent(confidences=(0.3,), default_max_iterations=6, unchanged_stop_streak=3)
+    results = list(agent.straighten_iterative("a straight banana"))
+
+    assert [r["unchanged_streak"] for r in results] == [0, 1, 2, 3]
+
+
+class BlankFirstModel(FakeModel):
+    """Returns blank images for the first ``blanks`` generations."""
+
+    def __init__(self, blanks, **kwargs):
+        super().__init__(**kwargs)
+        self.blanks = blanks
+
+    def generate_image(self, prompt, base_images=None, **kwargs):
+        image = super().generate_image(prompt, base_images, **kwargs)
+        if self.generate_calls <= self.blanks:
+            return Image.new("RGB", image.size, "white")
+        return image
+
+
+def test_precheck_regenerates_blank_images_without_evaluating(make_agent):
+    agent = make_agent(precheck_retries=2)
+    model = BlankFirstModel(blanks=1)
+    agent.generator = agent.evaluator = model
+
+    result = agent.straighten("a straight banana")
+
+    assert result["success"] is True
+    assert model.generate_calls == 4
+    assert model.evaluate_calls == 3
+    assert result["history"][0]["rejections"][0]["reason"] == "uniform"
+    report = json.loads((agent.session_dir / "session_report.json").read_text())
+    assert report["rejections"] == {"total": 1, "by_reason": {"uniform": 1}, "rejected_iterations": 0}
+    assert report["metrics"] == {"counters": {}, "rates": {}}
+
+
+def test_precheck_rejected_iteration_gets_synthetic_evaluation(make_agent):
+    agent = make_agent(precheck_retries=1, default_max_iterations=2)
+    model = BlankFirstModel(blanks=2)
+    agent.generator = agent.evaluator = model
+
+    results = list(agent.straighten_iterative("a straight banana"))
+
+    first = results[0]
+    assert first["rejected"] is True
+    assert first["evaluation"]["rejection_reason"] == "uniform"
+    assert first["image_ref"] is None and first["current_image"] is None
+    assert len(first["rejections"]) == 2
+    # Only the second iteration's image reached the evaluator
+    assert model.evaluate_calls == 1
+    assert results[1]["rejected"] is False
+
+
+def test_rejected_images_do_not_count_as_unchanged(make_agent):
+    agent = make_agent(
+        precheck_retries=0, default_max_iterations=5, unchanged_streak_limit=1, unchanged_stop_streak=2
+    )
+    model = BlankFirstModel(blanks=3)
+    agent.generator = agent.evaluator = model
+
+    results = list(agent.straighten_iterative("a straight banana"))
+
+    # Three identical blank images were rejected without stopping the session
+    assert [r["rejected"] for r in results[:3]] == [True, True, True]
+    assert [r["unchanged_streak"] for r in results] == [0, 0, 0, 0, 1]
+
+
+class SelfCritiqueModel(FakeModel):
+    """Returns a self-evaluation with each generated image."""
+
+    def __init__(self, self_confidences, **kwargs):
+        super().__init__(**kwargs)
+        self.self_confidences = list(self_confidences)
+        self.templates = []
+
+    def generate_and_evaluate(self, prompt, target_prompt, base_images=None, prompt_template=None):
+        self.templates.append(prompt_template)
+        image = self.generate_image(prompt, base_images)
+        confidence = self.self_confidences[min(self.generate_calls, len(self.self_confidences)) - 1]
+        return image, {
+            "matches_intent": confidence >= self.threshold,
+            "confidence": confidence,
+            "improvements": "" if confidence >= self.threshold else "Straighter",
+            "self_evaluated": True,
+        }
+
+
+def test_self_critique_skips_evaluator_away_from_threshold(make_agent):
+    agent = make_agent(self_critique=True, self_critique_margin=0.1)
+    model = SelfCritiqueModel(self_confidences=(0.3, 0.9, 0.97), confidences=(0.6,))
+    agent.generator = agent.evaluator = model
+
+    result = agent.straighten("a straight banana")
+
+    assert result["success"] is True
+    # Only the 0.9 self-score (within 0.1 of 0.85) needed a separate evaluation
+    assert model.evaluate_calls == 1
+    assert [h["evaluation_source"] for h in result["history"]] == ["self", "evaluator", "self"]
+    report = json.loads((agent.session_dir / "session_report.json").read_text())
+    assert report["evaluation_sources"] == {"self": 2, "evaluator": 1}
+    assert model.templates == [SELF_CRITIQUE_TEMPLATE] * 3
+
+
+class ComparingModel(FakeModel):
+    """Prefers the candidate at ``preferred`` in comparative evaluations."""
+
+    def __init__(self, preferred, **kwargs):
+        super().__init__(**kwargs)
+        self.preferred = preferred
+        self.compared = []
+
+    def evaluate_images(self, images, target_prompt, **kwargs):
+        self.compared.append(len(images))
+        ranking = [self.preferred] + [i for i in range(len(images)) if i != self.preferred]
+        evaluations = [{"confidence": 0.5} for _ in images]
+        return {"evaluations": evaluations, "ranking": ranking, "best_index": self.preferred}
+
+
+def test_best_attempt_picked_by_one_comparative_call(make_agent):
+    agent = make_agent(compare_best_attempts=True, best_attempt_candidates=3, default_max_iterations=4)
+    model = ComparingModel(preferred=1, confidences=(0.3, 0.6, 0.5, 0.2))
+    agent.generator = agent.evaluator = model
+
+    result = agent.straighten("a straight banana")
+
+    assert result["success"] is False
+    assert model.compared == [3]
+    selection = result["best_attempt_selection"]
+    assert selection["candidates"] == [2, 3, 1]
+    assert selection["chosen_iteration"] == 3
+    # Iteration 3's image has FakeModel's third background colour
+    assert result["final_image"].getpixel((0, 0)) == (120, 135, 128)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Tests for resumable batch manifest processing (no API calls required).
+"""
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from banana_straightener import Config
+from banana_straightener.batch import iter_manifest, job_key, load_completed_keys, run_batch
+
+
+def _write_manifest(path, entries):
+    path.write_text("\n".join(json.dumps(e) for e in entries) + "\n", encoding="utf-8")
+
+
+def test_job_key_is_stable():
+    assert job_key({"id": 7, "prompt": "x"}) == "7"
+    assert job_key({"prompt": "a cat"}) == job_key({"prompt": "a cat", "images": []})
+    assert job_key({"prompt": "a cat"}) != job_key({"prompt": "a dog"})
+
+
+def test_iter_manifest_skips_bad_lines(tmp_path):
+    manifest = tmp_path / "manifest.jsonl"
+    manifest.write_text('{"prompt": "ok"}\n\nnot json\n{"id": "x"}\n[1, 2]\n42\nnull\n"plain prompt"\n')
+    entries = list(iter_manifest(manifest))
+    assert [e["prompt"] for e in entries] == ["ok", "plain prompt"]
+
+
+def test_run_batch_resumes(tmp_path, make_agent):
+    manifest = tmp_path / "manifest.jsonl"
+    results = tmp_path / "results.jsonl"
+    _write_manifest(manifest, [{"prompt": f"prompt {i}"} for i in range(5)])
+    config = Config(api_key="dummy-key-for-testing", output_dir=tmp_path / "outputs")
+    factory = lambda cfg, session_id: make_agent(cfg)
+
+    stats = run_batch(manifest, results, config, concurrency=3, agent_factory=factory)
+    assert stats.processed == 5 and stats.succeeded == 5
+    assert len(load_completed_keys(results)) == 5
+
+    # Simulate a crash that left a truncated line, then re-run
+    with open(results, "a") as f:
+        f.write('{"key": "trunc')
+    _write_manifest(manifest, [{"prompt": f"prompt {i}"} for i in range(7)])
+    stats = run_batch(manifest, results, config, concurrency=3, agent_factory=factory)
+    assert stats.skipped == 5
+    assert stats.processed == 2
+    assert len(load_completed_keys(results)) == 7
+
+
+def test_shard_assignment_is_stable_and_complete():
+    from banana_straightener.batch import parse_shard, shard_of
+
+    assert parse_shard("1/4") == (1, 4)
+    keys = [f"job-{i}" for i in range(200)]
+    shards = [shard_of(k, 4) for k in keys]
+    assert shards == [shard_of(k, 4) for k in keys]
+    assert set(shards) == {0, 1, 2, 3}
+
+
+def test_stale_lock_is_taken_over_once(tmp_path):
+    from banana_straightener.batch import LockDir
+
+    lock_dir = tmp_path / "locks"
+    assert LockDir(lock_dir, "0/2").acquire("job")
+    assert not LockDir(lock_dir, "1/2").acquire("job")
+
+    # Age the lock past the stale limit; the next owner steals it
+    (stale,) = lock_dir.glob("*.lock")
+    os.utime(stale, (0, 0))
+    assert LockDir(lock_dir, "1/2", stale_seconds=60).acquire("job")
+    assert "1/2" in [p.read_text().split("\n")[0] for p in lock_dir.glob("*.lock")]
+    # The original holder's old lock no longer counts, even for itself
+    assert not LockDir(lock_dir, "0/2", stale_seconds=60).acquire("job")
+
+    # Many nodes racing for one stale lock: exactly one wins
+    for path in lock_dir.glob("*.lock"):
+        os.utime(path, (0, 0))
+    contenders = [LockDir(lock_dir, f"node-{i}", stale_seconds=60) for i in range(8)]
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        won = list(pool.map(lambda locks: locks.acquire("job"), contenders))
+    assert won.count(True) == 1
+
+
+def test_sharded_run_with_stealing_and_merge(tmp_path, make_agent):
+    from banana_straightener.batch import merge_results, run_sharded_batch, shard_of
+
+    manifest = tmp_path / "manifest.jsonl"
+    _write_manifest(manifest, [{"id": f"job-{i}", "prompt": f"prompt {i}"} for i in range(12)])
+    config = Config(api_key="dummy-key-for-testing", output_dir=tmp_path / "outputs")
+    factory = lambda cfg, session_id: make_agent(cfg)
+    results_dir = tmp_path / "shared"
+
+    # Shard 0 finishes its own work and steals everything shard 1 never started
+    stats = run_sharded_batch(manifest, results_dir, config, 0, 2, concurrency=2,
+                              steal=True, agent_factory=factory)
+    assert stats.processed == 12
+    # Shard 1 starts late and finds nothing left to do
+    late = run_sharded_batch(manifest, results_dir, config, 1, 2, concurrency=2,
+                             steal=True, agent_factory=factory)
+    assert late.processed == 0
+
+    summary = merge_results(sorted(results_dir.glob("*.jsonl")), results_dir / "merged.jsonl")
+    assert summary["total"] == 12
+    assert summary["succeeded"] == 12
+    assert (results_dir / "merged_summary.json").exists()
+    # Some of the processed jobs belonged to shard 1, i.e. were stolen
+    assert any(shard_of(f"job-{i}", 2) == 1 for i in range(12))
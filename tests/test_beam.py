@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Tests for beam search over prompt refinements (no API calls required).
+"""
+
+import json
+import threading
+
+from PIL import Image
+
+from banana_straightener.models import BaseModel
+
+
+class PromptScoredModel(BaseModel):
+    """Scores each image by the prompt that generated it (thread-safe)."""
+
+    def __init__(self, score):
+        self.score = score
+        self.lock = threading.Lock()
+        self.generate_calls = 0
+        self.evaluate_calls = 0
+
+    def generate_image(self, prompt, base_images=None, **kwargs):
+        with self.lock:
+            self.generate_calls += 1
+            shade = (self.generate_calls * 37) % 256
+        image = Image.new("RGB", (64, 64), (shade, 255 - shade, 128))
+        image.paste((255, 220, 0), (16, 16, 48, 48))
+        image.info["prompt"] = prompt
+        return image
+
+    def evaluate_image(self, image, target_prompt, prompt_template=None, **kwargs):
+        with self.lock:
+            self.evaluate_calls += 1
+        confidence = self.score(image.info["prompt"])
+        return {
+            "matches_intent": confidence >= 0.85,
+            "confidence": confidence,
+            "correct_elements": "shape",
+            "missing_elements": "colour",
+            "improvements": "Make it more yellow. Add a shadow.",
+            "raw_feedback": f"CONFIDENCE: {confidence}",
+        }
+
+
+def _beam_agent(make_agent, score, **config_kwargs):
+    agent = make_agent(**config_kwargs)
+    agent.generator = agent.evaluator = PromptScoredModel(score)
+    return agent
+
+
+def test_beam_finds_alternative_branch(make_agent):
+    agent = _beam_agent(
+        make_agent,
+        lambda prompt: 0.95 if "ALTERNATIVE APPROACH" in prompt else 0.4,
+        beam_width=2, beam_expansion=2, beam_concurrency=2,
+    )
+
+    result = agent.straighten("a banana")
+
+    assert result["success"] is True
+    assert result["iterations"] == 2
+    assert result["confidence"] == 0.95
+    beam = result["beam"]
+    # Round 1: 2 samples; round 2: 2 states x 2 variants
+    assert beam["nodes"] == 6
+    assert beam["calls"] == {"generate": 6, "evaluate": 6, "total": 12}
+    assert beam["greedy_baseline_calls"] == 4
+    assert beam["call_ratio"] == 3.0
+    assert agent.generator.generate_calls == 6
+    assert len(result["best_path"]) == 2
+
+    report = json.loads((agent.session_dir / "session_report.json").read_text())
+    assert report["beam"]["calls"]["total"] == 12
+    assert len({entry["iteration"] for entry in report["history"]}) == 6
+
+
+def test_beam_prunes_to_width(make_agent):
+    agent = _beam_agent(
+        make_agent,
+        lambda prompt: 0.3 + 0.01 * len(prompt) / 100,
+        beam_width=1, beam_expansion=3, beam_concurrency=3,
+    )
+
+    result = agent.straighten_beam("a banana", max_rounds=3)
+
+    assert result["success"] is False
+    assert result["iterations"] == 3
+    history = result["history"]
+    assert len(history) == 1 + 3 + 3
+    for round_number in (2, 3):
+        parents = {entry["parent"] for entry in history if entry["round"] == round_number}
+        assert len(parents) == 1  # only the single best state was expanded
+    best = max(history, key=lambda entry: entry["evaluation"]["confidence"])
+    assert result["best_confidence"] == best["evaluation"]["confidence"]
+    assert result["final_image_path"].endswith(".png")
+
+
+def test_greedy_loop_is_default(make_agent):
+    agent = make_agent(confidences=(0.3, 0.9))
+
+    result = agent.straighten("a banana")
+
+    assert "beam" not in result
+    assert result["iterations"] == 2
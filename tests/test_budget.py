@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Tests for the learned iteration budget (no API calls required).
+"""
+
+import json
+
+from banana_straightener.budget import IterationBudget, budget_path, iter_session_reports, prompt_profile
+
+
+def _report(prompt, confidences, success, images=0):
+    return {
+        "original_prompt": prompt,
+        "input_images": images,
+        "success": success,
+        "total_iterations": len(confidences),
+        "history": [
+            {"iteration": i, "evaluation": {"confidence": c}} for i, c in enumerate(confidences, 1)
+        ],
+    }
+
+
+def _history(count=10):
+    # Successes need 2 iterations (3 for one straggler) and start above 0.5
+    reports = [_report("a red car", [0.6, 0.9], True) for _ in range(count - 1)]
+    reports.append(_report("a blue car", [0.5, 0.7, 0.9], True))
+    reports.append(_report("a green car", [0.1, 0.2, 0.2], False))
+    return reports
+
+
+def test_prompt_profile_buckets():
+    assert prompt_profile("a red car", False) == "short|text"
+    assert prompt_profile(" ".join(["word"] * 12), True) == "medium|images"
+
+
+def test_suggestion_covers_past_successes(tmp_path):
+    budget = IterationBudget(tmp_path / "budget.json", coverage=0.9)
+    assert budget.rebuild(_history()) == 11
+
+    suggestion = budget.suggest("a yellow car", has_images=False)
+
+    assert suggestion["max_iterations"] == 2
+    assert suggestion["profile"] == "short|text"
+    assert suggestion["success_rate"] == round(10 / 11, 3)
+    assert suggestion["stop_below"] == {1: 0.5, 2: 0.7}
+
+    # Stricter coverage includes the straggler
+    assert IterationBudget(tmp_path / "budget.json", coverage=1.0).suggest("a car")["max_iterations"] == 3
+    # Unknown profiles fall back to everything seen
+    assert budget.suggest(" ".join(["word"] * 40), has_images=True)["profile"] == "*"
+
+
+def test_no_suggestion_without_history(tmp_path):
+    budget = IterationBudget(tmp_path / "budget.json")
+    budget.rebuild(_history()[:3])
+    assert budget.suggest("a red car") is None
+
+
+def test_auto_budget_applies_limits_and_learns(make_agent, tmp_path):
+    output_dir = tmp_path / "outputs"
+    IterationBudget(budget_path(output_dir)).rebuild(_history())
+    agent = make_agent(output_dir=output_dir, adaptive_budget="auto", confidences=(0.2, 0.95))
+
+    result = agent.straighten("a purple car")
+
+    # Confidence 0.2 at iteration 1 is below the learned floor of 0.5
+    assert result["success"] is False
+    assert result["iterations"] == 1
+    report = json.loads((agent.session_dir / "session_report.json").read_text())
+    assert report["config"]["max_iterations"] == 2
+    assert report["budget"]["max_iterations"] == 2
+
+    learned = json.loads(budget_path(output_dir).read_text())
+    assert learned["profiles"]["short|text"]["sessions"] == 12
+    assert len(list(iter_session_reports(output_dir))) == 1
+
+
+def test_suggest_mode_does_not_change_the_run(make_agent, tmp_path):
+    output_dir = tmp_path / "outputs"
+    IterationBudget(budget_path(output_dir)).rebuild(_history())
+    agent = make_agent(output_dir=output_dir, confidences=(0.2, 0.3, 0.95))
+
+    result = agent.straighten("a purple car", max_iterations=3)
+
+    assert result["success"] is True
+    assert result["iterations"] == 3
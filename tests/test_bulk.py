@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Tests for offline bulk mode using the local stand-in transport (no API calls required).
+"""
+
+import json
+import threading
+from pathlib import Path
+from types import SimpleNamespace
+
+from PIL import Image
+
+from banana_straightener import Config
+from banana_straightener.bulk import (
+    BulkRequest,
+    GeminiBatchTransport,
+    LocalBatchTransport,
+    run_batched,
+    run_bulk,
+)
+
+from .conftest import FakeModel
+
+
+class PerPromptModel(FakeModel):
+    """Returns confidences per target prompt, so results do not depend on thread order."""
+
+    def __init__(self, confidences_by_prompt, threshold=0.85):
+        super().__init__(threshold=threshold)
+        self.confidences_by_prompt = confidences_by_prompt
+        self.calls_by_prompt = {}
+        self._lock = threading.Lock()
+
+    def evaluate_image(self, image, target_prompt, prompt_template=None, **kwargs):
+        with self._lock:
+            index = self.calls_by_prompt.get(target_prompt, 0)
+            self.calls_by_prompt[target_prompt] = index + 1
+        scores = self.confidences_by_prompt[target_prompt]
+        confidence = scores[min(index, len(scores) - 1)]
+        return {
+            "matches_intent": confidence >= self.threshold,
+            "confidence": confidence,
+            "improvements": "" if confidence >= self.threshold else "Make it more yellow",
+        }
+
+
+def _write_manifest(path, prompts):
+    path.write_text("\n".join(json.dumps({"id": p, "prompt": p}) for p in prompts) + "\n")
+
+
+def test_bulk_runs_sessions_in_lockstep(tmp_path):
+    manifest = tmp_path / "manifest.jsonl"
+    results = tmp_path / "results.jsonl"
+    _write_manifest(manifest, ["quick", "slow", "never"])
+    model = PerPromptModel({"quick": [0.9], "slow": [0.4, 0.9], "never": [0.2]})
+    transport = LocalBatchTransport(model)
+    config = Config(api_key="dummy-key-for-testing", output_dir=tmp_path / "outputs", default_max_iterations=3)
+
+    stats = run_bulk(manifest, results, config, transport, batch_size=2, poll_interval=0)
+    transport.close()
+
+    # Round sizes shrink as sessions finish: 3, then 2, then 1 active session
+    sizes = [(s["kind"], s["size"]) for s in transport.submissions]
+    assert sizes == [
+        ("generate", 2), ("generate", 1), ("evaluate", 2), ("evaluate", 1),
+        ("generate", 2), ("evaluate", 2),
+        ("generate", 1), ("evaluate", 1),
+    ]
+    records = {r["key"]: r for r in map(json.loads, results.read_text().splitlines())}
+    assert records["quick"]["success"] and records["quick"]["iterations"] == 1
+    assert records["slow"]["success"] and records["slow"]["iterations"] == 2
+    assert not records["never"]["success"] and records["never"]["iterations"] == 3
+    assert all(r["mode"] == "bulk" for r in records.values())
+    assert (stats.processed, stats.succeeded, stats.failed) == (3, 2, 1)
+
+    report = json.loads((tmp_path / "outputs" / records["slow"]["session_id"] / "session_report.json").read_text())
+    assert report["final_image_path"].endswith("iteration_02.png")
+    assert report["history"][1]["prompt_used"] != "slow"  # feedback was folded into the prompt
+
+    # Re-running skips everything already finished
+    transport = LocalBatchTransport(model)
+    stats = run_bulk(manifest, results, config, transport, poll_interval=0)
+    transport.close()
+    assert stats.skipped == 3 and stats.processed == 0
+    assert transport.submissions == []
+
+
+def test_run_batched_reports_errors_per_request(tmp_path):
+    class FailingModel(FakeModel):
+        def generate_image(self, prompt, base_images=None, **kwargs):
+            if prompt == "boom":
+                raise RuntimeError("quota exceeded")
+            return super().generate_image(prompt, base_images)
+
+    transport = LocalBatchTransport(FailingModel(), workers=2)
+    responses = run_batched(
+        transport, "generate",
+        [BulkRequest("a", "generate", "fine"), BulkRequest("b", "generate", "boom")],
+        poll_interval=0,
+    )
+    transport.close()
+
+    assert responses["a"]["image"].size == (64, 64)
+    assert responses["b"] == {"error": "quota exceeded"}
+
+
+class StubBatchClient:
+    """Batch and Files API stand-in that answers every evaluation with a match."""
+
+    def __init__(self):
+        self.sources = []
+        self.uploads = {}
+        self.batches = SimpleNamespace(create=self._create, get=self._get)
+        self.files = SimpleNamespace(upload=self._upload, download=self._download)
+
+    def _upload(self, file, config):
+        name = f"files/upload-{len(self.uploads) + 1}"
+        self.uploads[name] = [json.loads(line) for line in Path(file).read_text().splitlines()]
+        return SimpleNamespace(name=name)
+
+    def _create(self, model, src, config):
+        self.sources.append(src)
+        return SimpleNamespace(name=f"batches/{len(self.sources)}")
+
+    def _get(self, name):
+        src = self.sources[int(name.split("/")[1]) - 1]
+        keys = [line["key"] for line in self.uploads[src]] if isinstance(src, str) else []
+        self.results = "\n".join(json.dumps({
+            "key": key,
+            "response": {"candidates": [{"content": {"parts": [{"text": "MATCH: YES\nCONFIDENCE: 0.9\n"}]}}]},
+        }) for key in keys)
+        dest = SimpleNamespace(file_name="files/results" if keys else None, inlined_responses=[])
+        return SimpleNamespace(name=name, state=SimpleNamespace(name="JOB_STATE_SUCCEEDED"), dest=dest)
+
+    def _download(self, file):
+        return self.results.encode("utf-8")
+
+
+def test_gemini_transport_uploads_large_submissions(tmp_path):
+    image_path = tmp_path / "image.png"
+    Image.new("RGB", (64, 64), "yellow").save(image_path)
+    requests = [BulkRequest("a", "evaluate", "a yellow square", [str(image_path)])]
+    config = Config(
+        api_key="dummy-key-for-testing", output_dir=tmp_path, evaluation_max_size=16, evaluation_format="jpeg"
+    )
+
+    transport = GeminiBatchTransport(config, inline_limit_bytes=0)
+    transport.client = client = StubBatchClient()
+    responses = run_batched(transport, "evaluate", requests, poll_interval=0)
+
+    assert client.sources == ["files/upload-1"]
+    (line,) = client.uploads["files/upload-1"]
+    assert line["request"]["contents"][0]["parts"][1]["inline_data"]["mime_type"] == "image/jpeg"
+    assert responses["a"]["evaluation"]["confidence"] == 0.9
+
+    # Small submissions stay inline
+    transport = GeminiBatchTransport(config)
+    transport.client = client = StubBatchClient()
+    transport.submit("evaluate", requests)
+    (inline,) = client.sources[0]
+    assert inline.metadata == {"key": "a"}
+    assert inline.contents[0].parts[1].inline_data.mime_type == "image/jpeg"
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Tests for the evaluator cascade (no API calls required).
+"""
+
+import json
+
+from PIL import Image
+
+from banana_straightener.cascade import CascadeEvaluator
+from banana_straightener.metrics import Metrics
+
+from .conftest import FakeModel
+
+IMAGE = Image.new("RGB", (8, 8))
+
+
+def test_clear_verdicts_stay_on_fast_tier():
+    fast, strong = FakeModel((0.1, 0.98)), FakeModel((0.9,))
+    cascade = CascadeEvaluator(fast, strong, threshold=0.85, margin=0.1)
+
+    low = cascade.evaluate_image(IMAGE, "a banana")
+    high = cascade.evaluate_image(IMAGE, "a banana")
+
+    assert (low["confidence"], high["confidence"]) == (0.1, 0.98)
+    assert low["cascade"] == {"tier": "fast"}
+    assert strong.evaluate_calls == 0
+    stats = cascade.stats()
+    assert stats["escalation_rate"] == 0
+    assert stats["tiers"]["fast"]["calls"] == 2 and stats["tiers"]["strong"]["calls"] == 0
+
+
+def test_close_calls_escalate_and_record_agreement():
+    fast, strong = FakeModel((0.8, 0.9), threshold=0.85), FakeModel((0.9, 0.95), threshold=0.85)
+    cascade = CascadeEvaluator(fast, strong, threshold=0.85, margin=0.1, metrics=Metrics())
+
+    disagreed = cascade.evaluate_image(IMAGE, "a banana")
+    agreed = cascade.evaluate_image(IMAGE, "a banana")
+
+    assert disagreed["confidence"] == 0.9 and disagreed["matches_intent"] is True
+    assert disagreed["cascade"] == {"tier": "strong", "fast_confidence": 0.8, "agreed": False}
+    assert agreed["cascade"]["agreed"] is True
+    stats = cascade.stats()
+    assert stats["escalation_rate"] == 1.0
+    assert stats["agreement_rate"] == 0.5
+
+
+def test_session_threshold_overrides_default():
+    cascade = CascadeEvaluator(FakeModel((0.5,)), FakeModel((0.6,)), threshold=0.85, margin=0.1)
+
+    evaluation = cascade.evaluate_image(IMAGE, "a banana", success_threshold=0.55)
+
+    assert evaluation["cascade"]["tier"] == "strong"
+
+
+def test_agent_reports_cascade_stats(make_agent):
+    agent = make_agent(evaluator_cascade=True, cascade_margin=0.1)
+    # make_agent swaps in FakeModel evaluators; put the cascade back in front
+    agent.cascade.fast = FakeModel((0.3, 0.8))
+    agent.cascade.strong = FakeModel((0.9,))
+    agent.evaluator = agent.cascade
+
+    result = agent.straighten("a banana", max_iterations=3)
+
+    assert result["success"] is True
+    assert result["iterations"] == 2
+    report = json.loads((agent.session_dir / "session_report.json").read_text())
+    cascade = report["cascade"]
+    assert cascade["tiers"]["fast"]["calls"] == 2
+    assert cascade["tiers"]["strong"]["calls"] == 1
+    assert cascade["escalation_rate"] == 0.5
+    assert report["history"][0]["evaluation"]["cascade"]["tier"] == "fast"
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Tests for the SQLite session catalog (no API calls required).
+"""
+
+import json
+
+from banana_straightener.catalog import SessionCatalog, catalog_path
+
+
+def _write_report(output_dir, session_id, prompt, success, confidence):
+    session_dir = output_dir / session_id
+    session_dir.mkdir(parents=True)
+    report = {
+        "session_id": session_id,
+        "timestamp": f"2025-01-{session_id[-2:]}T10:00:00",
+        "original_prompt": prompt,
+        "success": success,
+        "total_iterations": 2,
+        "final_confidence": confidence,
+        "config": {"generator_model": "gen", "evaluator_model": "eval", "success_threshold": 0.85},
+        "history": [
+            {"iteration": 1, "prompt_used": prompt, "evaluation": {"confidence": 0.4},
+             "timings": {"generation_seconds": 1.5, "evaluation_seconds": 0.5}},
+            {"iteration": 2, "prompt_used": prompt, "evaluation": {"confidence": confidence}},
+        ],
+    }
+    (session_dir / "session_report.json").write_text(json.dumps(report))
+
+
+def test_agent_indexes_sessions(make_agent, tmp_path):
+    agent = make_agent(output_dir=tmp_path)
+    result = agent.straighten("a straight banana")
+
+    session = SessionCatalog.for_output_dir(tmp_path).get(result["session_id"])
+    assert session["success"] == 1
+    assert session["final_image_path"] == result["final_image_path"]
+    assert [it["confidence"] for it in session["iterations"]] == [0.3, 0.6, 0.9]
+
+
+def test_rebuild_and_query(tmp_path):
+    _write_report(tmp_path, "s_01", "a red car", True, 0.9)
+    _write_report(tmp_path, "s_02", "a red car at night", False, 0.5)
+    _write_report(tmp_path, "s_03", "a blue 100% cat", True, 0.95)
+    (tmp_path / "broken").mkdir()
+    (tmp_path / "broken" / "session_report.json").write_text("{not json")
+
+    catalog = SessionCatalog(catalog_path(tmp_path))
+    assert catalog.rebuild(tmp_path, workers=2) == 3
+
+    assert [r["session_id"] for r in catalog.query(prompt="RED CAR")] == ["s_02", "s_01"]
+    assert [r["session_id"] for r in catalog.query(prompt="red car", success=True)] == ["s_01"]
+    assert [r["session_id"] for r in catalog.query(prompt="100%")] == ["s_03"]
+    assert [r["session_id"] for r in catalog.query(since="2025-01-02")] == ["s_03", "s_02"]
+    assert catalog.get("s_01")["total_seconds"] == 2.0
+    assert catalog.stats()["succeeded"] == 2
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+CLI tests using click's test runner (no API calls required).
+"""
+
+import json
+
+from click.testing import CliRunner
+
+from banana_straightener import cli
+from banana_straightener.budget import IterationBudget, budget_path
+
+
+def test_generate_jsonl_event_stream(tmp_path, monkeypatch, make_agent):
+    monkeypatch.setenv("BEAM_WIDTH", "3")  # ignored: beam search emits no events
+    monkeypatch.setattr(cli, "BananaStraightener", lambda config: make_agent(config))
+
+    result = CliRunner().invoke(cli.main, [
+        "generate", "a straight banana",
+        "--output-format", "jsonl",
+        "--api-key", "dummy-key-for-testing",
+        "--output", str(tmp_path),
+        "--save-all",
+    ])
+
+    assert result.exit_code == 0, result.output
+    events = [json.loads(line) for line in result.output.splitlines()]
+    names = [e["event"] for e in events]
+    assert names[0] == "start" and names[-1] == "finished"
+    assert names.count("generated") == 3
+    assert names.count("evaluated") == 3
+    assert "saved" in names
+    assert all(e["schema_version"] == 1 and e["session_id"] for e in events)
+
+    evaluated = [e for e in events if e["event"] == "evaluated"]
+    assert [e["confidence"] for e in evaluated] == [0.3, 0.6, 0.9]
+    assert set(evaluated[0]["timings"]) == {"generation_seconds", "evaluation_seconds"}
+    assert events[-1]["success"] is True
+
+
+def test_commands_honour_environment_settings(tmp_path, monkeypatch):
+    monkeypatch.setenv("BEAM_WIDTH", "3")
+    monkeypatch.setenv("EVALUATOR_CASCADE", "true")
+    monkeypatch.setenv("MAX_ITERATIONS", "2")
+    monkeypatch.setenv("OUTPUT_DIR", str(tmp_path / "env-outputs"))
+    configs = []
+
+    def capture(config):
+        configs.append(config)
+        raise RuntimeError("stop before any API call")
+
+    monkeypatch.setattr(cli, "BananaStraightener", capture)
+
+    result = CliRunner().invoke(cli.main, [
+        "generate", "a straight banana",
+        "--output-format", "jsonl",
+        "--api-key", "dummy-key-for-testing",
+        "--threshold", "0.5",
+    ])
+
+    assert result.exit_code == 1
+    config = configs[0]
+    assert config.evaluator_cascade is True
+    assert config.beam_width == 0  # the jsonl stream always runs greedy
+    assert config.default_max_iterations == 2  # not the --iterations default
+    assert config.output_dir == tmp_path / "env-outputs"
+    assert config.success_threshold == 0.5  # explicit flags still win
+    assert config.api_key == "dummy-key-for-testing"
+
+
+def test_generate_uses_learned_budget_in_auto_mode(tmp_path, monkeypatch, make_agent):
+    # Past sessions with short text prompts all succeeded within 2 iterations
+    report = {
+        "original_prompt": "a red car", "input_images": 0, "success": True, "total_iterations": 2,
+        "history": [{"iteration": 1, "evaluation": {"confidence": 0.6}},
+                    {"iteration": 2, "evaluation": {"confidence": 0.9}}],
+    }
+    IterationBudget(budget_path(tmp_path)).rebuild([report] * 10)
+    monkeypatch.setenv("ADAPTIVE_BUDGET", "auto")
+    monkeypatch.setenv("OUTPUT_DIR", str(tmp_path))
+    monkeypatch.delenv("MAX_ITERATIONS", raising=False)
+    # Never good enough, never below the learned confidence floors
+    monkeypatch.setattr(cli, "BananaStraightener", lambda config: make_agent(config, confidences=(0.95,)))
+
+    def run(*args):
+        result = CliRunner().invoke(cli.main, [
+            "generate", "a straight banana", "--output-format", "jsonl",
+            "--api-key", "dummy-key-for-testing", "--threshold", "0.99", *args,
+        ])
+        assert result.exit_code == 0, result.output
+        events = [json.loads(line) for line in result.output.splitlines()]
+        return [e["event"] for e in events].count("evaluated")
+
+    assert run() == 2
+    # An explicit limit still wins over the learned one
+    assert run("--iterations", "3") == 3
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Tests for upload-once file references against a local upload stand-in (no API calls).
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from banana_straightener.filerefs import FileRefStore, LocalUploader
+from banana_straightener.metrics import Metrics
+
+from .test_models import _model
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _store(tmp_path, clock, ttl=3600, **kwargs):
+    uploader = LocalUploader(tmp_path / "uploads", ttl_seconds=ttl, clock=clock)
+    return FileRefStore(uploader, refresh_margin=60, clock=clock, **kwargs), uploader
+
+
+def test_same_content_is_uploaded_once(tmp_path):
+    clock = FakeClock()
+    store, uploader = _store(tmp_path, clock)
+
+    first = store.ref_for(b"image-bytes", "image/png")
+    second = store.ref_for(b"image-bytes", "image/png")
+    store.ref_for(b"other-bytes", "image/png")
+
+    assert second == first
+    assert first.uri.startswith("file://")
+    assert uploader.uploads == 2
+    snapshot = store.metrics.snapshot()
+    assert snapshot["counters"]["file_ref_hits"] == 1
+    assert snapshot["rates"]["file_ref_hit_rate"] == round(1 / 3, 4)
+
+
+def test_expiring_reference_is_uploaded_again(tmp_path):
+    clock = FakeClock()
+    store, uploader = _store(tmp_path, clock, ttl=600)
+    first = store.ref_for(b"image-bytes", "image/png")
+
+    clock.now += 550  # inside the 60s refresh margin
+    second = store.ref_for(b"image-bytes", "image/png")
+
+    assert second.uri != first.uri
+    assert uploader.uploads == 2
+    assert store.metrics.get("file_ref_expired") == 1
+
+
+def test_mapping_persists_per_namespace(tmp_path):
+    clock = FakeClock()
+    path = tmp_path / "file_refs.json"
+    store, _ = _store(tmp_path, clock, namespace="key-aaaa", path=path)
+    ref = store.ref_for(b"image-bytes", "image/png")
+
+    reloaded, uploader = _store(tmp_path, clock, namespace="key-aaaa", path=path)
+    assert reloaded.ref_for(b"image-bytes", "image/png") == ref
+    assert uploader.uploads == 0
+
+    other_key, uploader = _store(tmp_path, clock, namespace="key-bbbb", path=path)
+    other_key.ref_for(b"image-bytes", "image/png")
+    assert uploader.uploads == 1
+
+    clock.now += 7200
+    assert len(FileRefStore(LocalUploader(tmp_path), path=path, clock=clock)) == 0
+
+
+def test_concurrent_lookups_share_one_upload(tmp_path):
+    store, uploader = _store(tmp_path, FakeClock())
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        refs = list(pool.map(lambda _: store.ref_for(b"image-bytes", "image/png"), range(16)))
+
+    assert uploader.uploads == 1
+    assert len({ref.uri for ref in refs}) == 1
+
+
+def test_model_sends_file_references(tmp_path):
+    model = _model(response_text="MATCH: NO\nCONFIDENCE: 0.3\n")
+    model.metrics = Metrics()
+    model.file_store, uploader = _store(tmp_path, FakeClock())
+    image = Image.new("RGB", (32, 32), "blue")
+
+    model.evaluate_image(image, "a blue square")
+    model.evaluate_image(image, "a blue square")
+
+    parts = [request[0].parts[1] for request in model.client.models.requests]
+    assert all(part.inline_data is None for part in parts)
+    assert parts[0].file_data.file_uri == parts[1].file_data.file_uri
+    assert uploader.uploads == 1
+    assert model.metrics.get("file_ref_hits") == 1
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Tests for hedged requests (no API calls required).
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from banana_straightener.hedging import RequestHedger, percentile
+from banana_straightener.metrics import Metrics
+
+
+def _warm(hedger, seconds=0.01, count=5):
+    for _ in range(count):
+        hedger.record(seconds)
+
+
+def test_percentile_nearest_rank():
+    values = [0.1 * i for i in range(1, 11)]
+    assert percentile(values, 50) == pytest.approx(0.5)
+    assert percentile(values, 95) == pytest.approx(1.0)
+    assert percentile([], 95) is None
+
+
+def test_no_hedge_until_enough_samples():
+    hedger = RequestHedger(min_samples=5)
+    assert hedger.delay() is None
+    assert hedger.call(lambda: "ok") == "ok"
+    _warm(hedger, count=4)
+    assert hedger.delay() == pytest.approx(0.01)
+    assert hedger.metrics.get("hedges_fired") == 0
+
+
+def test_slow_request_is_hedged_and_backup_wins():
+    hedger = RequestHedger(min_samples=5)
+    _warm(hedger, seconds=0.05)
+    metrics = Metrics()
+    calls = []
+    release = threading.Event()
+
+    def request():
+        calls.append(None)
+        if len(calls) == 1:
+            release.wait(2)  # the primary stalls
+            return "primary"
+        return "backup"
+
+    start = time.perf_counter()
+    result = hedger.call(request, metrics)
+    elapsed = time.perf_counter() - start
+    release.set()
+
+    assert result == "backup"
+    assert elapsed < 1.0
+    snapshot = metrics.snapshot()
+    assert snapshot["counters"] == {"hedged_calls": 1, "hedges_fired": 1, "hedge_wins": 1}
+    assert snapshot["rates"] == {"hedge_rate": 1.0, "hedge_win_rate": 1.0}
+
+
+def test_failed_request_waits_for_the_other():
+    hedger = RequestHedger(min_samples=1)
+    _warm(hedger, seconds=0.02, count=1)
+    calls = []
+
+    def request():
+        calls.append(None)
+        if len(calls) == 1:
+            time.sleep(0.1)
+            return "primary"
+        raise RuntimeError("backup failed")
+
+    assert hedger.call(request) == "primary"
+    assert hedger.metrics.get("hedge_wins") == 0
+
+    def always_fails():
+        time.sleep(0.05)
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError, match="boom"):
+        hedger.call(always_fails)
+
+
+def test_concurrent_calls_are_not_queued():
+    hedger = RequestHedger(min_samples=5)
+    _warm(hedger, seconds=1.0)
+
+    def request():
+        time.sleep(0.2)
+        return "ok"
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=32) as pool:
+        results = list(pool.map(lambda _: hedger.call(request), range(32)))
+    elapsed = time.perf_counter() - start
+
+    assert results == ["ok"] * 32
+    # All 32 requests ran at once: no shared pool caps the process
+    assert elapsed < 0.6
+    assert hedger.metrics.get("hedges_fired") == 0
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Tests for the persistent SQLite job queue (no API calls required).
+"""
+
+import sqlite3
+import time
+
+import pytest
+
+from banana_straightener import Config
+from banana_straightener.jobqueue import JobQueue, run_job, worker_loop
+
+
+def test_claim_respects_priority_and_lease(tmp_path):
+    queue = JobQueue(tmp_path / "jobs.sqlite")
+    low = queue.submit("low priority")
+    high = queue.submit("high priority", priority=5)
+
+    first = queue.claim("w1")
+    second = queue.claim("w2")
+    assert [first["id"], second["id"]] == [high, low]
+    assert queue.claim("w3") is None
+
+    assert queue.complete(first["id"], "w1", {"success": True})
+    # A worker that lost its lease cannot write results
+    assert not queue.complete(second["id"], "intruder", {"success": True})
+    assert queue.get(first["id"])["status"] == "completed"
+
+
+def test_expired_lease_is_requeued_then_failed(tmp_path):
+    queue = JobQueue(tmp_path / "jobs.sqlite", lease_seconds=0.0, max_attempts=2)
+    job_id = queue.submit("flaky")
+
+    assert queue.claim("w1")["id"] == job_id
+    time.sleep(0.01)
+    reclaimed = queue.claim("w2")
+    assert reclaimed["id"] == job_id and reclaimed["attempts"] == 2
+
+    time.sleep(0.01)
+    assert queue.claim("w3") is None
+    job = queue.get(job_id)
+    assert job["status"] == "failed"
+    assert queue.status()["counts"]["failed"] == 1
+
+
+def test_claim_keeps_busy_error(tmp_path):
+    db_path = tmp_path / "jobs.sqlite"
+    queue = JobQueue(db_path)
+    queue.submit("blocked")
+    connect = queue._connect
+
+    def impatient_connect():
+        conn = connect()
+        conn.execute("PRAGMA busy_timeout = 0")
+        return conn
+
+    queue._connect = impatient_connect
+    blocker = sqlite3.connect(db_path, isolation_level=None)
+    blocker.execute("BEGIN IMMEDIATE")
+    try:
+        with pytest.raises(sqlite3.OperationalError, match="locked"):
+            queue.claim("w1")
+    finally:
+        blocker.execute("ROLLBACK")
+        blocker.close()
+    assert queue.claim("w1")["prompt"] == "blocked"
+
+
+class SlowAgent:
+    """Stands in for an agent; ``then`` runs after ``seconds`` of work."""
+
+    def __init__(self, seconds, then=None):
+        self.seconds = seconds
+        self.then = then
+
+    def straighten(self, **kwargs):
+        time.sleep(self.seconds)
+        if self.then:
+            self.then()
+        return {"success": True, "iterations": 1, "confidence": 0.9}
+
+
+def test_lease_is_renewed_while_job_runs(tmp_path):
+    queue = JobQueue(tmp_path / "jobs.sqlite", lease_seconds=0.2)
+    queue.submit("slow job")
+    job = queue.claim("w1")
+    config = Config(api_key="dummy-key-for-testing", output_dir=tmp_path / "outputs")
+
+    def no_takeover():
+        assert queue.claim("w2") is None
+
+    # The job outlives several lease periods without reporting progress
+    agent = SlowAgent(0.6, then=no_takeover)
+    assert run_job(queue, job, config, "w1", agent_factory=lambda *_: agent)
+
+    assert queue.get(job["id"])["status"] == "completed"
+    assert queue.get(job["id"])["attempts"] == 1
+
+
+def test_lost_lease_discards_result(tmp_path):
+    queue = JobQueue(tmp_path / "jobs.sqlite", lease_seconds=0.2)
+    queue.submit("stolen job")
+    job = queue.claim("w1")
+    config = Config(api_key="dummy-key-for-testing", output_dir=tmp_path / "outputs")
+
+    def steal():
+        queue.fail(job["id"], "w1", "simulated expiry")
+        assert queue.claim("w2")["id"] == job["id"]
+
+    agent = SlowAgent(0.0, then=steal)
+    assert not run_job(queue, job, config, "w1", agent_factory=lambda *_: agent)
+
+    stolen = queue.get(job["id"])
+    assert stolen["status"] == "running"
+    assert stolen["worker_id"] == "w2"
+
+
+def test_worker_loop_drains_queue(tmp_path, make_agent):
+    db_path = tmp_path / "jobs.sqlite"
+    queue = JobQueue(db_path)
+    for i in range(3):
+        queue.submit(f"prompt {i}", max_iterations=3)
+
+    config = Config(api_key="dummy-key-for-testing", output_dir=tmp_path / "outputs")
+    processed = worker_loop(
+        db_path,
+        config,
+        worker_id="test",
+        exit_when_empty=True,
+        agent_factory=lambda cfg, session_id: make_agent(cfg),
+    )
+
+    assert processed == 3
+    stats = queue.status()
+    assert stats["counts"]["completed"] == 3
+    assert stats["depth"] == 0
+    assert stats["finished_in_window"] == 3
+    assert queue.get(1)["result"]["success"] is True
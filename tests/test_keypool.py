@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Tests for API key pooling and 429 benching (no API calls required).
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+from banana_straightener import Config
+from banana_straightener.keypool import KeyPool, PooledClient, key_label
+from banana_straightener.metrics import Metrics
+
+KEYS = ["key-aaaaaaaa1111", "key-bbbbbbbb2222", "key-cccccccc3333"]
+
+
+class RateLimited(Exception):
+    code = 429
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _client_factory(limited_keys, calls):
+    def factory(api_key):
+        def generate_content(**kwargs):
+            calls.append(api_key)
+            if api_key in limited_keys:
+                raise RateLimited("429 RESOURCE_EXHAUSTED")
+            return SimpleNamespace(text=f"ok from {api_key}")
+
+        def generate_content_stream(**kwargs):
+            calls.append(api_key)
+            if api_key in limited_keys:
+                raise RateLimited("429")
+            yield "chunk-1"
+            yield "chunk-2"
+
+        return SimpleNamespace(models=SimpleNamespace(
+            generate_content=generate_content, generate_content_stream=generate_content_stream,
+        ))
+
+    return factory
+
+
+def test_requests_are_spread_across_keys():
+    pool = KeyPool(KEYS)
+    picked = []
+    for _ in range(6):
+        state = pool.acquire()
+        picked.append(state.api_key)
+        pool.release(state)
+
+    assert sorted(picked) == sorted(KEYS * 2)
+
+
+def test_quota_and_error_rate_steer_key_choice():
+    clock = FakeClock()
+    pool = KeyPool(KEYS[:2], rpm_limit=1, clock=clock)
+
+    first = pool.acquire()
+    pool.release(first)
+    second = pool.acquire()
+    pool.release(second)
+    assert second.api_key != first.api_key  # first key has no quota left this minute
+
+    clock.now += 61
+    pool.release(pool.acquire(), RuntimeError("500 internal"))  # errors without benching
+    healthy = pool.acquire()
+    assert healthy.api_key == second.api_key
+    assert pool.usage()[key_label(first.api_key)]["error_rate"] == 0.5
+
+
+def test_rate_limited_key_is_benched_and_call_fails_over():
+    clock = FakeClock()
+    pool = KeyPool(KEYS[:2], bench_seconds=10, clock=clock)
+    calls, metrics = [], Metrics()
+    client = PooledClient(pool, metrics, client_factory=_client_factory({KEYS[0]}, calls))
+
+    responses = [client.models.generate_content(model="m", contents=[]) for _ in range(3)]
+
+    assert all(r.text == f"ok from {KEYS[1]}" for r in responses)
+    assert calls.count(KEYS[0]) == 1  # benched after its first 429
+    usage = pool.usage()[key_label(KEYS[0])]
+    assert usage["rate_limited"] == 1 and usage["benched_seconds"] == 10
+    counters = metrics.snapshot()["counters"]
+    assert counters[f"api_key.{key_label(KEYS[0])}.rate_limited"] == 1
+    assert counters[f"api_key.{key_label(KEYS[1])}.requests"] == 3
+    assert counters["api_key_failovers"] == 1
+
+    # A repeated 429 after the bench expires doubles the bench
+    clock.now += 11
+    limited = pool.keys[0]
+    limited.in_flight += 1
+    assert pool.release(limited, RateLimited("429"))
+    assert pool.usage()[key_label(KEYS[0])]["benched_seconds"] == 20
+
+
+def test_stream_fails_over_before_first_chunk():
+    pool = KeyPool(KEYS[:2])
+    calls = []
+    client = PooledClient(pool, client_factory=_client_factory({KEYS[0]}, calls))
+
+    chunks = []
+    for _ in range(2):
+        chunks.extend(client.models.generate_content_stream(model="m", contents=[]))
+
+    assert chunks == ["chunk-1", "chunk-2"] * 2
+    assert all(s.in_flight == 0 for s in pool.keys)
+
+
+def test_all_keys_benched_raises_when_wait_too_long():
+    pool = KeyPool(KEYS[:2], bench_seconds=300)
+    client = PooledClient(pool, client_factory=_client_factory(set(KEYS[:2]), []))
+
+    with pytest.raises(RuntimeError, match="rate limited"):
+        client.models.generate_content(model="m", contents=[])
+
+
+def test_config_reads_key_list(monkeypatch):
+    monkeypatch.setenv("GEMINI_API_KEYS", f"{KEYS[0]}, {KEYS[1]} {KEYS[0]}")
+    config = Config(api_key=KEYS[2])
+
+    assert config.api_keys == [KEYS[2], KEYS[0], KEYS[1]]
+    assert config.api_key == KEYS[2]
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+GeminiModel request/response handling against a stub client (no API calls).
+"""
+
+from io import BytesIO
+from types import SimpleNamespace
+
+from PIL import Image
+
+from banana_straightener.metrics import Metrics
+from banana_straightener.models import GeminiModel
+from banana_straightener.preprocess import EvaluationEncoder
+
+
+def _png_bytes(color="yellow"):
+    buf = BytesIO()
+    Image.new("RGB", (32, 32), color).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def _chunk(*parts):
+    return SimpleNamespace(candidates=[SimpleNamespace(content=SimpleNamespace(parts=list(parts)))])
+
+
+def _text(text):
+    return SimpleNamespace(inline_data=None, text=text)
+
+
+def _image():
+    return SimpleNamespace(inline_data=SimpleNamespace(data=_png_bytes()), text=None)
+
+
+class StubModels:
+    def __init__(self, chunks=(), response_text="", responses=()):
+        self.chunks = list(chunks)
+        self.response_text = response_text
+        # Texts returned by successive generate_content calls, then response_text
+        self.responses = list(responses)
+        self.requests = []
+        self.configs = []
+
+    def generate_content_stream(self, model, contents, config):
+        self.requests.append(contents)
+        return iter(self.chunks)
+
+    def generate_content(self, model, contents, config):
+        self.requests.append(contents)
+        self.configs.append(config)
+        text = self.responses.pop(0) if self.responses else self.response_text
+        return SimpleNamespace(text=text)
+
+
+def _model(structured_evaluation=False, **stub_kwargs):
+    model = GeminiModel.__new__(GeminiModel)
+    model.model_name = "stub"
+    model.client = SimpleNamespace(models=StubModels(**stub_kwargs))
+    model.metrics = Metrics()
+    model.structured_evaluation = structured_evaluation
+    model.hedger = None
+    model.evaluation_encoder = EvaluationEncoder()
+    model.file_store = None
+    return model
+
+
+def test_generate_and_evaluate_parses_self_critique():
+    model = _model(chunks=[
+        _chunk(_image()),
+        _chunk(_text("MATCH: YES\nCONFIDENCE: 0.9\n")),
+        _chunk(_text("CORRECT_ELEMENTS: banana\nMISSING_ELEMENTS: none\nIMPROVEMENTS: none")),
+    ])
+
+    image, evaluation = model.generate_and_evaluate("a banana", "a straight banana")
+
+    assert image.size == (32, 32)
+    assert evaluation["self_evaluated"] is True
+    assert evaluation["matches_intent"] is True
+    assert evaluation["confidence"] == 0.9
+    assert len(model.client.models.requests) == 1
+    request_text = model.client.models.requests[0][0].parts[0].text
+    assert 'critically evaluate' in request_text and "a straight banana" in request_text
+
+
+def test_generate_and_evaluate_without_critique_text():
+    model = _model(chunks=[_chunk(_image())])
+
+    image, evaluation = model.generate_and_evaluate("a banana", "a straight banana")
+
+    assert image.size == (32, 32)
+    assert evaluation is None
+
+
+def test_parse_comparative_evaluation():
+    response = (
+        "**IMAGE 1:**\n"
+        "MATCH: NO\nCONFIDENCE: 0.4\nCORRECT_ELEMENTS: banana\nMISSING_ELEMENTS: straightness\n"
+        "IMPROVEMENTS: Straighten it\n"
+        "IMAGE 2:\n"
+        "MATCH: YES\nCONFIDENCE: 0.9\nCORRECT_ELEMENTS: all\nMISSING_ELEMENTS: none\nIMPROVEMENTS: none\n"
+        "RANKING: 2, 1\n"
+    )
+    result = GeminiModel._parse_comparative_evaluation(response, "a straight banana", count=3)
+
+    assert result["ranking"] == [1, 0, 2]
+    assert result["best_index"] == 1
+    assert [e["confidence"] for e in result["evaluations"]] == [0.4, 0.9, 0.0]
+    assert result["evaluations"][1]["matches_intent"] is True
+    assert result["evaluations"][2]["rank"] == 3
+
+
+def test_evaluate_images_sends_one_request():
+    response = "IMAGE 1:\nCONFIDENCE: 0.2\nIMAGE 2:\nCONFIDENCE: 0.7\n"
+    model = _model(response_text=response)
+    images = [Image.new("RGB", (16, 16), color) for color in ("red", "blue")]
+
+    result = model.evaluate_images(images, "a blue square")
+
+    assert len(model.client.models.requests) == 1
+    assert result["best_index"] == 1
+
+
+def test_evaluation_payload_uses_encoder():
+    model = _model(response_text="MATCH: NO\nCONFIDENCE: 0.3\n")
+    model.evaluation_encoder = EvaluationEncoder(max_size=64, fmt="webp")
+
+    model.evaluate_image(Image.new("RGB", (512, 256), "blue"), "a blue square")
+
+    part = model.client.models.requests[0][0].parts[1]
+    assert part.inline_data.mime_type == "image/webp"
+    with Image.open(BytesIO(part.inline_data.data)) as sent:
+        assert sent.size == (64, 32)
+    assert model.metrics.get("evaluation_payload_bytes") == len(part.inline_data.data)
+
+
+def test_structured_evaluation_uses_response_schema():
+    model = _model(structured_evaluation=True, response_text=(
+        '{"matches_intent": false, "confidence": 0.4, "correct_elements": ["banana"], '
+        '"missing_elements": ["straightness", "shine"], "improvements": "Straighten the banana"}'
+    ))
+
+    evaluation = model.evaluate_image(Image.new("RGB", (16, 16)), "a straight banana")
+
+    assert evaluation["format"] == "json"
+    assert evaluation["confidence"] == 0.4
+    assert evaluation["missing_elements"] == "straightness, shine"
+    assert evaluation["improvements"] == "Straighten the banana"
+    assert model.client.models.configs[0].response_mime_type == "application/json"
+    assert len(model.client.models.requests) == 1
+    assert model.metrics.get("evaluation_structured") == 1
+
+
+def test_structured_evaluation_falls_back_to_text():
+    model = _model(structured_evaluation=True, responses=[
+        '{"matches_intent": "maybe", "confidence": 7}',
+        "MATCH: YES\nCONFIDENCE: 0.9\nIMPROVEMENTS: none",
+    ])
+
+    evaluation = model.evaluate_image(Image.new("RGB", (16, 16)), "a straight banana")
+
+    assert evaluation["format"] == "text"
+    assert evaluation["confidence"] == 0.9 and evaluation["matches_intent"] is True
+    assert len(model.client.models.requests) == 2
+    snapshot = model.metrics.snapshot()
+    assert snapshot["counters"]["evaluation_structured_parse_failures"] == 1
+    assert snapshot["rates"]["evaluation_structured_fallback_rate"] == 1.0
+    assert "evaluation_parse_failures" not in snapshot["counters"]
+
+
+def test_rejected_schema_is_not_retried():
+    from google.genai import errors
+
+    class SchemaRejectingModels(StubModels):
+        def generate_content(self, model, contents, config):
+            if config.response_schema is not None:
+                self.requests.append(contents)
+                raise errors.ClientError(400, {"error": {"code": 400, "status": "INVALID_ARGUMENT"}})
+            return super().generate_content(model, contents, config)
+
+    model = _model(structured_evaluation=True)
+    model.client.models = SchemaRejectingModels(response_text="MATCH: NO\nCONFIDENCE: 0.4\n")
+
+    for _ in range(2):
+        evaluation = model.evaluate_image(Image.new("RGB", (16, 16)), "a straight banana")
+        assert evaluation["format"] == "text"
+
+    structured = [c for c in model.client.models.configs if c.response_schema is not None]
+    assert structured == [] and len(model.client.models.requests) == 3
+    assert model.metrics.get("evaluation_structured_unsupported") == 1
+
+
+def test_text_parse_failures_are_counted():
+    model = _model(response_text="Looks pretty good to me, maybe 80%?")
+
+    evaluation = model.evaluate_image(Image.new("RGB", (16, 16)), "a straight banana")
+
+    assert evaluation["parse_failed"] is True
+    assert evaluation["confidence"] == 0.0
+    assert model.metrics.snapshot()["rates"]["evaluation_parse_failure_rate"] == 1.0
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Tests for input image loading and preprocessing (no API calls required).
+"""
+
+import io
+import os
+
+import pytest
+from PIL import Image, JpegImagePlugin
+
+from banana_straightener.preprocess import EvaluationEncoder, ImagePreprocessor, resample_filter
+
+
+def _jpeg(path, size=(2000, 1500), color=(200, 30, 30), orientation=None):
+    image = Image.new("RGB", size, color)
+    exif = Image.Exif()
+    if orientation:
+        exif[0x0112] = orientation
+    image.save(path, "JPEG", exif=exif.tobytes())
+    return path
+
+
+def test_large_jpeg_is_draft_decoded_and_resized(tmp_path, monkeypatch):
+    path = _jpeg(tmp_path / "photo.jpg")
+    decoded_sizes = []
+    original_draft = JpegImagePlugin.JpegImageFile.draft
+
+    def record_draft(self, mode, size):
+        result = original_draft(self, mode, size)
+        decoded_sizes.append(self.size)
+        return result
+
+    monkeypatch.setattr(JpegImagePlugin.JpegImageFile, "draft", record_draft)
+
+    image = ImagePreprocessor(max_size=500).load(path)
+
+    assert image.size == (500, 375)
+    assert image.mode == "RGB"
+    # The decoder jumped straight to 1/4 scale instead of decoding all 3 MP
+    assert decoded_sizes == [(500, 375)]
+
+
+def test_exif_orientation_is_applied(tmp_path):
+    path = _jpeg(tmp_path / "rotated.jpg", size=(400, 200), orientation=6)
+
+    image = ImagePreprocessor(max_size=1024).load(path)
+
+    assert image.size == (200, 400)
+
+
+def test_cache_keyed_by_content_and_mtime(tmp_path):
+    path = _jpeg(tmp_path / "ref.jpg", size=(300, 200))
+    copy = tmp_path / "copy.jpg"
+    copy.write_bytes(path.read_bytes())
+    preprocessor = ImagePreprocessor(max_size=100, cache_size=4)
+
+    first = preprocessor.load(path)
+    preprocessor.load(path)
+    preprocessor.load(copy)  # same content under another name
+    assert (preprocessor.misses, preprocessor.hits) == (1, 2)
+
+    first.paste((0, 0, 0), (0, 0, 10, 10))  # callers get copies
+    assert preprocessor.load(path).getpixel((0, 0)) != (0, 0, 0)
+
+    _jpeg(path, size=(300, 200), color=(10, 200, 10))
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    changed = preprocessor.load(path)
+    assert preprocessor.misses == 2
+    assert changed.getpixel((50, 30))[1] > 150
+
+
+def test_load_many_keeps_order(tmp_path):
+    colors = [(250, 0, 0), (0, 250, 0), (0, 0, 250)]
+    paths = [_jpeg(tmp_path / f"{i}.jpg", size=(64, 64), color=c) for i, c in enumerate(colors)]
+
+    images = ImagePreprocessor(workers=3).load_many(paths)
+
+    assert [max(range(3), key=lambda b: im.getpixel((32, 32))[b]) for im in images] == [0, 1, 2]
+
+
+def test_prepare_converts_and_resizes_decoded_images():
+    image = Image.new("RGBA", (800, 400))
+
+    prepared = ImagePreprocessor(max_size=200, resample="bilinear").prepare(image)
+
+    assert prepared.size == (200, 100)
+    assert prepared.mode == "RGB"
+    with pytest.raises(ValueError):
+        resample_filter("sharpest")
+
+
+def test_evaluation_encoder_downscales_once_per_image():
+    encoder = EvaluationEncoder(max_size=128, fmt="jpeg", quality=80)
+    image = Image.new("RGBA", (1024, 512), (10, 200, 30, 255))
+
+    data, mime_type = encoder.encode(image)
+    again, _ = encoder.encode(image)
+
+    assert mime_type == "image/jpeg"
+    assert again is data
+    assert (encoder.hits, encoder.misses) == (1, 1)
+    with Image.open(io.BytesIO(data)) as decoded:
+        assert decoded.size == (128, 64)
+    # A different image object is encoded separately
+    encoder.encode(image.copy())
+    assert encoder.misses == 2
+    with pytest.raises(ValueError):
+        EvaluationEncoder(fmt="gif")
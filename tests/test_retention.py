@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Tests for bounded-memory image retention (no API calls required).
+"""
+
+from PIL import Image
+
+from banana_straightener.retention import ImageRetention, image_nbytes
+
+
+def _image(shade):
+    return Image.new("RGB", (32, 32), (shade, shade, shade))
+
+
+def test_retention_keeps_best_and_latest_in_memory(tmp_path):
+    retention = ImageRetention(tmp_path / "history")
+    refs = [
+        retention.add(1, _image(10), 0.4),
+        retention.add(2, _image(20), 0.8),
+        retention.add(3, _image(30), 0.5),
+        retention.add(4, _image(40), 0.6),
+    ]
+
+    assert [ref.in_memory for ref in refs] == [False, True, False, True]
+    assert retention.best() is refs[1]
+    assert retention.retained_bytes == 2 * image_nbytes(_image(0))
+    # Never more than best + previous latest + the incoming image
+    assert retention.peak_bytes == 3 * image_nbytes(_image(0))
+
+    spilled = refs[0].load()
+    assert spilled.getpixel((0, 0)) == (10, 10, 10)
+    assert refs[2].display_value() == str(tmp_path / "history" / "iteration_03.png")
+
+
+def test_retention_keep_all_and_thumbnails(tmp_path):
+    retention = ImageRetention(tmp_path, keep_all=True, thumbnail_size=8)
+    refs = [retention.add(i, _image(i), 0.1 * i) for i in range(1, 4)]
+
+    assert all(ref.in_memory for ref in refs)
+    assert refs[0].thumbnail.size == (8, 8)
+    assert not list(tmp_path.glob("*.png"))
+
+
+def test_spilled_image_displays_thumbnail(tmp_path):
+    retention = ImageRetention(tmp_path, thumbnail_size=8)
+    refs = [retention.add(i, _image(i), 0.1 * i) for i in range(1, 4)]
+
+    assert not refs[0].in_memory
+    assert refs[0].display_value() is refs[0].thumbnail
+    assert refs[2].display_value().size == _image(3).size
+
+
+def test_straighten_iterative_history_holds_references(make_agent, tmp_path):
+    agent = make_agent(
+        output_dir=tmp_path, confidences=(0.3, 0.5, 0.4, 0.2), default_max_iterations=4
+    )
+    results = list(agent.straighten_iterative("a straight banana"))
+
+    assert len(results) == 4
+    assert all(isinstance(r["current_image"], Image.Image) for r in results)
+    refs = [r["image_ref"] for r in results]
+    # Iteration 2 is the best so far, iteration 4 the latest
+    assert [ref.in_memory for ref in refs] == [False, True, False, True]
+    assert (agent.session_dir / "history" / "iteration_01.png").exists()
+    assert results[-1]["memory"]["peak_bytes"] == 3 * 64 * 64 * 3
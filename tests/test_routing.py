@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Tests for draft/main generator routing (no API calls required).
+"""
+
+import json
+
+import pytest
+
+from banana_straightener.routing import GeneratorRouter, model_usage
+
+from .conftest import FakeModel
+
+
+def _entry(tier, confidence, rejected=False, seconds=1.0):
+    return {
+        "generator_model": f"{tier}-model",
+        "generator_tier": tier,
+        "rejected": rejected,
+        "evaluation": {"confidence": confidence},
+        "timings": {"generation_seconds": seconds},
+    }
+
+
+def test_router_switches_on_confidence_or_draft_limit():
+    router = GeneratorRouter(switch_confidence=0.6, max_draft_iterations=3)
+
+    assert router.use_draft([])
+    assert router.use_draft([_entry("draft", 0.4)])
+    # Rejected images do not count towards the switch
+    assert router.use_draft([_entry("draft", 0.4), _entry("draft", 0.0, rejected=True)])
+    assert not router.use_draft([_entry("draft", 0.65)])
+    assert not router.use_draft([_entry("draft", 0.1)] * 3)
+    # Once on the main generator the session stays there
+    assert not router.use_draft([_entry("draft", 0.65), _entry("main", 0.3)])
+
+
+def test_model_usage_attributes_confidence_gain():
+    history = [_entry("draft", 0.3), _entry("draft", 0.5, seconds=2.0), _entry("main", 0.9, seconds=4.0)]
+
+    usage = model_usage(history, success=True)
+
+    assert usage["draft-model"]["iterations"] == 2
+    assert usage["draft-model"]["mean_generation_seconds"] == 1.5
+    assert usage["draft-model"]["confidence_gain"] == pytest.approx(0.5)
+    assert usage["main-model"]["confidence_gain"] == pytest.approx(0.4)
+    assert usage["main-model"]["produced_final"] is True
+    assert usage["draft-model"]["produced_final"] is False
+
+
+def test_agent_routes_drafts_then_main_model(make_agent):
+    agent = make_agent(
+        generator_routing=True, routing_max_draft_iterations=0, confidences=(0.3, 0.7, 0.9)
+    )
+    agent.draft_generator = FakeModel()
+
+    result = agent.straighten("a banana", max_iterations=4)
+
+    assert result["success"] is True
+    assert [entry["generator_tier"] for entry in result["history"]] == ["draft", "draft", "main"]
+    assert agent.draft_generator.generate_calls == 2
+    assert agent.generator.generate_calls == 1
+    report = json.loads((agent.session_dir / "session_report.json").read_text())
+    usage = report["generator_models"]
+    assert usage[agent.config.draft_generator_model]["iterations"] == 2
+    assert usage[agent.config.generator_model]["produced_final"] is True
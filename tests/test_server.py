@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Tests for the headless HTTP job API (no API calls required).
+"""
+
+import http.client
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+from PIL import Image
+
+from banana_straightener import Config
+from banana_straightener.server import Job, JobManager, QueueFullError, create_server
+from banana_straightener.utils import image_to_base64
+
+
+@pytest.fixture
+def api(make_agent, tmp_path):
+    config = Config(api_key="dummy-key-for-testing", output_dir=tmp_path / "outputs")
+    manager = JobManager(
+        config, workers=1, max_queue=4, agent_factory=lambda cfg, session_id: make_agent(cfg)
+    )
+    server = create_server(manager, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+    manager.shutdown()
+
+
+def _request(url, payload=None):
+    data = json.dumps(payload).encode() if payload is not None else None
+    req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=10) as resp:
+        return resp.status, resp.read()
+
+
+def test_submit_stream_and_fetch_image(api):
+    image = image_to_base64(Image.new("RGB", (32, 32), "red"))
+    status, body = _request(f"{api}/jobs", {"prompt": "a yellow square", "images": [image]})
+    assert status == 202
+    job_id = json.loads(body)["job_id"]
+
+    with urllib.request.urlopen(f"{api}/jobs/{job_id}/events", timeout=10) as resp:
+        assert resp.headers["Content-Type"] == "text/event-stream"
+        stream = resp.read().decode()
+    events = [line for line in stream.splitlines() if line.startswith("event:")]
+    assert events == ["event: iteration"] * 3 + ["event: done"]
+
+    _, body = _request(f"{api}/jobs/{job_id}")
+    job = json.loads(body)
+    assert job["status"] == "completed"
+    assert job["success"] is True
+    assert job["iterations"] == 3
+
+    status, png = _request(f"{api}/jobs/{job_id}/image")
+    assert status == 200 and png.startswith(b"\x89PNG")
+
+
+def test_invalid_and_unknown_requests(api):
+    with pytest.raises(urllib.error.HTTPError) as exc:
+        _request(f"{api}/jobs", {"prompt": "   "})
+    assert exc.value.code == 400
+    with pytest.raises(urllib.error.HTTPError) as exc:
+        _request(f"{api}/jobs/missing")
+    assert exc.value.code == 404
+
+    host, port = api.rsplit("/", 1)[1].split(":")
+    for length in ("-5", "abc"):
+        conn = http.client.HTTPConnection(host, int(port), timeout=10)
+        conn.putrequest("POST", "/jobs")
+        conn.putheader("Content-Length", length)
+        conn.endheaders()
+        response = conn.getresponse()
+        assert response.status == 400
+        assert json.loads(response.read()) == {"error": "Invalid Content-Length"}
+        conn.close()
+
+
+def test_concurrent_jobs_get_distinct_sessions(make_agent, tmp_path):
+    config = Config(api_key="dummy-key-for-testing", output_dir=tmp_path)
+    session_dirs = []
+
+    def factory(cfg, session_id):
+        agent = make_agent(cfg, session_id=session_id)
+        session_dirs.append(agent.session_dir)
+        return agent
+
+    manager = JobManager(config, workers=2, max_queue=4, agent_factory=factory)
+    jobs = [manager.submit(Job(f"job {i}")) for i in range(2)]
+    manager.shutdown()
+
+    assert all(job.status == "completed" for job in jobs)
+    assert sorted(path.name.rsplit("_", 1)[1] for path in session_dirs) == sorted(job.id for job in jobs)
+    assert len(set(session_dirs)) == 2
+
+
+def test_queue_full_raises(tmp_path):
+    release = threading.Event()
+
+    class BlockingAgent:
+        def straighten_iterative(self, **kwargs):
+            release.wait(5)
+            return iter(())
+
+    config = Config(api_key="dummy-key-for-testing", output_dir=tmp_path)
+    manager = JobManager(config, workers=1, max_queue=1, agent_factory=lambda cfg, session_id: BlockingAgent())
+    try:
+        first = manager.submit(Job("one"))
+        # Wait until the worker has picked up the first job so the queue is empty
+        for _ in range(100):
+            if first.status == "running":
+                break
+            threading.Event().wait(0.01)
+        manager.submit(Job("two"))
+        third = Job("three")
+        with pytest.raises(QueueFullError):
+            manager.submit(third)
+        # A rejected job is not left registered
+        assert manager.get(third.id) is None
+    finally:
+        release.set()
+        manager.shutdown()
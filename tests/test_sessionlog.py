@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Tests for the append-only session log (no API calls required).
+"""
+
+import json
+
+from banana_straightener.sessionlog import SESSION_LOG_FILENAME, SessionLog, build_report
+
+
+def test_session_log_drives_report(make_agent, tmp_path):
+    agent = make_agent(output_dir=tmp_path)
+    result = agent.straighten("a straight banana")
+
+    log_path = tmp_path / result["session_id"] / SESSION_LOG_FILENAME
+    records = SessionLog.read(log_path)
+    assert [r["type"] for r in records] == ["start", "iteration", "iteration", "iteration", "end"]
+
+    report = json.loads((tmp_path / result["session_id"] / "session_report.json").read_text())
+    assert report["success"] is True
+    assert report["original_prompt"] == "a straight banana"
+    assert [h["iteration"] for h in report["history"]] == [1, 2, 3]
+
+
+def test_build_report_from_interrupted_log(tmp_path):
+    log = SessionLog(tmp_path / SESSION_LOG_FILENAME)
+    log.append("start", {"session_id": "old", "original_prompt": "first run"})
+    log.append("end", {"success": True, "total_iterations": 0})
+    log.append("start", {"session_id": "s1", "original_prompt": "a cat"})
+    log.append("iteration", {"iteration": 1, "evaluation": {"confidence": 0.4}})
+    log.append("iteration", {"iteration": 2, "evaluation": {"confidence": 0.7}})
+    log.close()
+    with open(log.path, "a") as f:
+        f.write('{"type": "iteration", "da')  # crash mid-write
+
+    report = build_report(SessionLog.read(log.path))
+    assert report["session_id"] == "s1"
+    assert report["incomplete"] is True
+    assert report["total_iterations"] == 2
+    assert report["final_confidence"] == 0.7
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Import-time regression tests: the package and `straighten --help` must stay
+cheap and free of side effects (no API calls required).
+"""
+
+import re
+import subprocess
+import sys
+
+from banana_straightener import Config
+
+# Cumulative import time budget for banana_straightener.cli, in microseconds.
+# Importing google.genai alone takes well over half a second.
+CLI_IMPORT_BUDGET_US = 400_000
+
+HEAVY_MODULES = ("google.genai", "gradio", "rich.table", "rich.progress")
+
+
+def _run(code, *args):
+    return subprocess.run(
+        [sys.executable, *args, "-c", code],
+        capture_output=True, text=True, check=True,
+    )
+
+
+def test_help_does_not_import_heavy_modules():
+    code = (
+        "import sys\n"
+        "from click.testing import CliRunner\n"
+        "from banana_straightener.cli import main\n"
+        "result = CliRunner().invoke(main, ['--help'])\n"
+        "assert result.exit_code == 0, result.output\n"
+        f"print([m for m in {HEAVY_MODULES!r} if m in sys.modules])\n"
+    )
+    assert _run(code).stdout.strip() == "[]"
+
+
+def test_cli_import_time_budget():
+    stderr = _run("import banana_straightener.cli", "-X", "importtime").stderr
+    match = re.search(r"\|\s*(\d+)\s*\|\s*banana_straightener\.cli$", stderr, re.M)
+    assert match, stderr[-2000:]
+    assert int(match.group(1)) < CLI_IMPORT_BUDGET_US
+
+
+def test_config_does_not_create_output_dir(tmp_path):
+    output_dir = tmp_path / "outputs"
+    config = Config(api_key="dummy-key-for-testing", output_dir=output_dir)
+
+    assert config.output_dir == output_dir
+    assert not output_dir.exists()
@@ -4,13 +4,18 @@ Unit tests for utility functions and parsing that do not require API calls.
 """
 
 from pathlib import Path
-from PIL import Image
+from PIL import Image, ImageDraw
 import tempfile
 
 from banana_straightener.utils import (
     sanitize_filename,
     resize_image_if_needed,
     create_session_zip,
+    enhance_prompt_with_feedback,
+    select_unresolved_feedback,
+    perceptual_hash,
+    hash_distance,
+    precheck_image,
 )
 from banana_straightener.models import GeminiModel
 
@@ -60,3 +65,68 @@ def test_parse_evaluation_static():
     assert parsed["matches_intent"] is True
     assert 0.0 <= parsed["confidence"] <= 1.0
     assert "improvements" in parsed
+
+
+def test_select_unresolved_feedback_dedupes_and_drops_addressed():
+    history = [
+        {"evaluation": {"improvements": "Make the banana yellow.", "correct_elements": ""}},
+        {"evaluation": {"improvements": "Add a shadow.", "correct_elements": "a white background"}},
+    ]
+    feedback = (
+        "- A white background\n"
+        "- Add a soft shadow under it\n"
+        "- Make the banana yellow.\n"
+        "- make the banana yellow"
+    )
+    items = select_unresolved_feedback(feedback, history)
+    # Duplicate collapsed, addressed item dropped, long-standing item first
+    assert items == ["Make the banana yellow.", "Add a soft shadow under it"]
+
+
+def test_enhance_prompt_respects_char_budget():
+    feedback = "\n".join(f"- Fix issue number {i} with the peel texture" for i in range(20))
+    history = [{"prompt_used": "a banana", "evaluation": {"improvements": "Colour."}}]
+
+    unbounded = enhance_prompt_with_feedback("a straight banana", feedback, 2, history)
+    bounded = enhance_prompt_with_feedback("a straight banana", feedback, 2, history, max_chars=200)
+
+    assert len(unbounded) > 400
+    assert len(bounded) <= 200
+    assert bounded.startswith("Original request: a straight banana")
+    assert "Fix issue number 0" in bounded
+
+
+def test_prompt_size_recorded_in_history(make_agent):
+    agent = make_agent(prompt_max_chars=150)
+    result = agent.straighten("a straight banana")
+
+    sizes = [entry["prompt_size"] for entry in result["history"]]
+    assert sizes[0] == {"chars": len("a straight banana"), "tokens": 5}
+    assert all(size["chars"] <= 150 for size in sizes)
+
+
+def test_perceptual_hash_tolerates_small_edits():
+    image = Image.new("RGB", (200, 100), "white")
+    ImageDraw.Draw(image).ellipse((20, 20, 120, 80), fill="yellow")
+    touched = image.copy()
+    ImageDraw.Draw(touched).point((5, 5), fill="black")
+    other = Image.new("RGB", (200, 100), "white")
+    ImageDraw.Draw(other).rectangle((100, 0, 200, 100), fill="blue")
+
+    assert len(perceptual_hash(image)) == 16
+    assert hash_distance(perceptual_hash(image), perceptual_hash(image.resize((50, 25)))) <= 4
+    assert hash_distance(perceptual_hash(image), perceptual_hash(touched)) <= 4
+    assert hash_distance(perceptual_hash(image), perceptual_hash(other)) > 16
+
+
+def test_precheck_image_rejections():
+    image = Image.new("RGB", (128, 128), "white")
+    ImageDraw.Draw(image).ellipse((20, 20, 100, 100), fill="yellow", outline="black")
+
+    assert precheck_image(image)["passed"] is True
+    assert precheck_image(Image.new("RGB", (128, 128), "white"))["reason"] == "uniform"
+    assert precheck_image(image.resize((16, 16)))["reason"] == "too_small"
+    assert precheck_image(image, base_image=image.copy())["passed"] is True
+    unchanged = precheck_image(image, base_image=image.copy(), min_base_diff=1.0)
+    assert unchanged["reason"] == "unchanged"
+    assert unchanged["stats"]["base_diff"] == 0.0